@@ -1,5 +1,11 @@
+import functools
+import http.server
+import threading
+
 import pytest
 from .helpers import tdenv, touch
+from tradedangerous import TradeEnv, cache
+from tradedangerous.bench import GalaxySpec, SyntheticGalaxy
 from tradedangerous.tradedb import TradeDB
 
 
@@ -20,6 +26,55 @@ def touchdb():
     return touch(tdenv.dataDir, 'TradeDangerous.db')
 
 
+@pytest.fixture(scope="module")
+def galaxy_env(tmp_path_factory):
+    """ A TradeEnv for a small synthetic galaxy's database. """
+    dataDir = tmp_path_factory.mktemp("galaxy")
+    env = TradeEnv(quiet=2, dataDir=str(dataDir), csvDir=str(dataDir))
+    SyntheticGalaxy(GalaxySpec(30, 60, 12, 0.5, 5)).writeTradeDangerous(dataDir, env.templateDir)
+    cache.buildCache(TradeDB(env, load=False), env)
+    return env
+
+
+@pytest.fixture(scope="module")
+def galaxy():
+    """ A small synthetic galaxy for the importers to load. """
+    return SyntheticGalaxy(GalaxySpec(systems=40, stations=50, items=15, density=0.6, seed=7))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(scope="session")
+def serve_directory():
+    """
+    Starts a local HTTP stand-in for a download site, serving the files
+    in a directory, for each call, and returns its url.
+    """
+    servers = []
+    
+    def serve(root):
+        httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(root)))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    
+    yield serve
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.fixture
+def server(tmp_path, serve_directory):
+    """ An empty directory and the url serving it. """
+    root = tmp_path / "server"
+    root.mkdir()
+    return root, serve_directory(root)
+
+
 def pytest_addoption(parser):
     parser.addoption(
         "--runslow", action="store_true", default=False, help="run slow tests"
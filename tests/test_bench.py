@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from tradedangerous import TradeEnv
+from tradedangerous.bench import (
+    GalaxySpec, SyntheticGalaxy, defaultSpec, readResults, runBenchmarks,
+    stageNames, writeResults,
+)
+
+TINY = GalaxySpec(systems = 60, stations = 120, items = 20, density = 0.5, seed = 3)
+
+
+def quiet_env():
+    return TradeEnv(quiet = 2)
+
+
+class TestSyntheticGalaxy:
+    def test_reproducible(self):
+        first, second = SyntheticGalaxy(TINY), SyntheticGalaxy(TINY)
+        assert first.systems == second.systems
+        assert first.markets == second.markets
+        assert SyntheticGalaxy(TINY._replace(seed = 4)).systems != first.systems
+    
+    def test_sizes(self):
+        galaxy = SyntheticGalaxy(TINY)
+        assert len(galaxy.systems) == TINY.systems
+        assert len(galaxy.stations) == TINY.stations
+        assert len(galaxy.items) == TINY.items
+        assert all(len(entries) == 10 for entries in galaxy.markets.values())
+        assert len({(stn[2], stn[1]) for stn in galaxy.stations}) == TINY.stations
+
+
+class TestRunBenchmarks:
+    def test_all_stages(self, tmp_path):
+        results = runBenchmarks(TINY, tmp_path, quiet_env())
+        assert list(results['timings']) == list(stageNames)
+        assert results['spec'] == TINY.asDict()
+        assert results['counts']['stationItems'] == TINY.stations * 10
+        
+        for stage in ("td", "spansh", "eddblink"):
+            with sqlite3.connect(str(tmp_path / stage / "TradeDangerous.db")) as db:
+                assert db.execute("SELECT COUNT(*) FROM Item").fetchone()[0] == TINY.items
+                assert db.execute("SELECT COUNT(*) FROM StationItem").fetchone()[0] > 0
+        with sqlite3.connect(str(tmp_path / "eddblink" / "TradeDangerous.db")) as db:
+            # The listings are newer, so they replace every price.
+            assert db.execute(
+                "SELECT COUNT(*) FROM StationItem WHERE modified < '2024-06-02'"
+            ).fetchone()[0] == 0
+    
+    def test_skip_and_save(self, tmp_path):
+        results = runBenchmarks(
+            TINY, tmp_path / "work", quiet_env(),
+            skip = ('getRoute', 'lookupPlace', 'spansh', 'eddblink'),
+        )
+        assert list(results['timings']) == ['buildCache', 'TradeDB.load', 'TradeCalc.load', 'getBestHops']
+        path = tmp_path / "results.json"
+        writeResults(results, path)
+        assert readResults(path) == json.loads(json.dumps(results))
+
+
+@pytest.mark.slow
+def test_default_galaxy(tmp_path):
+    """
+    Benchmarks the default galaxy; set TD_BENCH_OUTPUT to keep the
+    results, e.g. to compare with "trade.py bench --compare".
+    """
+    results = runBenchmarks(defaultSpec, tmp_path, quiet_env())
+    writeResults(results, os.environ.get('TD_BENCH_OUTPUT') or tmp_path / "bench.json")
+    assert list(results['timings']) == list(stageNames)
@@ -8,6 +8,9 @@ class TestBootstrapCommands(unittest.TestCase):
         self.assertIn('buildcache', commands.commandIndex)
         self.assertIn('buy', commands.commandIndex)
     
+    def test_import_bench_cmd(self):
+        from tradedangerous.commands import bench_cmd
+    
     def test_import_buildcache_cmd(self):
         from tradedangerous.commands import buildcache_cmd
     
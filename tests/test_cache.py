@@ -1,7 +1,13 @@
-import pytest
+import os
+import sqlite3
 from collections import namedtuple
 
-from tradedangerous import cache
+import pytest
+
+from tradedangerous import TradeEnv, cache
+from tradedangerous.bench import GalaxySpec, SyntheticGalaxy
+from tradedangerous.snapshot import PlaceSnapshot
+from tradedangerous.tradedb import TradeDB
 
 FakeFile = namedtuple('FakeFile', ['name'])
 
@@ -37,3 +43,150 @@ class TestCache:
                 10,
                 'demand',
                 reading)
+
+
+def make_galaxy_env(dataDir):
+    env = TradeEnv(quiet=2, dataDir=str(dataDir), csvDir=str(dataDir))
+    SyntheticGalaxy(GalaxySpec(30, 60, 12, 0.5, 5)).writeTradeDangerous(dataDir, env.templateDir)
+    return env
+
+
+def edit(path, change):
+    """ Rewrites path with change(text), and makes it newer than the cache. """
+    path.write_text(change(path.read_text()))
+    later = path.stat().st_mtime + 10
+    os.utime(path, (later, later))
+
+
+def table_rows(dbPath):
+    with sqlite3.connect(str(dbPath)) as db:
+        tables = [row[0] for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        return {
+            table: sorted(db.execute("SELECT * FROM {}".format(table)).fetchall(), key=repr)
+            for table in tables
+        }
+
+
+class TestIncrementalRebuild:
+    def test_only_changed_tables(self, tmp_path, monkeypatch):
+        env = make_galaxy_env(tmp_path)
+        TradeDB(env).close()
+        imported = []
+        processImportFile = cache.processImportFile
+        
+        def recording(tdenv, db, importPath, tableName, **kwargs):
+            imported.append(tableName)
+            return processImportFile(tdenv, db, importPath, tableName, **kwargs)
+        
+        monkeypatch.setattr(cache, "processImportFile", recording)
+        
+        edit(tmp_path / "Category.csv", lambda text: text)
+        TradeDB(env).close()
+        assert imported == []
+        
+        station = (tmp_path / "Station.csv").read_text().splitlines()[1].split(",")
+        system = next(
+            line.split(",")[1] for line in (tmp_path / "System.csv").read_text().splitlines()
+            if line.split(",")[0] == station[2]
+        )
+        edit(tmp_path / "RareItem.csv", lambda text: text + "{},{},'Chemicals','Test Rare',1234,10,'N','N'\n".format(
+            system, station[1],
+        ))
+        tdb = TradeDB(env)
+        assert imported == ["RareItem"]
+        assert [rare.dbname for rare in tdb.rareItemByID.values()] == ["Test Rare"]
+        tdb.close()
+    
+    def test_matches_full_rebuild(self, tmp_path):
+        env = make_galaxy_env(tmp_path)
+        TradeDB(env).close()
+        edit(tmp_path / "Station.csv", lambda text: text.replace(",'L','Y',", ",'M','Y',", 5))
+        TradeDB(env).close()
+        updated = table_rows(tmp_path / "TradeDangerous.db")
+        
+        (tmp_path / "TradeDangerous.db").unlink()
+        TradeDB(env).close()
+        rebuilt = table_rows(tmp_path / "TradeDangerous.db")
+        assert updated == rebuilt
+        assert sum(row[5] == 'M' for row in updated["Station"]) > 0
+
+
+def market_aggregate(db):
+    return sorted(db.execute("""
+        SELECT station_id, COUNT(*), ROUND(AVG(JULIANDAY(modified)), 6)
+          FROM StationItem GROUP BY 1
+    """).fetchall())
+
+
+def market_rows(db):
+    return sorted(
+        (ID, count, round(modified, 6))
+        for ID, count, modified in PlaceSnapshot.marketRows(db)
+    )
+
+
+class TestMarketSummary:
+    def test_follows_price_changes(self, tmp_path):
+        env = make_galaxy_env(tmp_path)
+        TradeDB(env).close()
+        with sqlite3.connect(str(tmp_path / "TradeDangerous.db")) as db:
+            assert db.execute("SELECT COUNT(*) FROM StationMarketDirty").fetchone() == (0,)
+            assert market_rows(db) == market_aggregate(db)
+            
+            first, second, third = [row[0] for row in market_aggregate(db)][:3]
+            db.execute("DELETE FROM StationItem WHERE station_id = ?", (first,))
+            db.execute("UPDATE StationItem SET modified = '2030-01-01 00:00:00' WHERE station_id = ?", (second,))
+            db.execute("""
+                INSERT OR REPLACE INTO StationItem
+                SELECT ?, item_id, 1, 1, 1, 1, 1, 1, '2031-01-01 00:00:00', 0
+                  FROM Item
+            """, (third,))
+            assert db.execute("SELECT COUNT(*) FROM StationMarketDirty").fetchone() == (3,)
+            assert market_rows(db) == market_aggregate(db)
+            
+            cache.updateMarketSummary(db)
+            assert db.execute("SELECT COUNT(*) FROM StationMarketDirty").fetchone() == (0,)
+            assert market_rows(db) == market_aggregate(db)
+            assert db.execute(
+                "SELECT item_count, min_modified, max_modified FROM StationMarketSummary WHERE station_id = ?", (third,)
+            ).fetchone() == (12, 1924992000, 1924992000)
+    
+    def test_added_to_older_databases(self, tmp_path):
+        env = make_galaxy_env(tmp_path)
+        TradeDB(env).close()
+        with sqlite3.connect(str(tmp_path / "TradeDangerous.db")) as db:
+            expected = market_aggregate(db)
+            for trigger in ("insert", "update", "delete"):
+                db.execute("DROP TRIGGER StationItem_summary_{}".format(trigger))
+            for table in ("StationMarketSummary", "StationMarketDirty"):
+                db.execute("DROP TABLE {}".format(table))
+            assert market_rows(db) == expected
+            
+            cache.updateMarketSummary(db)
+            assert db.execute("SELECT COUNT(*) FROM StationMarketSummary").fetchone() == (len(expected),)
+            assert market_rows(db) == expected
+
+
+class TestItemOrder:
+    def test_numbers_items_by_name(self, tmp_path):
+        env = make_galaxy_env(tmp_path)
+        TradeDB(env).close()
+        with sqlite3.connect(str(tmp_path / "TradeDangerous.db")) as db:
+            assert cache.updateItemOrder(db) == 0
+            category = db.execute("SELECT category_id FROM Item LIMIT 1").fetchone()[0]
+            db.executemany(
+                "INSERT INTO Item (item_id, name, category_id, fdev_id) VALUES (?, ?, ?, ?)",
+                [(900001, 'aaa First', category, 900001), (900002, 'Zzz Last', category, 900002)],
+            )
+            assert cache.updateItemOrder(db) > 2
+            assert cache.updateItemOrder(db) == 0
+            
+            rows = db.execute("SELECT category_id, name, ui_order FROM Item ORDER BY category_id, ui_order").fetchall()
+            for categoryID in {row[0] for row in rows}:
+                names = [name for catID, name, _ in rows if catID == categoryID]
+                orders = [order for catID, _, order in rows if catID == categoryID]
+                assert names == sorted(names, key=str.lower)
+                assert orders == list(range(1, len(names) + 1))
+            assert (category, 'aaa First', 1) in rows
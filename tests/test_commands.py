@@ -1,8 +1,14 @@
 #! /usr/bin/env python
 # pytest
 
+from pathlib import Path
+import io
+import subprocess
+import sys
+
 import pytest
 from tradedangerous import commands
+from tradedangerous.misc.importtime import defaultTop, formatReport, parseImportTimes, reportTop
 from tradedangerous.commands.exceptions import UsageError, CommandLineError
 
 @pytest.fixture
@@ -40,3 +46,75 @@ class TestCommands:
     
     def test_local_validsys_dashv(self, cmd):
         cmd.parse([prog, 'local', 'ibootis', '-v'])
+    
+    def test_abbreviation(self, cmd):
+        assert cmd.parse([prog, 'loc', 'ibootis'])._cmd.name == 'local'
+    
+    def test_ambiguous_cmd(self, cmd):
+        with pytest.raises(CommandLineError, match = "rares, run"):
+            cmd.parse([prog, 'r'])
+    
+    def test_index_is_complete(self):
+        found = {
+            path.stem[:-len('_cmd')]
+            for path in Path(commands.__file__).parent.glob('*_cmd.py')
+        }
+        assert set(commands.commandIndex) == found
+    
+    def test_imports_only_selected_command(self):
+        script = (
+            "import sys\n"
+            "from tradedangerous import commands\n"
+            "commands.CommandIndex().parse(['trade.py', 'loc', 'ibootis'])\n"
+            "print(sorted(m for m in sys.modules if m.endswith('_cmd')))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            check = True, stdout = subprocess.PIPE, text = True,
+        ).stdout
+        assert output.strip() == "['tradedangerous.commands.local_cmd']"
+    
+    def test_numpy_imported_when_needed(self):
+        script = (
+            "import sys\n"
+            "from tradedangerous import tradecalc, tradedb\n"
+            "print('numpy' in sys.modules, tradedb.hasNumpy(), tradecalc.hasNumpy(), 'numpy' in sys.modules)\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            check = True, stdout = subprocess.PIPE, text = True,
+        ).stdout
+        before, inTradeDB, inTradeCalc, after = output.split()
+        assert before == 'False'
+        assert inTradeDB == inTradeCalc == after
+
+
+class TestImportTime:
+    
+    sample = [
+        "import time: self [us] | cumulative | imported package\n",
+        "import time:       120 |        120 |   _io\n",
+        "import time:       300 |        420 | encodings\n",
+        "some other stderr output\n",
+        "import time:      1500 |       1500 |     tradedangerous.tradeenv\n",
+        "import time:       200 |       1700 |   tradedangerous\n",
+    ]
+    
+    def test_parse(self):
+        others = io.StringIO()
+        imports = parseImportTimes(self.sample, others)
+        assert [(imp.module, imp.depth) for imp in imports] == [
+            ('_io', 1), ('encodings', 0), ('tradedangerous.tradeenv', 2), ('tradedangerous', 1),
+        ]
+        assert others.getvalue() == "some other stderr output\n"
+    
+    def test_report(self):
+        report = formatReport(parseImportTimes(self.sample), top = 2).splitlines()
+        assert report[0] == "Imported 4 modules in 0.4ms"
+        assert [line.split()[-1] for line in report[2:]] == ['tradedangerous', 'tradedangerous.tradeenv']
+    
+    def test_top(self):
+        assert reportTop("1") == defaultTop
+        assert reportTop("40") == 40
+        assert reportTop("all") is None
+        assert reportTop("yes") == defaultTop
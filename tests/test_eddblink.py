@@ -0,0 +1,171 @@
+import datetime
+import os
+import shutil
+import sqlite3
+
+import pytest
+import requests
+
+from tradedangerous import TradeEnv, cache, transfers
+from tradedangerous.bench import listingsTime
+from tradedangerous.plugins import PluginException, eddblink_plug
+from tradedangerous.plugins.eddblink_plug import DecodingError, ImportPlugin
+from tradedangerous.tradedb import TradeDB
+
+def make_env(dataDir, **kwargs):
+    kwargs.setdefault("tmpDir", str(dataDir))
+    return TradeEnv(quiet = 2, dataDir = str(dataDir), csvDir = str(dataDir), **kwargs)
+
+
+def import_listings(dataDir, name):
+    """ Imports dataDir/name as listings and returns the StationItem rows and indexes. """
+    env = make_env(dataDir)
+    plugin = ImportPlugin(TradeDB(env, load = False), env)
+    plugin.dataPath = str(dataDir)
+    plugin.importListings(name)
+    with sqlite3.connect(str(dataDir / "TradeDangerous.db")) as db:
+        rows = sorted(db.execute("SELECT * FROM StationItem"))
+        indexes = sorted(db.execute("SELECT name, sql FROM sqlite_master WHERE tbl_name = 'StationItem'"))
+    return rows, indexes
+
+
+def make_data(galaxy, dataDir, prices = True):
+    """ Builds a database for the galaxy, with its prices or none, and writes its listings.csv. """
+    env = make_env(dataDir)
+    galaxy.writeTradeDangerous(dataDir, env.templateDir)
+    if not prices:
+        (dataDir / "TradeDangerous.prices").unlink()
+    cache.buildCache(TradeDB(env, load = False), env)
+    galaxy.writeListings(dataDir / "listings.csv")
+    return dataDir
+
+
+def test_listings_replace_older_markets(galaxy, tmp_path, monkeypatch):
+    dataDir = make_data(galaxy, tmp_path)
+    _, before = import_listings(dataDir, "missing.csv")
+    # Small chunks, so rows and stations straddle them.
+    monkeypatch.setattr(eddblink_plug, "LISTINGS_CHUNK_SIZE", 100)
+    rows, indexes = import_listings(dataDir, "listings.csv")
+    assert len(rows) == sum(map(len, galaxy.markets.values()))
+    assert {row[8] for row in rows} == {str(listingsTime)}
+    assert indexes == before
+    
+    # Live listings that are a day newer for one station only replace its market.
+    lines = (dataDir / "listings.csv").read_text().splitlines(keepends = True)
+    station = lines[1].split(",")[1]
+    newer = str(int((listingsTime + datetime.timedelta(days = 1)).replace(tzinfo = datetime.timezone.utc).timestamp()))
+    live = [lines[0]] + [
+        line.rsplit(",", 1)[0] + "," + newer + "\r\n"
+        for line in lines[1:] if line.split(",")[1] == station
+    ]
+    (dataDir / "listings-live.csv").write_text("".join(live))
+    after, _ = import_listings(dataDir, "listings-live.csv")
+    changed = [row for row in after if row not in rows]
+    assert len(changed) == len(live) - 1
+    assert all(row[0] == int(station) and row[9] == 1 for row in changed)
+    
+    # The same listings from the main file mark that market as no longer live.
+    (dataDir / "listings.csv").write_text("".join(live).replace("\r\n", "\n"))
+    again, _ = import_listings(dataDir, "listings.csv")
+    assert again == sorted(row[:9] + (0,) for row in after)
+
+
+def test_listings_without_rows(galaxy, tmp_path):
+    dataDir = make_data(galaxy, tmp_path)
+    before = import_listings(dataDir, "missing.csv")
+    header = (dataDir / "listings.csv").read_text().splitlines(keepends = True)[0]
+    (dataDir / "empty.csv").write_text("")
+    (dataDir / "header.csv").write_text(header)
+    assert import_listings(dataDir, "empty.csv") == before
+    assert import_listings(dataDir, "header.csv") == before
+
+
+def test_clean_import_rebuilds_indexes(galaxy, tmp_path):
+    expected, indexes = import_listings(make_data(galaxy, tmp_path / "prices"), "listings.csv")
+    clean, clean_indexes = import_listings(make_data(galaxy, tmp_path / "clean", prices = False), "listings.csv")
+    assert clean == expected
+    assert clean_indexes == indexes
+    assert {name for name, _ in indexes} >= set(eddblink_plug.DEFERRED_INDEXES)
+
+
+def test_listings_need_their_columns(galaxy, tmp_path):
+    dataDir = make_data(galaxy, tmp_path)
+    (dataDir / "bad.csv").write_text("id,station_id,supply\n1,2,3\n")
+    with pytest.raises(DecodingError, match = "commodity_id"):
+        import_listings(dataDir, "bad.csv")
+
+
+def test_fetch_all_only_downloads_newer_files(server, tmp_path):
+    root, url = server
+    names = ["a.csv", "b.csv", "c.csv"]
+    for name in names:
+        (root / name).write_text(name * 1000)
+    local = tmp_path / "local"
+    env = make_env(tmp_path)
+    fetches = [(url + name, local / name, True) for name in names]
+    
+    assert transfers.fetch_all(env, fetches, parallel = 2) == [True, True, True]
+    for name in names:
+        assert (local / name).read_text() == name * 1000
+        assert (local / name).stat().st_mtime == int((root / name).stat().st_mtime)
+    assert transfers.fetch_all(env, fetches, parallel = 2) == [False, False, False]
+    
+    later = (root / "b.csv").stat().st_mtime + 60
+    os.utime(root / "b.csv", (later, later))
+    fetches.append((url + "missing.csv", local / "missing.csv", True))
+    fetches.append((url + "c.csv", local / "copy.csv", False))
+    assert transfers.fetch_all(env, fetches) == [False, True, False, False, True]
+    assert not (local / "missing.csv").exists()
+
+
+def test_fetch_all_drops_partial_downloads(server, tmp_path, monkeypatch):
+    root, url = server
+    (root / "a.csv").write_text("a" * 1000)
+    
+    def broken(self, chunk_size = 1, decode_unicode = False):  # pylint: disable=unused-argument
+        yield b"a" * 10
+        raise requests.exceptions.ChunkedEncodingError("connection lost")
+    
+    monkeypatch.setattr(requests.Response, "iter_content", broken)
+    env = make_env(tmp_path)
+    assert transfers.fetch_all(env, [(url + "a.csv", tmp_path / "local" / "a.csv", True)]) == [False]
+    assert not (tmp_path / "local" / "a.csv").exists()
+    assert not (tmp_path / "a.csv.dl").exists()
+
+
+def test_run_downloads_and_imports_listings(galaxy, server, tmp_path, monkeypatch):
+    root, url = server
+    dataDir = make_data(galaxy, tmp_path / "td")
+    # The site has the same System, Station and Item files, and the listings.
+    for name in ("System.csv", "Station.csv", "Item.csv", "Category.csv"):
+        shutil.copy2(dataDir / name, root / name)
+    shutil.move(dataDir / "listings.csv", root / "listings.csv")
+    (root / "listings-live.csv").write_text((root / "listings.csv").read_text().splitlines()[0] + "\n")
+    monkeypatch.setattr(eddblink_plug, "BASE_URL", url)
+    
+    def run():
+        env = make_env(dataDir, tmpDir = str(tmp_path / "eddb"), pluginOptions = ["parallel=3"])
+        ImportPlugin(TradeDB(env, load = False), env).run()
+        with sqlite3.connect(str(dataDir / "TradeDangerous.db")) as db:
+            return sorted(db.execute("SELECT * FROM StationItem"))
+    
+    rows = run()
+    listings = (root / "listings.csv").read_bytes()
+    assert (tmp_path / "eddb" / "listings.csv").read_bytes() == listings
+    assert len(rows) == sum(map(len, galaxy.markets.values()))
+    assert {row[8] for row in rows} == {str(listingsTime)}
+    
+    # Nothing's changed, so nothing is downloaded or imported again.
+    (root / "listings.csv").write_text("")
+    os.utime(root / "listings.csv", (0, 0))
+    assert run() == rows
+    assert (tmp_path / "eddb" / "listings.csv").read_bytes() == listings
+
+
+@pytest.mark.parametrize("option", ["parallel", "parallel=", "parallel=abc", "parallel=0", "parallel=-2"])
+def test_parallel_needs_a_count(tmp_path, option):
+    env = make_env(tmp_path, tmpDir = str(tmp_path / "eddb"), pluginOptions = [option])
+    with pytest.raises(PluginException, match = f"parallel={transfers.DEFAULT_FETCHES}"):
+        ImportPlugin(TradeDB(env, load = False), env).run()
+    # It gives up before downloading anything.
+    assert not (tmp_path / "eddb").exists()
@@ -0,0 +1,138 @@
+import http.client
+import io
+import json
+import os
+import threading
+from contextlib import redirect_stdout
+
+import pytest
+from rich.console import Console
+
+from tradedangerous import TradeEnv
+from tradedangerous.commands import CommandIndex
+from tradedangerous.commands.serve_cmd import CalcPool, QueryServer, makeServer
+from tradedangerous.tradedb import TradeDB
+
+
+@pytest.fixture
+def server(galaxy_env):
+    env = TradeEnv(
+        quiet=2, dataDir=galaxy_env.dataDir, csvDir=galaxy_env.csvDir,
+        argv=['trade.py'], priceSnapshots=2,
+    )
+    queries = QueryServer(env, TradeDB(env))
+    yield queries
+    queries.tdb.close()
+
+
+def places(tdb):
+    stations = sorted(tdb.stationByID.values(), key=lambda stn: stn.ID)
+    return stations[0], stations[1]
+
+
+def run_direct(tdb, args):
+    """ What the command prints when it loads its own prices. """
+    cmdenv = CommandIndex().parse(['trade.py', *args])
+    output = io.StringIO()
+    cmdenv.console = Console(file=output, color_system=None, soft_wrap=True)
+    results = cmdenv.run(tdb)
+    with redirect_stdout(output):
+        results.render()
+    return output.getvalue()
+
+
+class TestQueryServer:
+    def test_run_matches_a_fresh_calc(self, server):
+        origin, _ = places(server.tdb)
+        args = [
+            'run', '--from', origin.name(), '--cr', '50000', '--cap', '20',
+            '--ly', '40', '--hops', '2', '-q',
+        ]
+        status, response = server.query(args)
+        assert (status, response['ok']) == (200, True), response
+        assert response['output'] == run_direct(server.tdb, args)
+        # The second query borrows the warm prices.
+        assert server.query(args)[1]['output'] == response['output']
+        assert len(server.calcs) == 1
+    
+    def test_separate_snapshots(self, server):
+        origin, _ = places(server.tdb)
+        item = next(iter(server.tdb.itemByID.values()))
+        for avoid in ([], ['--avoid', item.name()]):
+            status, response = server.query([
+                'run', '--from', origin.name(), '--cr', '50000', '--cap', '20',
+                '--ly', '40', *avoid,
+            ])
+            assert status in (200, 400), response
+        assert len(server.calcs) == 2
+    
+    def test_errors(self, server):
+        origin, _ = places(server.tdb)
+        status, response = server.query(['update', origin.system.name()])
+        assert (status, response['ok']) == (400, False)
+        assert 'only answers' in response['error']
+        status, response = server.query(['nav', origin.system.name(), 'Nowhere At All', '--ly', '40'])
+        assert (status, response['ok']) == (400, False)
+        status, response = server.query(['run', '--from', origin.name(), '--checklist'])
+        assert status == 400
+    
+    def test_keeps_its_cwd(self, server, tmp_path):
+        origin, _ = places(server.tdb)
+        cwd = os.getcwd()
+        status, response = server.query(['local', origin.system.name(), '--cwd', str(tmp_path)])
+        assert status == 200, response
+        assert os.getcwd() == cwd
+        status, _ = server.query(['local', 'Nowhere At All', '-C', str(tmp_path)])
+        assert status == 400
+        assert os.getcwd() == cwd
+    
+    def test_reloads_when_the_database_changes(self, server):
+        origin, other = places(server.tdb)
+        tdb = server.tdb
+        server.query(['local', origin.system.name()])
+        assert server.tdb is tdb
+        
+        stat = tdb.dbPath.stat()
+        os.utime(tdb.dbPath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        status, response = server.query(['local', other.system.name(), '--ly', '50'])
+        assert status == 200, response
+        assert server.tdb is not tdb
+        assert tdb.conn is None
+
+
+def test_http(server):
+    httpd = makeServer(TradeEnv(socketPath=None, port=0), server)
+    origin, _ = places(server.tdb)
+    replies = []
+    
+    def client():
+        for body in (json.dumps({'args': ['local', origin.system.name()]}), 'not json'):
+            conn = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=30)
+            conn.request('POST', '/', body)
+            reply = conn.getresponse()
+            replies.append((reply.status, json.loads(reply.read())))
+            conn.close()
+    
+    thread = threading.Thread(target=client)
+    thread.start()
+    try:
+        # Queries run on this thread, which owns the TradeDB.
+        httpd.handle_request()
+        httpd.handle_request()
+    finally:
+        thread.join(30)
+        httpd.server_close()
+    (status, response), (badStatus, _) = replies
+    assert status == 200, response
+    assert origin.system.name().upper() in response['output'].upper()
+    assert badStatus == 400
+
+
+def test_calc_pool_evicts(galaxy_env):
+    tdb = TradeDB(galaxy_env)
+    pool = CalcPool(tdb, 1)
+    first = pool.get(TradeEnv())
+    assert pool.get(TradeEnv(tradeCacheSize=0)).stationsSelling is first.stationsSelling
+    pool.get(TradeEnv(supply=5))
+    assert len(pool) == 1
+    assert pool.get(TradeEnv(maxAge=1)) is None
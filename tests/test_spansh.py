@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from tradedangerous import TradeEnv
+from tradedangerous.plugins import PluginException
+from tradedangerous.plugins.spansh_plug import ImportPlugin, ParserPool, ingest_system, parse_lines
+from tradedangerous.tradedb import TradeDB
+
+@pytest.fixture(scope = "module")
+def dump(galaxy, tmp_path_factory):
+    path = tmp_path_factory.mktemp("spansh") / "galaxy_stations.json"
+    galaxy.writeSpanshDump(path)
+    return path
+
+
+@pytest.fixture(scope = "module")
+def served(dump, serve_directory):
+    """ The url of a stand-in for the spansh site, serving the dump, plain and gzipped. """
+    root = dump.parent
+    (root / "galaxy_stations.json.gz").write_bytes(gzip.compress(dump.read_bytes()))
+    return serve_directory(root)
+
+
+def import_dump(galaxy, dump, dataDir, *options, fresh = True):
+    """
+    Imports the dump, into a fresh database by default, and returns its
+    rows. The dump is a file, or None to pass the source in options.
+    """
+    if dump is not None:
+        options = ("file={}".format(dump), *options)
+    env = TradeEnv(
+        quiet = 2, dataDir = str(dataDir), csvDir = str(dataDir), tmpDir = str(dataDir),
+        pluginOptions = list(options),
+    )
+    if fresh:
+        galaxy.writeTradeDangerous(dataDir, env.templateDir)
+        for name in ("System.csv", "Station.csv", "TradeDangerous.prices"):
+            (dataDir / name).unlink()
+    ImportPlugin(TradeDB(env, load = False), env).run()
+    with sqlite3.connect(str(dataDir / "TradeDangerous.db")) as db:
+        return {
+            table: sorted(db.execute("SELECT * FROM {}".format(table)))
+            for table in ("System", "Station", "StationItem")
+        }
+
+
+def test_parse_lines(galaxy, dump):
+    lines = dump.read_bytes().splitlines(keepends = True)
+    assert lines[0].strip() == b"[" and lines[-1].strip() == b"]"
+    systems = parse_lines(lines)
+    expected = [ingest_system(data) for data in json.loads(dump.read_bytes())]
+    assert systems == expected
+    assert len(systems) == galaxy.spec.systems
+    
+    # A market's entries share one timestamp.
+    _, stations = next(pair for pair in systems if pair[1])
+    _, _, _, commodities = stations[0]
+    assert len({id(commodity.modified) for commodity in commodities}) == 1
+
+
+def test_pool_keeps_order(dump):
+    expected = parse_lines(dump.read_bytes().splitlines())
+    with dump.open("rb") as stream:
+        pool = ParserPool(stream, 2, batch_lines = 3)
+        batches = list(pool.batches())
+    assert [pair for batch, _ in batches for pair in batch] == expected
+    assert batches[-1][1] == dump.stat().st_size
+    assert pool.parse_stats.count == len(expected)
+    assert pool.read_stats.count == dump.stat().st_size
+
+
+def test_pool_rejects_other_layouts(dump):
+    pretty = json.dumps(json.loads(dump.read_bytes()), indent = 2).encode()
+    pool = ParserPool(io.BytesIO(pretty), 1)
+    with pytest.raises(PluginException, match = "parsers=0"):
+        list(pool.batches())
+    assert not any(process.is_alive() for process in pool.processes)
+
+
+@pytest.mark.parametrize("option", ["parsers", "parsers=", "parsers=abc", "parsers=-1"])
+def test_parsers_needs_a_count(galaxy, dump, tmp_path, option):
+    with pytest.raises(PluginException, match = "parsers="):
+        import_dump(galaxy, dump, tmp_path, option)
+
+
+def test_parsers_import_the_same(galaxy, dump, tmp_path):
+    inline = import_dump(galaxy, dump, tmp_path / "inline", "parsers=0")
+    pooled = import_dump(galaxy, dump, tmp_path / "pooled", "parsers=2")
+    assert pooled == inline
+    assert len(inline["Station"]) == galaxy.spec.stations
+    assert len(inline["StationItem"]) == sum(map(len, galaxy.markets.values()))
+
+
+def test_reimport_only_writes_newer_markets(galaxy, dump, tmp_path):
+    dataDir = tmp_path / "td"
+    before = import_dump(galaxy, dump, dataDir, "parsers=0")
+    systems = json.loads(dump.read_bytes())
+    markets = [
+        station['market']
+        for system in systems for station in system['stations'] if 'market' in station
+    ]
+    markets[0]['updateTime'] = '2024-05-01 12:00:00+00'
+    markets[1]['updateTime'] = '2024-07-01 12:00:00+00'
+    for commodity in markets[1]['commodities']:
+        commodity['sellPrice'] += 1
+    update = tmp_path / "update.json"
+    update.write_text("[\n" + ",\n".join(map(json.dumps, systems)) + "\n]\n")
+    
+    after = import_dump(galaxy, update, dataDir, "parsers=0", fresh = False)
+    changed = [row for row in after['StationItem'] if row not in before['StationItem']]
+    assert len(changed) == len(markets[1]['commodities'])
+    assert all(row[8] == '2024-07-01 12:00:00' for row in changed)
+    assert len(after['StationItem']) == len(before['StationItem'])
+
+
+@pytest.mark.parametrize("name", ["galaxy_stations.json", "galaxy_stations.json.gz"])
+def test_stream_from_url(galaxy, dump, served, tmp_path, name):
+    expected = import_dump(galaxy, dump, tmp_path / "file", "parsers=0")
+    streamed = import_dump(galaxy, None, tmp_path / "stream", "url=" + served + name, "stream", "parsers=1")
+    assert streamed == expected
+    assert not (tmp_path / "stream" / name).exists()
+    
+    kept = import_dump(galaxy, None, tmp_path / "keep", "url=" + served + name, "stream", "keep", "parsers=0")
+    assert kept == expected
+    assert (tmp_path / "keep" / name).read_bytes() == (dump.parent / name).read_bytes()
+    assert not (tmp_path / "keep" / (name + ".part")).exists()
+
+
+def test_stream_needs_url(galaxy, dump, tmp_path):
+    with pytest.raises(PluginException, match = "stream"):
+        import_dump(galaxy, dump, tmp_path, "stream")
@@ -1,8 +1,14 @@
 import io
+import json
+from contextlib import redirect_stdout
 
 import pytest
+from rich.console import Console
 
+from tradedangerous import TradeEnv
 from tradedangerous.cli import trade
+from tradedangerous.commands import CommandIndex, run_cmd
+from tradedangerous.tradedb import TradeDB
 
 from .helpers import copy_fixtures, regex_findin, replace_stdin
 
@@ -13,6 +19,33 @@ def setup_module():
     copy_fixtures()
 
 
+@pytest.fixture(scope="module")
+def galaxy_tdb(galaxy_env):
+    tdb = TradeDB(TradeEnv(quiet=2, dataDir=galaxy_env.dataDir, csvDir=galaxy_env.csvDir, argv=['trade.py']))
+    yield tdb
+    tdb.close()
+
+
+def galaxy_cmdenv(tdb, args, origin=0):
+    """ Parses a 4 hop 'run' from the galaxy's origin'th station. """
+    station = sorted(tdb.stationByID.values(), key=lambda stn: stn.ID)[origin]
+    return CommandIndex().parse([
+        'trade.py', 'run', '--from', station.name(), '--cr', '50000', '--cap', '20',
+        '--ly', '40', '--jumps', '3', '--hops', '4', *args,
+    ])
+
+
+def run_galaxy(tdb, args, origin=0):
+    """ What the galaxy run prints. """
+    cmdenv = galaxy_cmdenv(tdb, args, origin)
+    output = io.StringIO()
+    cmdenv.console = Console(file=output, color_system=None, soft_wrap=True)
+    results = cmdenv.run(tdb)
+    with redirect_stdout(output):
+        results.render()
+    return output.getvalue().splitlines()
+
+
 class TestTradeRun:
     def test_run1(self, capsys):
         trade([PROG, "run", "--capacity=10", "--credits=10000", "--from=sol/abr", "--jumps-per=3", "--ly-per=10.5", "--no-planet"])
@@ -62,3 +95,48 @@ class TestTradeRun:
         assert "  Sol/Haberlandt Survey: 5 x Reactive Armour," in captured.out
         assert "  Sol/Ehrlich City: 10 x Building Fabricators," in captured.out
         assert "  Sol/Durrance Camp +10 925cr (728/ton)"
+    
+    def test_run_stream(self, capsys):
+        trade([
+            PROG, "run", "--capacity=10", "--credits=10000", "--from=sol/abr", "--jumps-per=3", "--ly-per=10.5",
+            "--no-planet", "--hops=2", "--prune-score=50", "--prune-hops=2", "--stream=jsonl",
+        ])
+        captured = capsys.readouterr()
+        records = [json.loads(line) for line in captured.out.splitlines()]
+        assert [record["type"] for record in records] == ["hop", "hop", "result"]
+        assert [record["hop"] for record in records[:2]] == [1, 2]
+        best = records[-1]["routes"][0]
+        assert best["from"] == "Sol/Abraham Lincoln"
+        assert len(best["hops"]) == 2
+        assert best["gainCr"] == sum(hop["gainCr"] for hop in best["hops"])
+
+
+class TestRunPruning:
+    @pytest.mark.parametrize("args", [[], ["--routes", "3"], ["--ls-penalty", "25"]])
+    def test_same_routes_as_unpruned(self, galaxy_tdb, monkeypatch, args):
+        pruned = run_galaxy(galaxy_tdb, args)
+        notes = [line for line in pruned if line.startswith("NOTE:")]
+        assert any("can't beat the top" in note for note in notes)
+        monkeypatch.setattr(run_cmd, "findScoreToBeat", lambda *_: None)
+        assert run_galaxy(galaxy_tdb, args) == [line for line in pruned if line not in notes]
+    
+    @pytest.mark.parametrize("args", [["--max-routes", "3"], ["--prune-score", "50", "--prune-hops", "2"]])
+    def test_not_with_cropped_routes(self, galaxy_tdb, args):
+        # Cropped routes can't promise to beat the narrow search's.
+        assert not any("can't beat the top" in line for line in run_galaxy(galaxy_tdb, args))
+    
+    @pytest.mark.parametrize("args", [["--unique"], ["--loop-int", "2"], ["--loop-int", "2", "--routes", "5"]])
+    def test_not_with_barred_stations(self, galaxy_tdb, monkeypatch, args):
+        # The narrow search's routes may go where the full search's can't.
+        # From this station, the narrow search would prune with these.
+        output = run_galaxy(galaxy_tdb, args, origin=54)
+        assert not any("can't beat the top" in line for line in output)
+        monkeypatch.setattr(run_cmd, "findScoreToBeat", lambda *_: None)
+        assert run_galaxy(galaxy_tdb, args, origin=54) == output
+    
+    def test_stream_notes_go_to_stderr(self, galaxy_tdb, capsys):
+        galaxy_cmdenv(galaxy_tdb, ['--stream', 'jsonl']).run(galaxy_tdb).render()
+        captured = capsys.readouterr()
+        assert "can't beat the top" in captured.err
+        records = [json.loads(line) for line in captured.out.splitlines()]
+        assert [record["type"] for record in records] == ["hop"] * 4 + ["result"]
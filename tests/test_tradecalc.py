@@ -0,0 +1,266 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from tradedangerous import TradeEnv, tradecalc
+from tradedangerous.tradecalc import Route, TradeCalc, TradeListCache, fitFunctions
+from tradedangerous.tradedb import Category, Item, Trade, TradeDB
+
+needs_numpy = pytest.mark.skipif(not tradecalc.hasNumpy(), reason="numpy is not installed")
+
+
+def make_calc(stations=20, items=40, seed=1):
+    """
+    Builds a TradeCalc around synthetic price data without touching
+    the database.
+    """
+    rng = random.Random(seed)
+    category = Category(1, "Stuff", [])
+    itemByID = {
+        ID: Item(ID, "Item{}".format(ID), category, "Stuff/Item{}".format(ID))
+        for ID in range(1, items + 1)
+    }
+    selling, buying = {}, {}
+    for stnID in range(1, stations + 1):
+        itemIDs = rng.sample(sorted(itemByID), rng.randint(1, items))
+        selling[stnID] = [
+            (ID, rng.randint(50, 500), rng.randint(1, 900), 2, rng.randint(0, 9999))
+            for ID in itemIDs[: len(itemIDs) // 2]
+        ]
+        buying[stnID] = [
+            (ID, rng.randint(50, 800), rng.randint(1, 900), 3, rng.randint(0, 9999))
+            for ID in itemIDs[len(itemIDs) // 2:]
+        ]
+    calc = TradeCalc.__new__(TradeCalc)
+    calc.tdb = SimpleNamespace(itemByID=itemByID)
+    calc.tdenv = TradeEnv()
+    calc.stationsSelling, calc.stationsBuying = selling, buying
+    calc.priceMatrix = None
+    stations = [SimpleNamespace(ID=ID) for ID in range(1, stations + 1)]
+    return calc, stations
+
+
+@needs_numpy
+class TestPriceMatrix:
+    def test_matches_getTrades(self):
+        calc, stations = make_calc()
+        expected = {
+            (src.ID, dst.ID): calc.getTrades(src, dst)
+            for src in stations for dst in stations
+        }
+        calc.priceMatrix = tradecalc.PriceMatrix(
+            calc.tdb.itemByID, calc.stationsSelling, calc.stationsBuying
+        )
+        for src in stations:
+            for dst in stations:
+                assert (calc.getTrades(src, dst) or None) == (expected[(src.ID, dst.ID)] or None)
+    
+    def test_getTradesTo_affordable(self):
+        calc, stations = make_calc(seed=7)
+        matrix = tradecalc.PriceMatrix(
+            calc.tdb.itemByID, calc.stationsSelling, calc.stationsBuying
+        )
+        src = stations[0]
+        srcRow = matrix.rowOf(src.ID)
+        srcCols = matrix.affordableColumns(srcRow, 200)
+        affordable = tuple(sell for sell in calc.stationsSelling[src.ID] if sell[1] <= 200)
+        dstRows = [matrix.rowOf(dst.ID) for dst in stations] + [None]
+        results = matrix.getTradesTo(srcRow, dstRows, srcCols, 1, 10**9)
+        assert results[-1] == []
+        for dst, trades in zip(stations, results):
+            assert trades == (calc.getTrades(src, dst, affordable) or [])
+
+
+class TestTradeListCache:
+    def test_matches_affordable_getTrades(self):
+        calc, stations = make_calc(seed=3)
+        cache = TradeListCache(1000)
+        for maxCostCr in (10**9, 300, 120):
+            for src in stations:
+                affordable = tuple(
+                    sell for sell in calc.stationsSelling[src.ID] if sell[1] <= maxCostCr
+                )
+                for dst in stations:
+                    trades = cache.get(
+                        src.ID, dst.ID, maxCostCr,
+                        lambda: calc.getTrades(src, dst),  # pylint: disable=cell-var-from-loop
+                    )
+                    expected = calc.getTrades(src, dst, affordable) if affordable else None
+                    assert list(trades) == (expected or [])
+        assert cache.misses == len(stations) ** 2
+        assert cache.hits == 2 * len(stations) ** 2
+    
+    def test_evicts_least_recently_used(self):
+        cache = TradeListCache(2)
+        cache.get(1, 2, 100, list)
+        cache.get(1, 3, 100, list)
+        cache.get(1, 2, 100, list)
+        cache.get(1, 4, 100, list)
+        assert list(cache.entries) == [(1, 2), (1, 4)]
+        assert (cache.hits, cache.misses) == (1, 3)
+
+
+def make_trades(rng, count):
+    trades = [
+        Trade(None, rng.randint(10, 900), rng.randint(1, 300), rng.randint(1, 12), 2, 1, 1, 0, 0)
+        for _ in range(count)
+    ]
+    trades.sort(key = lambda trade: trade.costCr)
+    trades.sort(key = lambda trade: trade.gainCr, reverse = True)
+    return trades
+
+
+def best_gain_of_three(trades, credits, capacity):
+    """ The most a hold of three trades can gain: tries every quantity of the first two. """
+    first, second, third = trades
+    best = 0
+    for firstQty in range(min(first.supply, capacity, credits // first.costCr) + 1):
+        firstCr = credits - firstQty * first.costCr
+        for secondQty in range(min(second.supply, capacity - firstQty, firstCr // second.costCr) + 1):
+            thirdQty = min(
+                third.supply, capacity - firstQty - secondQty,
+                (firstCr - secondQty * second.costCr) // third.costCr,
+            )
+            best = max(best, firstQty * first.gainCr + secondQty * second.gainCr + thirdQty * third.gainCr)
+    return best
+
+
+class TestDpFit:
+    def test_fit_names(self):
+        for name in fitFunctions.values():
+            assert callable(getattr(TradeCalc, name))
+    
+    @needs_numpy
+    def test_matches_bruteForceFit(self):
+        calc, _ = make_calc(stations = 1)
+        rng = random.Random(5)
+        for _ in range(100):
+            trades = make_trades(rng, rng.randint(1, 4))
+            capacity = rng.randint(1, 20)
+            maxUnits = rng.randint(1, capacity)
+            # Few enough credits that dpFit doesn't need to bucket them.
+            credits = rng.randint(0, tradecalc.dpFitCells // (capacity + 1))
+            load = calc.dpFit(trades, credits, capacity, maxUnits)
+            assert load.costCr <= credits and load.units <= capacity
+            assert all(qty <= min(maxUnits, trade.supply) for trade, qty in load.items)
+            assert load.gainCr == calc.bruteForceFit(trades, credits, capacity, maxUnits).gainCr
+    
+    def test_never_worse_than_simpleFit(self):
+        calc, _ = make_calc(stations = 1)
+        rng = random.Random(9)
+        for _ in range(50):
+            trades = make_trades(rng, rng.randint(1, 12))
+            credits = rng.randint(1, 10**7)
+            load = calc.dpFit(trades, credits, 720, 720)
+            assert load.costCr <= credits and load.units <= 720
+            assert load.gainCr >= calc.simpleFit(trades, credits, 720, 720).gainCr
+    
+    @needs_numpy
+    def test_approximate_in_a_big_hold(self):
+        # Too many credits to give each its own bucket.
+        calc, _ = make_calc(stations = 1)
+        rng = random.Random(4)
+        for _ in range(12):
+            trades = [
+                Trade(None, rng.randint(10, 900), rng.randint(100, 5000), rng.randint(300, 700), 2, 1, 1, 0, 0)
+                for _ in range(3)
+            ]
+            trades.sort(key = lambda trade: (-trade.gainCr, trade.costCr))
+            credits = rng.randint(10**5, 10**6)
+            load = calc.dpFit(trades, credits, 700, 700)
+            assert load.costCr <= credits and load.units <= 700
+            assert calc.simpleFit(trades, credits, 700, 700).gainCr <= load.gainCr
+            assert load.gainCr <= best_gain_of_three(trades, credits, 700)
+
+
+class TestPriceRegion:
+    def test_loads_only_the_region(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        everything = TradeCalc(tdb, galaxy_env)
+        origin = tdb.stationByID[min(tdb.stationByID)].system
+        
+        def pricesWithin(ly):
+            return {
+                ID: everything.stationsSelling[ID]
+                for ID in everything.stationsSelling
+                if tdb.stationByID[ID].system.distanceTo(origin) <= ly
+            }
+        
+        calc = TradeCalc(tdb, galaxy_env, region=[(origin, 30)])
+        assert dict(calc.stationsSelling) == pricesWithin(30)
+        calc.widenRegion(90)
+        assert dict(calc.stationsSelling) == pricesWithin(90)
+        assert calc.region == [(origin, 90)]
+        assert len(pricesWithin(30)) < len(pricesWithin(90))
+
+
+class TestForEnv:
+    def test_shares_prices(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        warm = TradeCalc(tdb, galaxy_env)
+        env = TradeEnv(quiet=2, fit='dp', tradeCacheSize=0)
+        calc = warm.forEnv(env)
+        assert calc.stationsSelling is warm.stationsSelling
+        assert calc.tdenv is env and warm.tdenv is galaxy_env
+        assert calc.defaultFit == calc.dpFit and calc.tradeCache is None
+        assert TradeCalc.priceKey(env) == TradeCalc.priceKey(galaxy_env)
+    
+    def test_price_key(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        item = next(iter(tdb.itemByID.values()))
+        assert TradeCalc.priceKey(TradeEnv(maxAge=2)) is None
+        assert TradeCalc.priceKey(TradeEnv(avoidItems=[item])) != TradeCalc.priceKey(TradeEnv())
+        assert TradeCalc.priceKey(TradeEnv(supply=5)) != TradeCalc.priceKey(TradeEnv())
+
+
+class TestBestHopsWorkers:
+    @staticmethod
+    def make_routes(galaxy_env):
+        """
+        A calc and a hop's worth of routes from every market, each twice,
+        so that destinations are reached by routes that tie exactly.
+        """
+        env = TradeEnv(
+            quiet=2, dataDir=galaxy_env.dataDir, csvDir=galaxy_env.csvDir,
+            capacity=100, credits=10_000_000, maxJumpsPer=2, maxLyPer=15.0,
+            maxSystemLinkLy=15.0, minGainPerTon=1, maxGainPerTon=0,
+            margin=0.0, insurance=0, lsPenalty=12.5, maxLs=0,
+            avoidItems=[], avoidPlaces=[], workers=0,
+        )
+        tdb = TradeDB(env)
+        calc = TradeCalc(tdb, env)
+        starts = [
+            Route((stn,), (), env.credits, 0, (), 0)
+            for stn in tdb.stationByID.values() if stn.ID in calc.stationsSelling
+        ]
+        routes = calc.getBestHops(starts)
+        routes += [Route(r.route, r.hops, r.startCr, r.gainCr, r.jumps, r.score) for r in routes]
+        return calc, routes
+    
+    @staticmethod
+    def describe(routes):
+        return sorted((tuple(stn.ID for stn in r.route), r.hops, r.jumps, r.score) for r in routes)
+    
+    @pytest.mark.skipif(not tradecalc.canForkWorkers, reason="needs a platform that can fork")
+    def test_matches_one_process(self, galaxy_env):
+        calc, routes = self.make_routes(galaxy_env)
+        assert len(routes) > 4
+        expected, connections = calc._getBestHops(routes)  # pylint: disable=protected-access
+        parallel, parallelConnections = calc._getBestHopsParallel(routes, None, 3)  # pylint: disable=protected-access
+        assert parallel == expected and parallelConnections == connections
+        # Ties go to the earlier route, as in a single process.
+        assert all(parallel[dstID][1] is expected[dstID][1] for dstID in expected)
+        
+        single = calc.getBestHops(routes)
+        calc.tdenv.workers = 3
+        assert self.describe(calc.getBestHops(routes)) == self.describe(single)
+        assert tradecalc._workerHops is None  # pylint: disable=protected-access
+    
+    def test_without_fork(self, galaxy_env, monkeypatch):
+        calc, routes = self.make_routes(galaxy_env)
+        single = calc.getBestHops(routes)
+        monkeypatch.setattr(tradecalc, "canForkWorkers", False)
+        monkeypatch.setattr(TradeCalc, "_getBestHopsParallel", None)
+        calc.tdenv.workers = 3
+        assert self.describe(calc.getBestHops(routes)) == self.describe(single)
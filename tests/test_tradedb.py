@@ -0,0 +1,265 @@
+import os
+import random
+import sqlite3
+
+import pytest
+
+from tradedangerous import tradedb
+from tradedangerous.jumpgraph import JumpGraph
+from tradedangerous.snapshot import PlaceSnapshot
+from tradedangerous.commands import CommandIndex
+from tradedangerous.tradedb import Station, System, TradeDB
+
+needs_numpy = pytest.mark.skipif(not tradedb.hasNumpy(), reason="numpy is not installed")
+
+
+def make_tdb(count=6, spacing=5.0):
+    """
+    Builds a TradeDB with a line of systems 'spacing' ly apart and
+    without touching the database.
+    """
+    tdb = TradeDB.__new__(TradeDB)
+    tdb.systemByID = {
+        ID: System(ID, "SYS{}".format(ID), ID * spacing, 0.0, 0.0, 0)
+        for ID in range(count)
+    }
+    tdb.stellarGrid = None
+    tdb.galaxyWanted = False
+    tdb._galaxy = None
+    tdb.reachableCache = None
+    tdb.jumpGraph = None
+    tdb.maxSystemLinkLy = 30.0
+    return tdb
+
+
+def make_galaxy(count=400, seed=1):
+    """ Builds a TradeDB with systems scattered around the origin. """
+    rng = random.Random(seed)
+    tdb = make_tdb(0)
+    tdb.systemByID = {
+        ID: System(
+            ID, "SYS{}".format(ID),
+            rng.uniform(-120, 120), rng.uniform(-40, 40), rng.uniform(-120, 120), 0,
+        )
+        for ID in range(count)
+    }
+    return tdb
+
+
+class TestLazyTables:
+    def test_loaded_on_first_use(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        assert tdb.loadedTables == set()
+        assert len(tdb.stationByID) == 60
+        assert tdb.loadedTables == {'System'}
+        assert sum(len(sys.stations) for sys in tdb.systems()) == 60
+        assert tdb.tradingStationCount == 60
+        assert len(tdb.itemByID) == 12
+        assert tdb.loadedTables == {'System', 'Category', 'Item'}
+    
+    def test_preload_and_reload(self, galaxy_env):
+        tdb = TradeDB(galaxy_env, tables=('RareItem',))
+        assert tdb.loadedTables == {'System', 'Category', 'RareItem'}
+        system = next(tdb.systems())
+        tdb.load()
+        assert tdb.loadedTables == set()
+        assert tdb.systemByID[system.ID] is not system
+        assert tdb.systemByID[system.ID].dbname == system.dbname
+
+
+class TestPlaceSnapshot:
+    def test_matches_database(self, galaxy_env, tmp_path):
+        tdb = TradeDB(galaxy_env)
+        signature = PlaceSnapshot.fileSignature(tdb.dbPath)
+        fresh = PlaceSnapshot.fromDB(tdb.getDB(), signature)
+        fresh.save(tmp_path / "test.snapshot")
+        loaded = PlaceSnapshot.load(tmp_path / "test.snapshot", signature)
+        assert loaded.systems == [row[:5] + (row[5] or 0,) for row in fresh.systems]
+        assert loaded.stations == fresh.stations
+        assert loaded.markets == fresh.markets
+        assert PlaceSnapshot.load(tmp_path / "test.snapshot", b"x" * 32) is None
+    
+    def test_used_until_database_changes(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        station = next(iter(tdb.stationByID.values()))
+        snapshotPath = tdb.dbPath.with_suffix(".snapshot")
+        assert PlaceSnapshot.load(snapshotPath, PlaceSnapshot.fileSignature(tdb.dbPath))
+        tdb.close()
+        
+        with sqlite3.connect(str(tdb.dbPath)) as db:
+            db.execute("UPDATE Station SET name = 'Renamed' WHERE station_id = ?", (station.ID,))
+        db.close()
+        stat = tdb.dbPath.stat()  # in case of coarse file timestamps
+        os.utime(tdb.dbPath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        
+        reloaded = TradeDB(galaxy_env).stationByID[station.ID]
+        assert reloaded.dbname == 'Renamed'
+        assert (reloaded.itemCount, reloaded.system.ID) == (station.itemCount, station.system.ID)
+        assert reloaded.dataAge == pytest.approx(station.dataAge, abs=0.01)
+
+
+class TestStellarIndex:
+    @needs_numpy
+    def test_matches_grid(self, monkeypatch):
+        indexed = make_galaxy()
+        list(indexed.genStellarGrid(indexed.systemByID[0], 1))
+        gridded = make_galaxy()
+        monkeypatch.setattr(tradedb, "hasNumpy", lambda: False)
+        for ly in (0.5, 15, 31.9, 80):
+            for ID in range(0, 400, 7):
+                expected = [
+                    (sys.ID, dist) for sys, dist in gridded.genStellarGrid(gridded.systemByID[ID], ly)
+                ]
+                found = indexed.genStellarGrid(indexed.systemByID[ID], ly)
+                assert [(sys.ID, dist) for sys, dist in found] == expected
+        assert isinstance(indexed.stellarGrid, tradedb.StellarIndex)
+        assert isinstance(gridded.stellarGrid, dict)
+    
+    @needs_numpy
+    def test_queryAll_matches_query(self):
+        tdb = make_galaxy(seed=2)
+        index = tradedb.StellarIndex(tdb.systemByID.values())
+        index.batchSize = 64  # force several batches per block
+        seen = set()
+        for system, inRange in index.queryAll(20):
+            assert inRange == index.query(system, 20)
+            seen.add(system.ID)
+        assert seen == set(tdb.systemByID)
+
+
+def add_stations(tdb, seed=3):
+    """ Gives the systems of tdb up to three stations each. """
+    rng = random.Random(seed)
+    tdb.stationByID = {}
+    for system in tdb.systemByID.values():
+        for _ in range(rng.randrange(4)):
+            ID = len(tdb.stationByID) + 1
+            tdb.stationByID[ID] = Station(
+                ID, system, "STN{}".format(ID), rng.randrange(0, 5000),
+                *(rng.choice('YN?') for _ in range(3)), rng.choice('SML?'),
+                *(rng.choice('YN?') for _ in range(7)),
+                rng.randrange(3), None,
+            )
+    return tdb
+
+
+@needs_numpy
+class TestGalaxyStore:
+    def test_matches_objects(self):
+        tdb = add_stations(make_galaxy(seed=4))
+        assert tdb.galaxy is None
+        assert tdb.useGalaxy()
+        galaxy = tdb.galaxy
+        systems, stations = galaxy.index.systems, galaxy.stations
+        wants = (('maxPadSize', 'L?'), ('planetary', 'N'), ('blackMarket', ''))
+        
+        def passes(station):
+            return station.checkPadSize('L?') and station.checkPlanetary('N') and station.lsFromStar <= 2500
+        
+        for ID in range(0, 400, 9):
+            near = tdb.systemByID[ID]
+            rows, dists = galaxy.systemsWithin(near, 25, includeSelf=True)
+            inRange = [(system.ID, dist) for system, dist in tdb.genSystemsInRange(near, 25, includeSelf=True)]
+            assert list(zip([systems[row].ID for row in rows], dists.tolist())) == inRange
+            
+            stationRows = galaxy.stationRowsOf(rows)
+            expected = [stn for system in (systems[row] for row in rows) for stn in system.stations]
+            assert [stations[row] for row in stationRows] == expected
+            mask = galaxy.stationMask(stationRows, 2500, wants, trading=True)
+            assert mask.tolist() == [passes(stn) and stn.isTrading for stn in expected]
+            
+            assert galaxy.matchStations(near, 25, 2500, wants) == {
+                stn.ID: near.distanceTo(stn.system) for stn in expected if passes(stn)
+            }
+            among = [stn.ID for stn in stations[::5]]
+            assert galaxy.matchStations(near, 25, 2500, wants, among=among) == {
+                stn.ID: near.distanceTo(stn.system) for stn in stations[::5]
+                if passes(stn) and near.distanceTo(stn.system) <= 25
+            }
+        assert galaxy.matchStations() is None
+        assert galaxy.matchStations(maxLs=100) == dict.fromkeys(
+            stn.ID for stn in stations if stn.lsFromStar <= 100
+        )
+    
+    def test_rebuilt_when_places_change(self):
+        tdb = add_stations(make_galaxy(count=50))
+        tdb.useGalaxy()
+        galaxy = tdb.galaxy
+        assert tdb.galaxy is galaxy
+        tdb.stellarGrid = None
+        assert tdb.galaxy is not galaxy
+        assert len(tdb.galaxy.stations) == len(tdb.stationByID)
+    
+    def test_commands_agree(self, galaxy_env):
+        tdb = TradeDB(galaxy_env)
+        station = sorted(tdb.stationByID.values(), key=lambda stn: stn.ID)[0]
+        item = sorted(tdb.itemByID.values(), key=lambda item: item.ID)[0]
+        near = station.system.name()
+        queries = (
+            ['local', near, '--ly', '60', '-vv', '--pad', 'ML'],
+            ['buy', item.name(), '--near', near, '--ly', '60'],
+            ['sell', item.name(), '--near', near, '--ly', '60', '--no-planet'],
+            ['olddata', '--near', near, '--ly', '60', '--ls-max', '100000'],
+        )
+        
+        def results(args):
+            cmdenv = CommandIndex().parse(['trade.py', *args])
+            rows = cmdenv.run(tdb).rows
+            return [
+                (getattr(row, 'station', None), getattr(row, 'system', None), row.dist,
+                 [stn.station for stn in getattr(row, 'stations', ())])
+                for row in rows
+            ]
+        
+        expected = [results(args) for args in queries]
+        tdb.useGalaxy()
+        assert [results(args) for args in queries] == expected
+        assert all(expected)
+
+
+class TestReachableSystems:
+    def test_jumps_and_paths(self):
+        tdb = make_tdb()
+        origin = tdb.systemByID[0]
+        reachable = tdb.getReachableSystems(origin, maxJumps=2, maxLyPer=6)
+        assert [(node.system.ID, node.distLy) for node in reachable] == [
+            (0, 0), (1, 5.0), (2, 10.0),
+        ]
+        assert [sys.ID for sys in reachable[-1].via] == [0, 1, 2]
+    
+    def test_cached_by_limits_and_avoids(self):
+        tdb = make_tdb()
+        origin, avoid = tdb.systemByID[0], tdb.systemByID[1]
+        first = tdb.getReachableSystems(origin, maxJumps=3, maxLyPer=11)
+        assert tdb.getReachableSystems(origin, maxJumps=3, maxLyPer=11) is first
+        avoiding = tdb.getReachableSystems(origin, maxJumps=3, maxLyPer=11, avoidPlaces=[avoid])
+        assert avoiding is not first
+        assert avoid not in [node.system for node in avoiding]
+        assert len(tdb.reachableCache) == 2
+
+
+class TestJumpGraph:
+    def test_save_and_load(self, tmp_path):
+        tdb = make_tdb()
+        signature = b"s" * 20
+        graph = JumpGraph.build(tdb, 11.0, signature)
+        path = tmp_path / "test.11ly.jumps"
+        graph.save(path)
+        
+        assert JumpGraph.load(path, 12.0, signature) is None
+        assert JumpGraph.load(path, 11.0, b"x" * 20) is None
+        loaded = JumpGraph.load(path, 11.0, signature)
+        origin = tdb.systemByID[2]
+        assert loaded.systemsInRange(origin, tdb.systemByID) == [
+            (tdb.systemByID[1], 5.0), (tdb.systemByID[3], 5.0),
+            (tdb.systemByID[0], 10.0), (tdb.systemByID[4], 10.0),
+        ]
+    
+    def test_genSystemsInRange_uses_graph(self):
+        tdb = make_tdb()
+        expected = [(sys.ID, dist) for sys, dist in tdb.genSystemsInRange(tdb.systemByID[3], 6)]
+        tdb = make_tdb()
+        tdb.jumpGraph = JumpGraph.build(tdb, 11.0, b"s" * 20)
+        tdb.stellarGrid = {}  # the graph alone has to answer
+        inRange = tdb.genSystemsInRange(tdb.systemByID[3], 6)
+        assert [(sys.ID, dist) for sys, dist in inRange] == expected == [(2, 5.0), (4, 5.0)]
@@ -33,12 +33,22 @@
 # DEVELOPERS: If you are a programmer who wants TD to do something
 # cool, please see the TradeDB and TradeCalc modules. TD is designed
 # to empower other programmers to do cool stuff.
-from tradedangerous import cli
-
+#
+# Set IMPORTTIME in the environment to see what trade.py spends its
+# startup importing; see tradedangerous/misc/importtime.py.
+import os
 import sys
 
-def main(argv = None):
-    cli.main(sys.argv)
+if "IMPORTTIME" in os.environ and "importtime" not in sys._xoptions:
+    from tradedangerous.misc.importtime import profileImports
+    
+    def main(argv = None):
+        sys.exit(profileImports(__file__, sys.argv, os.environ["IMPORTTIME"]))
+else:
+    from tradedangerous import cli
+    
+    def main(argv = None):
+        cli.main(sys.argv)
 
 if __name__ == "__main__":
-    cli.main(sys.argv)
+    main()
@@ -0,0 +1,516 @@
+"""
+Synthetic-galaxy benchmarks.
+
+SyntheticGalaxy generates a reproducible random galaxy - systems,
+stations, items and market prices - from a GalaxySpec, and can write it
+out as the .csv/.prices files that buildCache reads, as a spansh
+galaxy dump, or as an eddblink listings.csv.
+
+runBenchmarks() builds a working database from such a galaxy in a
+scratch directory and times the main code paths against it, returning
+a dict that writeResults() saves as JSON so that runs can be compared
+across commits, e.g. with "trade.py bench --compare old.json".
+"""
+from __future__ import annotations
+
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+import csv
+import datetime
+import json
+import platform
+import random
+import shutil
+import subprocess
+import time
+import typing
+
+from .tradeenv import TradeEnv
+from .version import __version__
+
+if typing.TYPE_CHECKING:
+    from typing import Optional
+
+
+# The stages runBenchmarks knows how to time, in the order it runs them.
+stageNames = (
+    'buildCache', 'TradeDB.load', 'TradeCalc.load', 'getBestHops',
+    'getRoute', 'lookupPlace', 'spansh', 'eddblink',
+)
+
+# Market data timestamps: the galaxy is "collected" at galaxyTime, and
+# the eddblink listings are a day newer so that they replace it.
+galaxyTime = datetime.datetime(2024, 6, 1, 12, 0, 0)
+listingsTime = galaxyTime + datetime.timedelta(days = 1)
+
+syllables = (
+    'al', 'be', 'cor', 'da', 'el', 'fa', 'gan', 'hy', 'ix', 'jo',
+    'ka', 'lu', 'mor', 'ne', 'or', 'pa', 'qua', 'ri', 'sol', 'ta',
+    'ul', 've', 'wo', 'xi', 'ya', 'ze',
+)
+stationKinds = ('Port', 'Station', 'Hub', 'Dock', 'Outpost', 'Terminal', 'Relay', 'Gateway')
+itemAdjectives = (
+    'Basic', 'Refined', 'Rare', 'Heavy', 'Light', 'Synthetic',
+    'Organic', 'Military', 'Civilian', 'Advanced', 'Ancient', 'Liquid',
+)
+itemNouns = (
+    'Alloys', 'Fabrics', 'Medicines', 'Minerals', 'Machinery', 'Textiles',
+    'Reagents', 'Crystals', 'Components', 'Foods', 'Fuels', 'Artefacts',
+    'Polymers', 'Sensors', 'Spirits', 'Tools',
+)
+# Level brackets as written to .prices files.
+levelSuffix = {1: 'L', 2: 'M', 3: 'H'}
+
+
+class GalaxySpec(namedtuple('GalaxySpec', (
+        'systems', 'stations', 'items', 'density', 'seed',
+        ))):
+    """
+    Describes the size and shape of a synthetic galaxy.
+    
+    Attributes:
+        systems
+            Number of star systems,
+        stations
+            Number of stations, spread over the systems,
+        items
+            Number of trade items,
+        density
+            Fraction (0-1) of the items each station has a market for,
+        seed
+            Random seed; the same spec always generates the same galaxy.
+    """
+    
+    def asDict(self):
+        return dict(self._asdict())
+
+
+defaultSpec = GalaxySpec(systems = 2000, stations = 4000, items = 100, density = 0.4, seed = 1)
+
+
+def spellName(rng, parts):
+    return ''.join(rng.choice(syllables) for _ in range(parts)).capitalize()
+
+
+class SyntheticGalaxy:
+    """
+    A randomly generated galaxy.
+    
+    About two thirds of the systems form a dense "bubble" around the
+    origin, the rest are scattered across a wide, flat disc, so that
+    both crowded and sparse neighbourhoods get exercised.
+    
+    Attributes:
+        spec
+            The GalaxySpec it was generated from,
+        categories
+            [(category_id, name)], from the Category.csv template,
+        items
+            [(item_id, name, category_id, avg_price)],
+        systems
+            [(system_id, name, x, y, z)],
+        stations
+            [(station_id, name, system_id, ls_from_star, max_pad_size, planetary)],
+        markets
+            {station_id: [(item_id, demand_price, demand_units, demand_level,
+            supply_price, supply_units, supply_level)]}
+    """
+    
+    def __init__(self, spec: GalaxySpec, templateDir = None):
+        self.spec = spec
+        rng = random.Random(spec.seed)
+        templateDir = Path(templateDir or TradeEnv().templateDir)
+        with (templateDir / "Category.csv").open("r", encoding = "utf-8") as fh:
+            rows = list(csv.reader(fh, quotechar = "'"))
+        self.categories = [(int(row[0]), row[1]) for row in rows[1:]]
+        
+        # Items use their fdev_id as their item_id, as current data does.
+        itemNames = [
+            "{} {}".format(adjective, noun)
+            for noun in itemNouns for adjective in itemAdjectives
+        ]
+        rng.shuffle(itemNames)
+        while len(itemNames) < spec.items:
+            itemNames.append("{} {}".format(spellName(rng, 3), rng.choice(itemNouns)))
+            itemNames = list(dict.fromkeys(itemNames))
+        self.items = [
+            (128049152 + idx, name, rng.choice(self.categories)[0], rng.randint(100, 10000))
+            for idx, name in enumerate(itemNames[:spec.items])
+        ]
+        
+        systemNames = set()
+        self.systems = []
+        for systemID in range(1, spec.systems + 1):
+            name = "{} {}".format(spellName(rng, rng.randint(2, 3)), rng.randint(1, 999))
+            while name in systemNames:
+                name = "{} {}".format(spellName(rng, 3), rng.randint(1, 9999))
+            systemNames.add(name)
+            if rng.random() < 0.66:
+                pos = (rng.gauss(0, 40), rng.gauss(0, 20), rng.gauss(0, 40))
+            else:
+                pos = (rng.gauss(0, 2000), rng.gauss(0, 150), rng.gauss(0, 2000))
+            # Coordinates are published in 1/32ly units.
+            pos = tuple(round(coord * 32) / 32 for coord in pos)
+            self.systems.append((systemID, name) + pos)
+        
+        self.stations = []
+        stationNames = {}
+        for stationID in range(1, spec.stations + 1):
+            systemID = rng.choice(self.systems)[0]
+            names = stationNames.setdefault(systemID, set())
+            name = "{} {}".format(spellName(rng, 2), rng.choice(stationKinds))
+            while name in names:
+                name = "{} {}".format(spellName(rng, 3), rng.choice(stationKinds))
+            names.add(name)
+            self.stations.append((
+                stationID, name, systemID,
+                rng.randint(10, 200000), rng.choice('SML'), rng.random() < 0.3,
+            ))
+        
+        self.markets = {}
+        perStation = max(1, int(len(self.items) * spec.density))
+        for stationID, *_ in self.stations:
+            entries = []
+            for itemID, _, _, avgPrice in sorted(rng.sample(self.items, perStation)):
+                demandPrice = int(avgPrice * rng.uniform(0.85, 1.35))
+                if rng.random() < 0.4:
+                    supplyPrice = int(avgPrice * rng.uniform(0.6, 0.95))
+                    supplyUnits, supplyLevel = rng.randint(1, 20000), rng.randint(1, 3)
+                else:
+                    supplyPrice, supplyUnits, supplyLevel = 0, 0, 0
+                entries.append((
+                    itemID, demandPrice, rng.randint(0, 50000), rng.randint(1, 3),
+                    supplyPrice, supplyUnits, supplyLevel,
+                ))
+            self.markets[stationID] = entries
+    
+    def writeTradeDangerous(self, dataDir: Path, templateDir = None) -> None:
+        """
+        Writes the .sql, .csv and .prices files that buildCache reads
+        into dataDir.
+        """
+        dataDir.mkdir(parents = True, exist_ok = True)
+        templateDir = Path(templateDir or TradeEnv().templateDir)
+        for name in ("TradeDangerous.sql", "Added.csv", "Category.csv"):
+            shutil.copy(templateDir / name, dataDir / name)
+        # Template rare items refer to real stations we don't have.
+        with (templateDir / "RareItem.csv").open("r", encoding = "utf-8") as fh:
+            rareHeader = fh.readline()
+        (dataDir / "RareItem.csv").write_text(rareHeader, encoding = "utf-8")
+        
+        modified = galaxyTime.strftime("%Y-%m-%d %H:%M:%S")
+        
+        def writeTable(name, header, rows):
+            with (dataDir / name).open("w", encoding = "utf-8", newline = "") as fh:
+                fh.write(header + "\n")
+                for row in rows:
+                    fh.write(",".join(
+                        "'{}'".format(col) if isinstance(col, str) else str(col) for col in row
+                    ) + "\n")
+        
+        uiOrder = {}
+        itemRows = []
+        for itemID, name, categoryID, avgPrice in sorted(self.items, key = lambda item: (item[2], item[1])):
+            uiOrder[categoryID] = uiOrder.get(categoryID, 0) + 1
+            itemRows.append((itemID, name, categoryID, uiOrder[categoryID], avgPrice, itemID))
+        writeTable(
+            "Item.csv",
+            "unq:item_id,name,category_id@Category.category_id,ui_order,avg_price,fdev_id",
+            itemRows,
+        )
+        writeTable(
+            "System.csv",
+            "unq:system_id,name,pos_x,pos_y,pos_z,name@Added.added_id,modified",
+            ((ID, name, x, y, z, '', modified) for ID, name, x, y, z in self.systems),
+        )
+        writeTable(
+            "Station.csv",
+            "unq:station_id,name,system_id@System.system_id,ls_from_star,blackmarket,"
+            "max_pad_size,market,shipyard,modified,outfitting,rearm,refuel,repair,"
+            "planetary,type_id",
+            (
+                (
+                    ID, name, systemID, ls, 'N', pad, 'Y', 'N', modified,
+                    'N', 'Y', 'Y', 'Y', 'Y' if planetary else 'N', 11 if planetary else 2,
+                )
+                for ID, name, systemID, ls, pad, planetary in self.stations
+            ),
+        )
+        
+        systemNames = {ID: name for ID, name, *_ in self.systems}
+        itemByID = {item[0]: item for item in self.items}
+        categoryNames = dict(self.categories)
+        with (dataDir / "TradeDangerous.prices").open("w", encoding = "utf-8") as fh:
+            for ID, name, systemID, *_ in self.stations:
+                fh.write("\n@ {}/{}\n".format(systemNames[systemID].upper(), name))
+                entries = sorted(
+                    self.markets[ID],
+                    key = lambda entry: (itemByID[entry[0]][2], itemByID[entry[0]][1]),
+                )
+                categoryID = None
+                for itemID, dmPrice, dmUnits, dmLevel, spPrice, spUnits, spLevel in entries:
+                    _, itemName, itemCategory, _ = itemByID[itemID]
+                    if itemCategory != categoryID:
+                        categoryID = itemCategory
+                        fh.write("   + {}\n".format(categoryNames[categoryID]))
+                    supply = "{}{}".format(spUnits, levelSuffix[spLevel]) if spPrice else "-"
+                    fh.write("      {:<30} {:>8} {:>7} {:>10} {:>9}  {}\n".format(
+                        itemName, dmPrice, spPrice,
+                        "{}{}".format(dmUnits, levelSuffix[dmLevel]), supply, modified,
+                    ))
+    
+    def writeSpanshDump(self, path: Path) -> None:
+        """ Writes the galaxy as a spansh galaxy_stations.json dump. """
+        updated = galaxyTime.strftime("%Y-%m-%d %H:%M:%S+00")
+        itemByID = {item[0]: item for item in self.items}
+        categoryNames = dict(self.categories)
+        stationsBySystem = {}
+        for station in self.stations:
+            stationsBySystem.setdefault(station[2], []).append(station)
+        with path.open("w", encoding = "utf-8") as fh:
+            fh.write("[\n")
+            for idx, (systemID, name, x, y, z) in enumerate(self.systems):
+                stations = []
+                for stationID, stationName, _, ls, pad, planetary in stationsBySystem.get(systemID, ()):
+                    stations.append({
+                        "id": stationID,
+                        "name": stationName,
+                        "distanceToArrival": ls,
+                        "type": "Planetary Port" if planetary else "Coriolis Starport",
+                        "services": ["Market", "Refuel", "Repair", "Restock"],
+                        "landingPads": {
+                            "large": int(pad == 'L'), "medium": int(pad == 'M'), "small": 1,
+                        },
+                        "updateTime": updated,
+                        "market": {
+                            "updateTime": updated,
+                            "commodities": [
+                                {
+                                    "commodityId": itemID,
+                                    "name": itemByID[itemID][1],
+                                    "category": categoryNames[itemByID[itemID][2]],
+                                    "demand": dmUnits,
+                                    "supply": spUnits,
+                                    "sellPrice": dmPrice,
+                                    "buyPrice": spPrice,
+                                }
+                                for itemID, dmPrice, dmUnits, _, spPrice, spUnits, _ in self.markets[stationID]
+                            ],
+                        },
+                    })
+                system = {
+                    "id64": systemID,
+                    "name": name,
+                    "coords": {"x": x, "y": y, "z": z},
+                    "date": updated,
+                    "stations": stations,
+                }
+                fh.write(json.dumps(system) + (",\n" if idx + 1 < len(self.systems) else "\n"))
+            fh.write("]\n")
+    
+    def writeListings(self, path: Path, collected = listingsTime) -> None:
+        """ Writes the markets as an eddblink listings.csv. """
+        collectedAt = int(collected.replace(tzinfo = datetime.timezone.utc).timestamp())
+        with path.open("w", encoding = "utf-8", newline = "") as fh:
+            writer = csv.writer(fh)
+            writer.writerow((
+                "id", "station_id", "commodity_id", "supply", "supply_bracket", "buy_price",
+                "sell_price", "demand", "demand_bracket", "collected_at",
+            ))
+            rowID = 0
+            for stationID, entries in self.markets.items():
+                for itemID, dmPrice, dmUnits, dmLevel, spPrice, spUnits, spLevel in entries:
+                    rowID += 1
+                    writer.writerow((
+                        rowID, stationID, itemID, spUnits, spLevel or '', spPrice,
+                        dmPrice, dmUnits, dmLevel, collectedAt,
+                    ))
+
+
+class Stopwatch:
+    """ Collects the wall-clock time of named stages. """
+    
+    def __init__(self, tdenv):
+        self.tdenv = tdenv
+        self.timings = {}
+    
+    @contextmanager
+    def stage(self, name):
+        self.tdenv.NOTE("Benchmarking {}", name, stderr = True)
+        started = time.perf_counter()
+        yield
+        self.timings[name] = round(time.perf_counter() - started, 4)
+        self.tdenv.DEBUG0("{}: {:.4f}s", name, self.timings[name])
+
+
+def gitRevision() -> Optional[str]:
+    """ Returns the commit of the source tree, if it is a git checkout. """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd = Path(__file__).parent, capture_output = True, text = True, check = True,
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(spec: GalaxySpec, workDir: Path, tdenv: TradeEnv, skip = ()) -> dict:
+    """
+    Generates the galaxy described by spec under workDir, then times
+    each of the stageNames not listed in skip against it.
+    
+    Returns a JSON-serialisable dict of the spec, environment, counts
+    and {stage: seconds} timings.
+    """
+    # Imported here so "bench" doesn't slow down every other command.
+    from . import cache
+    from .tradecalc import Route, TradeCalc
+    from .tradedb import AmbiguityError, TradeDB
+    
+    workDir = Path(workDir)
+    galaxy = SyntheticGalaxy(spec, tdenv.templateDir)
+    watch = Stopwatch(tdenv)
+    rng = random.Random(spec.seed)
+    
+    def distanceFromOrigin(system):
+        return (system.posX ** 2 + system.posY ** 2 + system.posZ ** 2) ** 0.5
+    
+    def stageEnv(name, **kwargs):
+        dataDir = workDir / name
+        dataDir.mkdir(parents = True, exist_ok = True)
+        return TradeEnv(
+            debug = tdenv.debug, detail = tdenv.detail, quiet = tdenv.quiet,
+            dataDir = str(dataDir), csvDir = str(dataDir),
+            tmpDir = str(workDir / "tmp"), templateDir = tdenv.templateDir,
+            **kwargs,
+        )
+    
+    # Every later stage needs the database, so it is always built.
+    env = stageEnv("td")
+    galaxy.writeTradeDangerous(Path(env.dataDir), tdenv.templateDir)
+    tdb = TradeDB(env, load = False)
+    with watch.stage('buildCache'):
+        cache.buildCache(tdb, env)
+    
+    runEnv = stageEnv(
+        "td",
+        capacity = 100, credits = 10_000_000, maxJumpsPer = 2, maxLyPer = 15.0,
+        maxSystemLinkLy = 15.0, minGainPerTon = 1, maxGainPerTon = 0,
+        margin = 0.0, insurance = 0, lsPenalty = 12.5, maxLs = 0,
+        avoidItems = [], avoidPlaces = [],
+    )
+    with watch.stage('TradeDB.load'):
+        tdb = TradeDB(runEnv, tables = tuple(TradeDB.lazyTables))
+    
+    calc = None
+    if 'TradeCalc.load' not in skip or 'getBestHops' not in skip:
+        with watch.stage('TradeCalc.load'):
+            calc = TradeCalc(tdb, runEnv)
+    
+    counts = {
+        'systems': len(tdb.systemByID),
+        'stations': len(tdb.stationByID),
+        'items': len(tdb.itemByID),
+        'stationItems': sum(len(entries) for entries in galaxy.markets.values()),
+    }
+    
+    if 'getBestHops' not in skip:
+        # Start from the busiest market nearest the middle of the bubble.
+        origin = min(
+            (stn for stn in tdb.stationByID.values() if stn.ID in calc.stationsSelling),
+            key = lambda stn: (int(distanceFromOrigin(stn.system) // 50), -stn.itemCount),
+        )
+        routes = [Route((origin,), (), runEnv.credits, 0, (), 0)]
+        with watch.stage('getBestHops'):
+            for _ in range(3):
+                routes = calc.getBestHops(routes) if routes else routes
+                routes.sort()
+                routes = routes[:1000]
+        counts['routes'] = len(routes)
+    
+    bubble = [
+        system for system in tdb.systemByID.values() if distanceFromOrigin(system) < 80
+    ] or list(tdb.systemByID.values())
+    
+    if 'getRoute' not in skip:
+        pairs = [(rng.choice(bubble), rng.choice(bubble)) for _ in range(25)]
+        with watch.stage('getRoute'):
+            found = sum(1 for src, dst in pairs if tdb.getRoute(src, dst, 15.0))
+        counts['routesFound'] = found
+    
+    if 'lookupPlace' not in skip:
+        stations = list(tdb.stationByID.values())
+        names = []
+        for _ in range(1000):
+            station = rng.choice(stations)
+            names.append(rng.choice((
+                station.system.dbname,
+                station.dbname,
+                "{}/{}".format(station.system.dbname, station.dbname),
+                "{}/{}".format(station.system.dbname[:4], station.dbname[:4]),
+            )))
+        with watch.stage('lookupPlace'):
+            matched = 0
+            for name in names:
+                try:
+                    tdb.lookupPlace(name)
+                    matched += 1
+                except (AmbiguityError, LookupError):
+                    pass
+        counts['lookups'] = len(names)
+        counts['lookupsMatched'] = matched
+    tdb.close()
+    
+    if 'spansh' not in skip:
+        from .plugins import spansh_plug
+        dumpPath = workDir / "galaxy_stations.json"
+        galaxy.writeSpanshDump(dumpPath)
+        env = stageEnv("spansh", pluginOptions = ["file={}".format(dumpPath)], cwDir = str(workDir))
+        galaxy.writeTradeDangerous(Path(env.dataDir), tdenv.templateDir)
+        for name in ("System.csv", "Station.csv", "TradeDangerous.prices"):
+            (Path(env.dataDir) / name).unlink()
+        spanshDB = TradeDB(env, load = False)
+        plugin = spansh_plug.ImportPlugin(spanshDB, env)
+        with watch.stage('spansh'):
+            plugin.run()
+        spanshDB.close()
+    
+    if 'eddblink' not in skip:
+        from .plugins import eddblink_plug
+        env = stageEnv("eddblink")
+        dataDir = Path(env.dataDir)
+        for path in (workDir / "td").iterdir():
+            if path.is_file():
+                shutil.copy(path, dataDir / path.name)
+        galaxy.writeListings(dataDir / "listings.csv")
+        eddbDB = TradeDB(env, load = False)
+        plugin = eddblink_plug.ImportPlugin(eddbDB, env)
+        plugin.dataPath = str(dataDir)
+        with watch.stage('eddblink'):
+            plugin.importListings(plugin.listingsPath)
+        eddbDB.close()
+    
+    return {
+        'spec': spec.asDict(),
+        'version': __version__,
+        'commit': gitRevision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': datetime.datetime.now().isoformat(timespec = 'seconds'),
+        'counts': counts,
+        'timings': watch.timings,
+    }
+
+
+def writeResults(results: dict, path: Path) -> None:
+    """ Saves benchmark results as JSON. """
+    with Path(path).open("w", encoding = "utf-8") as fh:
+        json.dump(results, fh, indent = 2)
+        fh.write("\n")
+
+
+def readResults(path: Path) -> dict:
+    """ Loads benchmark results saved by writeResults. """
+    with Path(path).open("r", encoding = "utf-8") as fh:
+        return json.load(fh)
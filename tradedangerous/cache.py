@@ -24,6 +24,7 @@ from __future__ import annotations
 
 from pathlib import Path
 import csv
+import hashlib
 import os
 import re
 import sqlite3
@@ -709,6 +710,8 @@ def processPricesFile(tdenv: TradeEnv, db: sqlite3.Connection, pricesPath: Path,
              ")"
     )
     
+    updateMarketSummary(db)
+    
     tdenv.DEBUG0('Committing...')
     db.commit()
     db.close()
@@ -780,7 +783,7 @@ def deprecationCheckItem(importPath, lineNo, line):
     )
 
 
-def processImportFile(tdenv, db, importPath, tableName, *, line_callback: Optional[Callable] = None, call_args: Optional[dict] = None):
+def processImportFile(tdenv, db, importPath, tableName, *, line_callback: Optional[Callable] = None, call_args: Optional[dict] = None, commit: bool = True):
     tdenv.DEBUG0(
         "Processing import file '{}' for table '{}'",
         str(importPath), tableName
@@ -937,7 +940,8 @@ def processImportFile(tdenv, db, importPath, tableName, *, line_callback: Option
                             lineNo,
                             ', '.join(linein)
                 )
-        db.commit()
+        if commit:
+            db.commit()
         tdenv.DEBUG0("{count} {table}s imported",
                             count = importCount,
                             table = tableName)
@@ -1007,6 +1011,8 @@ def buildCache(tdb, tdenv):
         prog.increment(1)
         
         with prog.sub_task(description="Save DB"):
+            writeImportStamps(tempDB, tdb.importTables)
+            ensureMarketSummary(tempDB)
             tempDB.commit()
     
     # Parse the prices file
@@ -1033,6 +1039,262 @@ def buildCache(tdb, tdenv):
     
     tdenv.DEBUG0("Finished")
 
+
+######################################################################
+# Station market summary
+#
+# Loading the stations needs each station's item count and the age of
+# its prices. Rather than aggregate every StationItem row each time,
+# StationMarketSummary keeps those figures per station. Triggers record
+# the stations whose prices change in StationMarketDirty, whichever
+# importer changes them, and updateMarketSummary() recounts just those
+# stations. Readers fold in any stations still marked dirty, so the
+# summary is never stale, only slower to read until it is updated.
+
+marketSummarySchema = (
+    """
+    CREATE TABLE IF NOT EXISTS StationMarketSummary
+     (
+       station_id INTEGER PRIMARY KEY,
+       item_count INTEGER NOT NULL,
+       min_modified INTEGER NOT NULL,
+       max_modified INTEGER NOT NULL,
+       avg_modified REAL NOT NULL
+     )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS StationMarketDirty
+     (
+       station_id INTEGER PRIMARY KEY
+     )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS StationItem_summary_insert
+     AFTER INSERT ON StationItem
+     BEGIN
+       INSERT OR IGNORE INTO StationMarketDirty VALUES (NEW.station_id);
+     END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS StationItem_summary_update
+     AFTER UPDATE OF station_id, modified ON StationItem
+     BEGIN
+       INSERT OR IGNORE INTO StationMarketDirty VALUES (OLD.station_id);
+       INSERT OR IGNORE INTO StationMarketDirty VALUES (NEW.station_id);
+     END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS StationItem_summary_delete
+     AFTER DELETE ON StationItem
+     BEGIN
+       INSERT OR IGNORE INTO StationMarketDirty VALUES (OLD.station_id);
+     END
+    """,
+)
+
+
+def ensureMarketSummary(db: sqlite3.Connection) -> None:
+    """
+    Adds the market summary tables and triggers to a database that
+    doesn't have them yet, counting every station's prices.
+    """
+    exists = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StationMarketSummary'"
+    ).fetchone()
+    if exists:
+        return
+    for stmt in marketSummarySchema:
+        db.execute(stmt)
+    db.execute("INSERT INTO StationMarketDirty SELECT DISTINCT station_id FROM StationItem")
+    updateMarketSummary(db)
+
+
+def updateMarketSummary(db: sqlite3.Connection) -> None:
+    """
+    Recounts the summary of the stations whose prices have changed;
+    the caller commits.
+    """
+    ensureMarketSummary(db)
+    db.execute("""
+        DELETE FROM StationMarketSummary
+         WHERE station_id IN (SELECT station_id FROM StationMarketDirty)
+    """)
+    db.execute("""
+        INSERT INTO StationMarketSummary (
+            station_id, item_count, min_modified, max_modified, avg_modified
+        )
+        SELECT  station_id, COUNT(*),
+                MIN(CAST(strftime('%s', modified) AS INTEGER)),
+                MAX(CAST(strftime('%s', modified) AS INTEGER)),
+                AVG((JULIANDAY(modified) - 2440587.5) * 86400.0)
+          FROM  StationItem
+         WHERE  station_id IN (SELECT station_id FROM StationMarketDirty)
+         GROUP  BY station_id
+    """)
+    db.execute("DELETE FROM StationMarketDirty")
+
+######################################################################
+# Item order
+
+
+def updateItemOrder(db: sqlite3.Connection) -> int:
+    """
+    Numbers the items of each category by name, as the game lists them,
+    in Item.ui_order. Importers that add items call this once they have
+    added them all. Only the items whose position changed are written;
+    returns how many that was. The caller commits.
+    """
+    changes = []
+    lastCategory, order = None, 0
+    for itemID, categoryID, uiOrder in db.execute(
+        "SELECT item_id, category_id, ui_order FROM Item ORDER BY category_id, name"
+    ):
+        order = order + 1 if categoryID == lastCategory else 1
+        lastCategory = categoryID
+        if order != uiOrder:
+            changes.append((order, itemID))
+    if changes:
+        db.executemany("UPDATE Item SET ui_order = ? WHERE item_id = ?", changes)
+    return len(changes)
+
+######################################################################
+# Incremental rebuilds
+
+
+def importFileStamp(path: Path) -> Optional[tuple[int, str]]:
+    """ Returns the size and SHA-1 of an import file, or None if it is missing. """
+    digest = hashlib.sha1()
+    try:
+        with path.open('rb') as fh:
+            for block in iter(lambda: fh.read(1 << 20), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return path.stat().st_size, digest.hexdigest()
+
+
+def writeImportStamps(db: sqlite3.Connection, importTables) -> None:
+    """
+    Records the stamp of each (path, table) in importTables, so that
+    changedImportTables can tell which files were edited since.
+    """
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS ImportStamp
+         (
+           table_name VARCHAR(40) PRIMARY KEY,
+           size INTEGER NOT NULL,
+           sha1 TEXT NOT NULL
+         )
+    """)
+    for importName, importTable in importTables:
+        stamp = importFileStamp(Path(importName))
+        if stamp is None:
+            db.execute("DELETE FROM ImportStamp WHERE table_name = ?", (importTable,))
+        else:
+            db.execute("INSERT OR REPLACE INTO ImportStamp VALUES (?, ?, ?)", (importTable, *stamp))
+
+
+def changedImportTables(tdb, importTables) -> list[str]:
+    """
+    Of the (path, table) pairs in importTables, whose files are newer
+    than the cache, returns the tables whose contents differ from when
+    they were imported.
+    """
+    try:
+        stamps = {
+            table: (size, sha1)
+            for table, size, sha1 in tdb.query("SELECT table_name, size, sha1 FROM ImportStamp")
+        }
+    except sqlite3.OperationalError:
+        # Built before import stamps existed.
+        stamps = {}
+    return [
+        importTable
+        for importName, importTable in importTables
+        if importFileStamp(Path(importName)) != stamps.get(importTable)
+    ]
+
+
+def dependentTables(db: sqlite3.Connection, tables) -> set[str]:
+    """
+    Returns 'tables' and every table whose foreign keys refer to them,
+    directly or through another table.
+    """
+    referrers = {}
+    for (name,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall():
+        for fkey in db.execute("PRAGMA foreign_key_list('{}')".format(name)).fetchall():
+            referrers.setdefault(fkey[2], set()).add(name)
+    
+    found, pending = set(), list(tables)
+    while pending:
+        table = pending.pop()
+        if table not in found:
+            found.add(table)
+            pending.extend(referrers.get(table, ()))
+    return found
+
+
+def updateCache(tdb, tdenv, tables) -> bool:
+    """
+    Re-imports 'tables' from their .csv files into the existing cache,
+    along with the tables that refer to them, in one transaction; if
+    StationItem is among them, the .prices file is re-read too.
+    
+    Falls back to buildCache if the update fails. Returns True if the
+    prices were re-read (or the cache rebuilt).
+    """
+    tdb.close()
+    db = sqlite3.connect(str(tdb.dbPath))
+    # The tables are refilled in dependency order, so nothing should
+    # cascade from clearing them.
+    db.execute("PRAGMA foreign_keys=OFF")
+    try:
+        rebuild = dependentTables(db, tables)
+        importTables = [(name, table) for name, table in tdb.importTables if table in rebuild]
+        reprice = "StationItem" in rebuild and tdb.pricesPath.exists()
+        tdenv.NOTE(
+            "Updating cache tables: {}", ", ".join(sorted(rebuild)),
+            stderr=True,
+        )
+        
+        for table in rebuild:
+            db.execute("DELETE FROM {}".format(table))
+        for importName, importTable in importTables:
+            try:
+                processImportFile(tdenv, db, Path(importName), importTable, commit=False)
+            except FileNotFoundError:
+                tdenv.DEBUG0("WARNING: processImportFile found no {} file", importName)
+            except StopIteration:
+                tdenv.NOTE(
+                    "{} exists but is empty. "
+                    "Remove it or add the column definition line.",
+                    importName
+                )
+        
+        orphans = db.execute("PRAGMA foreign_key_check").fetchall()
+        if orphans:
+            raise TradeException("{} rows refer to missing keys, e.g. {}".format(len(orphans), orphans[0]))
+        writeImportStamps(db, importTables)
+        
+        if reprice:
+            # Commits and closes the connection.
+            processPricesFile(tdenv, db, tdb.pricesPath)
+        else:
+            db.commit()
+            db.close()
+    except (sqlite3.Error, TradeException) as e:
+        db.rollback()
+        db.close()
+        tdenv.WARN("Couldn't update the cache in place ({}), rebuilding it.", e)
+        buildCache(tdb, tdenv)
+        return True
+    except BaseException:
+        db.rollback()
+        db.close()
+        raise
+    
+    return reprice
+
 ######################################################################
 
 
@@ -37,7 +37,6 @@ import traceback
 
 from . import commands
 from . import tradeexcept
-from .commands import exceptions
 from .plugins import PluginException
 
 from . import tradedb
@@ -93,29 +92,8 @@ def trade(argv):
     cmdIndex = commands.CommandIndex()
     cmdenv = cmdIndex.parse(argv)
     
-    tdb = tradedb.TradeDB(cmdenv, load=cmdenv.wantsTradeDB)
-    if cmdenv.usesTradeData:
-        tsc = tdb.tradingStationCount
-        if tsc == 0:
-            raise exceptions.NoDataError(
-                "There is no trading data for ANY station in "
-                "the local database. Please enter or import "
-                "price data."
-            )
-        if tsc == 1:
-            raise exceptions.NoDataError(
-                "The local database only contains trading data "
-                "for one station. Please enter or import data "
-                "for additional stations."
-            )
-        if tsc < 8:
-            cmdenv.NOTE(
-                "The local database only contains trading data "
-                "for {} stations. Please enter or import data "
-                "for additional stations.".format(
-                    tsc
-                )
-            )
+    tdb = tradedb.TradeDB(cmdenv, load=cmdenv.wantsTradeDB, tables=cmdenv.wantsTables)
+    cmdenv.checkTradingData(tdb)
     
     try:
         results = cmdenv.run(tdb)
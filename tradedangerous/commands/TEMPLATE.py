@@ -6,10 +6,11 @@ from formatting import RowFormat, ColumnFormat
 # Parser config
 
 help = 'Describe your command briefly here for the top-level --help.'
-name = 'TEMPLATE'       # name of your .py file excluding the _cmd
+name = 'TEMPLATE'       # name of your .py file excluding the _cmd (list it in commands.commandNames)
 epilog = None           # text to print at the bottom of --help
 wantsTradeDB = True     # Should we try to load the cache at startup?
 usesTradeData = True    # Will we be needing trading data?
+wantsTables = None      # TradeDB.lazyTables to load up front, e.g. ('System',)
 arguments = [
     #ParseArgument('near', help='System to start from', type=str),
 ]
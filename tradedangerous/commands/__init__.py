@@ -1,35 +1,61 @@
 from .commandenv import CommandEnv
+from collections.abc import Mapping
 from textwrap import TextWrapper
 
 import argparse  # For parsing command line args.
+import importlib
 import os
 import pathlib
-import sys
 
-thismodule = sys.modules[__name__]
 from . import exceptions
 from . import parsing
 
-from . import buildcache_cmd
-from . import buy_cmd
-from . import export_cmd
-from . import import_cmd
-from . import local_cmd
-from . import market_cmd
-from . import nav_cmd
-from . import olddata_cmd
-from . import rares_cmd
-from . import run_cmd
-from . import sell_cmd
-from . import shipvendor_cmd
-from . import station_cmd
-from . import trade_cmd
-from . import update_cmd
-
-commandIndex = {
-    cmd[0:cmd.find('_cmd')]: getattr(thismodule, cmd)
-    for cmd in thismodule.__dir__() if cmd.endswith("_cmd")
-}
+# Each command lives in "<name>_cmd.py"; add new commands here.
+commandNames = (
+    'bench',
+    'buildcache',
+    'buy',
+    'export',
+    'import',
+    'local',
+    'market',
+    'nav',
+    'olddata',
+    'rares',
+    'run',
+    'sell',
+    'serve',
+    'shipvendor',
+    'station',
+    'trade',
+    'update',
+)
+
+
+class LazyCommandIndex(Mapping):
+    """
+        Maps command names to their modules, importing each module
+        the first time it is looked up. Commands pull in heavy
+        dependencies of their own (rich, requests, plugins), so
+        running one command only pays for that command.
+    """
+    
+    def __init__(self, names):
+        self.names = tuple(names)
+    
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        return importlib.import_module('.{}_cmd'.format(name), __name__)
+    
+    def __iter__(self):
+        return iter(self.names)
+    
+    def __len__(self):
+        return len(self.names)
+
+
+commandIndex = LazyCommandIndex(commandNames)
 
 ######################################################################
 # Helpers
@@ -139,21 +165,11 @@ class CommandIndex:
                     "TradeDangerous provides a set of trade database "
                     "facilities for Elite:Dangerous.", self.usage(argv))
         
-        # ## TODO: Break this model up a bit more so that
-        # ## we just try and import the command you specify,
-        # ## and only worry about an index when that fails or
-        # ## the user requests usage.
-        cmdName, cmdModule = argv[1].casefold(), None
-        try:
-            cmdModule = commandIndex[cmdName]
-        except KeyError:
-            pass
-        
-        if not cmdModule:
-            candidates = []
-            for name, module in commandIndex.items():
-                if name.startswith(cmdName):
-                    candidates.append([name, module])
+        # Only the selected command gets imported; the whole index
+        # is only loaded when we have to show the usage.
+        cmdName = argv[1].casefold()
+        if cmdName not in commandIndex:
+            candidates = [name for name in commandIndex if name.startswith(cmdName)]
             if not candidates:
                 raise exceptions.CommandLineError(
                         "Unrecognized command, '{}'".format(cmdName),
@@ -164,12 +180,12 @@ class CommandIndex:
                         "Ambiguous command, '{}', "
                         "could match: {}".format(
                             cmdName,
-                            ', '.join(c[0] for c in candidates)
+                            ', '.join(candidates)
                         ),
                         self.usage(argv)
                 )
-            argv[1] = cmdName = candidates[0][0]
-            cmdModule = candidates[0][1]
+            argv[1] = cmdName = candidates[0]
+        cmdModule = commandIndex[cmdName]
         
         class ArgParser(argparse.ArgumentParser):
             
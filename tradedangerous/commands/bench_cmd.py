@@ -0,0 +1,162 @@
+from .commandenv import ResultRow
+from .exceptions import CommandLineError
+from .parsing import ParseArgument
+from ..bench import GalaxySpec, defaultSpec, readResults, runBenchmarks, stageNames, writeResults
+from ..tradedb import TradeDB
+
+from pathlib import Path
+import shutil
+import tempfile
+
+######################################################################
+# Parser config
+
+help = 'Time TradeDangerous against a generated synthetic galaxy.'
+name = 'bench'
+epilog = (
+    'The galaxy, and the databases built from it, are created in a '
+    'scratch directory so your own data is never touched. Save the '
+    'results with --output and pass them to --compare on a later run '
+    'to see what changed.'
+)
+wantsTradeDB = False
+usesTradeData = False
+arguments = [
+]
+switches = [
+    ParseArgument('--systems',
+        help = 'Number of star systems to generate.',
+        type = int,
+        metavar = 'N',
+        default = defaultSpec.systems,
+    ),
+    ParseArgument('--stations',
+        help = 'Number of stations to generate.',
+        type = int,
+        metavar = 'N',
+        default = defaultSpec.stations,
+    ),
+    ParseArgument('--items',
+        help = 'Number of trade items to generate.',
+        type = int,
+        metavar = 'N',
+        default = defaultSpec.items,
+    ),
+    ParseArgument('--density',
+        help = 'Fraction (0-1) of the items each station trades.',
+        type = float,
+        metavar = 'F',
+        default = defaultSpec.density,
+    ),
+    ParseArgument('--seed',
+        help = 'Random seed for the galaxy.',
+        type = int,
+        default = defaultSpec.seed,
+    ),
+    ParseArgument('--skip',
+        help = 'Skip a benchmark stage (buildCache always runs).',
+        action = 'append',
+        choices = [stage for stage in stageNames if stage != 'buildCache'],
+        default = [],
+    ),
+    ParseArgument('--output', '-o',
+        help = 'Write the results to this JSON file.',
+        metavar = 'FILE',
+        dest = 'outputFile',
+    ),
+    ParseArgument('--compare',
+        help = 'Compare the timings with results saved by an earlier --output.',
+        metavar = 'FILE',
+        dest = 'compareFile',
+    ),
+    ParseArgument('--work-dir',
+        help = 'Generate the galaxy here and keep it, instead of in a temporary directory.',
+        metavar = 'DIR',
+        dest = 'workDir',
+    ),
+]
+
+######################################################################
+# Perform query and populate result set
+
+
+def run(results, cmdenv, tdb: TradeDB):
+    spec = GalaxySpec(
+        systems = cmdenv.systems, stations = cmdenv.stations,
+        items = cmdenv.items, density = cmdenv.density, seed = cmdenv.seed,
+    )
+    if min(spec.systems, spec.stations, spec.items) < 1:
+        raise CommandLineError("--systems, --stations and --items must be at least 1.")
+    if not 0 < spec.density <= 1:
+        raise CommandLineError("--density must be more than 0 and at most 1.")
+    
+    baseline = None
+    if cmdenv.compareFile:
+        try:
+            baseline = readResults(cmdenv.compareFile)
+        except (OSError, ValueError) as e:
+            raise CommandLineError("Can't read --compare file {}: {}".format(cmdenv.compareFile, e))
+        if baseline.get('spec') != spec.asDict():
+            cmdenv.WARN("{} was measured with a different galaxy: {}", cmdenv.compareFile, baseline.get('spec'))
+    
+    if cmdenv.workDir:
+        workDir = Path(cmdenv.workDir)
+        if workDir.exists() and any(workDir.iterdir()):
+            raise CommandLineError("--work-dir {} must be empty.".format(workDir))
+        bench = runBenchmarks(spec, workDir, cmdenv, skip = cmdenv.skip)
+    else:
+        workDir = Path(tempfile.mkdtemp(prefix = "td-bench-"))
+        try:
+            bench = runBenchmarks(spec, workDir, cmdenv, skip = cmdenv.skip)
+        finally:
+            shutil.rmtree(workDir, ignore_errors = True)
+    
+    if cmdenv.outputFile:
+        writeResults(bench, cmdenv.outputFile)
+    
+    before = baseline.get('timings', {}) if baseline else {}
+    results.summary = ResultRow(bench = bench, baseline = baseline)
+    results.rows = [
+        ResultRow(stage = stage, seconds = seconds, before = before.get(stage))
+        for stage, seconds in bench['timings'].items()
+    ]
+    
+    return results
+
+######################################################################
+# Transform result set into output
+
+
+def render(results, cmdenv, tdb):
+    from ..formatting import RowFormat, ColumnFormat
+    
+    bench, baseline = results.summary.bench, results.summary.baseline
+    counts = bench['counts']
+    
+    rowFmt = RowFormat().append(
+        ColumnFormat("Stage", '<', 14, key = lambda row: row.stage)
+    ).append(
+        ColumnFormat("Seconds", '>', 10, '.4f', key = lambda row: row.seconds)
+    )
+    if baseline:
+        rowFmt.append(
+            ColumnFormat("Before", '>', 10, key = lambda row:
+                "{:.4f}".format(row.before) if row.before is not None else "-")
+        ).append(
+            ColumnFormat("Change", '>', 8, key = lambda row:
+                "{:+.1%}".format(row.seconds / row.before - 1) if row.before else "-")
+        )
+    
+    if not cmdenv.quiet:
+        print(
+            "{systems:n} systems, {stations:n} stations, {items:n} items, "
+            "{stationItems:n} prices".format(**counts)
+        )
+        heading, underline = rowFmt.heading()
+        print(heading, underline, sep = '\n')
+    
+    for row in results.rows:
+        print(rowFmt.format(row))
+    
+    if cmdenv.outputFile and not cmdenv.quiet:
+        print("Results saved to {}".format(cmdenv.outputFile))
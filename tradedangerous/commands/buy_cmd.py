@@ -20,6 +20,7 @@ help = 'Find places to buy a given item within range of a given station.'
 name = 'buy'
 epilog = None
 wantsTradeDB = True
+wantsTables = ('System', 'Item', 'Ship')
 arguments = (
     ParseArgument(
         'name',
@@ -175,7 +176,7 @@ def get_lookup_list(cmdenv, tdb):
     return queries, mode
 
 
-def sql_query(cmdenv, tdb, queries, mode):
+def sql_query(cmdenv, tdb, queries, mode, stationIDs = None):
     # Constraints
     idList = ','.join(str(ID) for ID in queries.keys())
     if mode is SHIP_MODE:
@@ -214,6 +215,9 @@ def sql_query(cmdenv, tdb, queries, mode):
             constraints.append("(supply_price > ?)")
             bindValues.append(cmdenv.gt)
     
+    if stationIDs is not None:
+        constraints.append("(s.station_id IN ({}))".format(','.join(str(ID) for ID in stationIDs)))
+    
     whereClause = ' AND '.join(constraints)
     stmt = """SELECT DISTINCT {columns} FROM {tables} WHERE {where}""".format(
         columns = ','.join(columns),
@@ -287,20 +291,37 @@ def run(results, cmdenv, tdb):
     stations = defaultdict(list)
     stationByID = tdb.stationByID
     
-    cur = sql_query(cmdenv, tdb, queries, mode)
+    # Measure and filter every candidate station in one pass if we can.
+    galaxy = tdb.galaxy
+    matches = galaxy and galaxy.matchStations(
+        nearSystem, maxLy if nearSystem else None, mls, (
+            ('maxPadSize', padSize),
+            ('planetary', planetary),
+            ('fleet', fleet),
+            ('odyssey', odyssey),
+            ('planetary', wantNoPlanet and 'N'),
+            ('blackMarket', wantBlackMarket and 'Y'),
+        ),
+    )
+    
+    # Only ask for the stations near enough.
+    cur = sql_query(cmdenv, tdb, queries, mode, matches if nearSystem else None)
     for (ID, stationID, price, units) in cur:
         station = stationByID[stationID]
-        if padSize and not station.checkPadSize(padSize):
+        if matches is not None:
+            if stationID not in matches:
+                continue
+        elif padSize and not station.checkPadSize(padSize):
             continue
-        if planetary and not station.checkPlanetary(planetary):
+        elif planetary and not station.checkPlanetary(planetary):
             continue
-        if fleet and not station.checkFleet(fleet):
+        elif fleet and not station.checkFleet(fleet):
             continue
-        if odyssey and not station.checkOdyssey(odyssey):
+        elif odyssey and not station.checkOdyssey(odyssey):
             continue
-        if wantNoPlanet and station.planetary != 'N':
+        elif wantNoPlanet and station.planetary != 'N':
             continue
-        if wantBlackMarket and station.blackMarket != 'Y':
+        elif wantBlackMarket and station.blackMarket != 'Y':
             continue
         if station in avoidStations:
             continue
@@ -312,15 +333,19 @@ def run(results, cmdenv, tdb):
         
         row = ResultRow()
         row.station = station
-        if mls:
-            distanceFromStar = station.lsFromStar
-            if distanceFromStar > mls:
-                continue
-        if distanceFn:
-            distance = distanceFn(row.station.system)
-            if distance > maxLy:
-                continue
-            row.dist = distance
+        if matches is not None:
+            if distanceFn:
+                row.dist = matches[stationID]
+        else:
+            if mls:
+                distanceFromStar = station.lsFromStar
+                if distanceFromStar > mls:
+                    continue
+            if distanceFn:
+                distance = distanceFn(row.station.system)
+                if distance > maxLy:
+                    continue
+                row.dist = distance
         row.item = queries[ID]
         row.price = price
         row.units = units
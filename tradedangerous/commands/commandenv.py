@@ -1,7 +1,7 @@
 import sqlite3
 
 from .exceptions import (
-    CommandLineError, FleetCarrierError, OdysseyError,
+    CommandLineError, FleetCarrierError, NoDataError, OdysseyError,
     PadSizeError, PlanetaryError,
 )
 from ..tradedb import AmbiguityError, Station
@@ -49,9 +49,14 @@ class CommandEnv(TradeEnv):
         if self.detail and self.quiet:
             raise CommandLineError("'--detail' (-v) and '--quiet' (-q) are mutually exclusive.")
         
+        # Records streamed to stdout mustn't be mixed with notes.
+        if self.stream:
+            self.console = self.stderr
+        
         self._cmd = cmdModule or getattr("__main__")
         self.wantsTradeDB = getattr(cmdModule, 'wantsTradeDB', True)
         self.usesTradeData = getattr(cmdModule, 'usesTradeData', False)
+        self.wantsTables = getattr(cmdModule, 'wantsTables', None)
         
         # We need to relocate to the working directory so that
         # we can load a TradeDB after this without things going
@@ -66,6 +71,53 @@ class CommandEnv(TradeEnv):
         if self.cwd:
             os.chdir(self.cwd)
     
+    # "trade.py serve" sets this to lend commands its warm TradeCalcs,
+    # see tradeCalc().
+    calcPool = None
+    
+    def checkTradingData(self, tdb):
+        """
+            Raises NoDataError if the command needs trading data and
+            the database doesn't have enough stations with prices.
+        """
+        if not self.usesTradeData:
+            return
+        tsc = tdb.tradingStationCount
+        if tsc == 0:
+            raise NoDataError(
+                "There is no trading data for ANY station in "
+                "the local database. Please enter or import "
+                "price data."
+            )
+        if tsc == 1:
+            raise NoDataError(
+                "The local database only contains trading data "
+                "for one station. Please enter or import data "
+                "for additional stations."
+            )
+        if tsc < 8:
+            self.NOTE(
+                "The local database only contains trading data "
+                "for {} stations. Please enter or import data "
+                "for additional stations.".format(
+                    tsc
+                )
+            )
+    
+    def tradeCalc(self, tdb, **kwargs):
+        """
+            Returns the TradeCalc a command should use: one sharing
+            the prices of a warm TradeCalc from calcPool when there is
+            one for our options, otherwise a new TradeCalc(tdb, self,
+            **kwargs).
+        """
+        if self.calcPool is not None:
+            calc = self.calcPool.get(self)
+            if calc is not None:
+                return calc
+        from ..tradecalc import TradeCalc
+        return TradeCalc(tdb, self, **kwargs)
+    
     def run(self, tdb):
         """
             Set the current database context for this env and check that
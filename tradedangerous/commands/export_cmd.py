@@ -101,6 +101,7 @@ def run(results, cmdenv, tdb):
                                         FROM sqlite_master
                                        WHERE type = 'table'
                                          AND name NOT LIKE 'sqlite_%'
+                                         AND name NOT IN ('ImportStamp', 'StationMarketSummary', 'StationMarketDirty')
                                              {cmdTables}
                                        ORDER BY name
                                    """.format(cmdTables=tableStmt),
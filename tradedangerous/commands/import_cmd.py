@@ -121,7 +121,15 @@ def run(results, cmdenv, tdb):
         # Run the plugin. If it returns False, then it did everything
         # that needs doing and we can stop now.
         # If it returns True, it is returning control to the module.
-        if not plugin.run():
+        keepGoing = plugin.run()
+        
+        # Plugins write StationItem directly; recount the stations
+        # whose prices they changed.
+        db = tdb.getDB()
+        cache.updateMarketSummary(db)
+        db.commit()
+        
+        if not keepGoing:
             return None
     
     tdb.reloadCache()
@@ -17,6 +17,7 @@ name='local'
 help='Calculate local systems.'
 epilog="See also the 'station' sub-command."
 wantsTradeDB=True
+wantsTables=('System',)
 arguments = [
     ParseArgument(
             'near',
@@ -95,7 +96,31 @@ def run(results, cmdenv, tdb):
     wantRefuel = cmdenv.refuel
     wantRepair = cmdenv.repair
     
+    galaxy = tdb.galaxy
+    if galaxy is not None and (showStations or wantStations):
+        # Test the stations of every system in range in one pass.
+        stationRows = galaxy.stationRowsOf([galaxy.systemRow[system.ID] for system in distances])
+        passed = stationRows[galaxy.stationMask(stationRows, wants=(
+            ('planetary', wantNoPlanet and 'N'),
+            ('blackMarket', wantBlackMarket and 'Y'),
+            ('shipyard', wantShipYard and 'Y'),
+            ('maxPadSize', padSize),
+            ('planetary', planetary),
+            ('fleet', fleet),
+            ('odyssey', odyssey),
+            ('outfitting', wantOutfitting and 'Y'),
+            ('rearm', wantRearm and 'Y'),
+            ('refuel', wantRefuel and 'Y'),
+            ('repair', wantRepair and 'Y'),
+        ), trading=wantTrading)]
+        matched = set(galaxy.stationIDs[passed].tolist())
+    else:
+        matched = None
+    
     def station_filter(stations):
+        if matched is not None:
+            yield from (station for station in stations if station.ID in matched)
+            return
         for station in stations:
             if wantNoPlanet and station.planetary != 'N':
                 continue
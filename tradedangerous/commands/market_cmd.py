@@ -13,6 +13,7 @@ help='Lists items bought/sold at a given station.'
 name='market'
 epilog=None
 wantsTradeDB=True
+wantsTables=('System', 'Item')
 arguments = [
     ParseArgument(
         'origin',
@@ -14,6 +14,7 @@ help='Calculate a route between two systems.'
 name='nav'
 epilog=None
 wantsTradeDB=True
+wantsTables=('System',)
 arguments = [
     ParseArgument('starting', help='System to start from', type=str),
     ParseArgument('ending', help='System to end at', type=str),
@@ -13,6 +13,7 @@ name='olddata'
 help='Show oldest data in database.'
 epilog=None
 wantsTradeDB=True
+wantsTables=('System',)
 arguments = [
 ]
 switches = [
@@ -85,8 +86,31 @@ def run(results, cmdenv, tdb):
             .format(cmdenv.minAge)
         )
     
+    padSize = cmdenv.padSize
+    planetary = cmdenv.planetary
+    fleet = cmdenv.fleet
+    odyssey = cmdenv.odyssey
+    noPlanet = cmdenv.noPlanet
+    mls = cmdenv.maxLs
+    
+    # Measure and filter every station in one pass if we can.
     nearSys = cmdenv.nearSystem
-    if nearSys:
+    galaxy = tdb.galaxy
+    matches = galaxy and galaxy.matchStations(
+        nearSys, (cmdenv.maxLyPer or tdb.maxSystemLinkLy) if nearSys else None, mls, (
+            ('maxPadSize', padSize),
+            ('planetary', planetary),
+            ('fleet', fleet),
+            ('odyssey', odyssey),
+            ('planetary', noPlanet and 'N'),
+        ),
+    )
+    
+    if nearSys and matches is not None:
+        # Only look at the stations near enough.
+        wheres.append("(si.station_id IN ({}))".format(','.join(str(ID) for ID in matches)))
+        fields.append("0")
+    elif nearSys:
         maxLy = cmdenv.maxLyPer or tdb.maxSystemLinkLy
         maxLy2 = maxLy ** 2
         fields.append(
@@ -150,13 +174,6 @@ def run(results, cmdenv, tdb):
     
     cmdenv.DEBUG1(stmt)
     
-    padSize = cmdenv.padSize
-    planetary = cmdenv.planetary
-    fleet = cmdenv.fleet
-    odyssey = cmdenv.odyssey
-    noPlanet = cmdenv.noPlanet
-    mls = cmdenv.maxLs
-    
     for (stnID, age, ls, dist2) in tdb.query(stmt):
         cmdenv.DEBUG2("{}:{}:{}", stnID, age, ls)
         row = ResultRow()
@@ -167,7 +184,12 @@ def run(results, cmdenv, tdb):
         else:
             row.ls = "?"
         row.dist = dist2 ** 0.5
-        if not padSize or row.station.checkPadSize(padSize):
+        if matches is not None:
+            if stnID in matches:
+                if nearSys:
+                    row.dist = matches[stnID]
+                results.rows.append(row)
+        elif not padSize or row.station.checkPadSize(padSize):
             if not planetary or row.station.checkPlanetary(planetary):
                 if not fleet or row.station.checkFleet(fleet):
                     if not odyssey or row.station.checkOdyssey(odyssey):
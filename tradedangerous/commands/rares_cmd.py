@@ -20,6 +20,7 @@ epilog=None
 # Set to False in commands that need to operate without
 # a trade database.
 wantsTradeDB=True
+wantsTables=('System', 'RareItem')
 # Required parameters
 arguments = [
     ParseArgument(
@@ -162,29 +163,47 @@ def run(results, cmdenv, tdb):
     
     distCheckFn = start.distanceTo
     
+    # Measure and filter the rare stations in one pass if we can.
+    galaxy = tdb.galaxy
+    matches = galaxy and galaxy.matchStations(
+        start, maxLy if maxLy > 0. else None, None, (
+            ('maxPadSize', padSize),
+            ('planetary', planetary),
+            ('fleet', fleet),
+            ('odyssey', odyssey),
+            ('planetary', noPlanet and 'N'),
+        ),
+        among={rare.station.ID for rare in tdb.rareItemByID.values()},
+    )
+    
     # Look through the rares list.
     for rare in tdb.rareItemByID.values():
         if rare.illegal not in wantIllegality:
             continue
-        if padSize:       # do we care about pad size?
-            if not rare.station.checkPadSize(padSize):
-                continue
-        if planetary:     # do we care about planetary?
-            if not rare.station.checkPlanetary(planetary):
+        rareSys = rare.station.system
+        if matches is not None:
+            dist = matches.get(rare.station.ID)
+            if dist is None:
                 continue
-        if fleet:         # do we care about fleet carrier?
-            if not rare.station.checkFleet(fleet):
+        else:
+            if padSize:       # do we care about pad size?
+                if not rare.station.checkPadSize(padSize):
+                    continue
+            if planetary:     # do we care about planetary?
+                if not rare.station.checkPlanetary(planetary):
+                    continue
+            if fleet:         # do we care about fleet carrier?
+                if not rare.station.checkFleet(fleet):
+                    continue
+            if odyssey:         # do we care about Odyssey?
+                if not rare.station.checkOdyssey(odyssey):
+                    continue
+            if noPlanet and rare.station.planetary != 'N':
                 continue
-        if odyssey:         # do we care about Odyssey?
-            if not rare.station.checkOdyssey(odyssey):
+            # Find the un-sqrt'd distance to the system.
+            dist = distCheckFn(rareSys)
+            if maxLy > 0. and dist > maxLy:
                 continue
-        if noPlanet and rare.station.planetary != 'N':
-            continue
-        rareSys = rare.station.system
-        # Find the un-sqrt'd distance to the system.
-        dist = distCheckFn(rareSys)
-        if maxLy > 0. and dist > maxLy:
-            continue
         
         if awaySystems:
             awayCheck = rareSys.distanceTo
@@ -5,11 +5,15 @@ from .parsing import (
     NoPlanetSwitch, OdysseyArgument, PadSizeArgument, ParseArgument,
     PlanetaryArgument,
 )
+from collections import defaultdict
 from itertools import chain
 from ..tradedb import TradeDB, System, Station, describeAge
-from ..tradecalc import TradeCalc, Route, NoHopsError
+from ..tradecalc import Route, NoHopsError
 
+import heapq
+import json
 import math
+import os
 import sys
 
 
@@ -20,6 +24,7 @@ help = 'Calculate best trade run.'
 name = 'run'
 epilog = None
 usesTradeData = True
+wantsTables = ('System', 'Item')
 
 arguments = [
     ParseArgument('--capacity',
@@ -259,6 +264,45 @@ switches = [
         help = '(Requires --to) Find the shortest route with the best gpt.',
         action = 'store_true',
     ),
+    ParseArgument('--columnar',
+        help = 'Use a numpy station x item price matrix to find trades (requires numpy).',
+        action = 'store_true',
+        default = False,
+    ),
+    ParseArgument('--workers',
+        help = 'Evaluate the routes of each hop across N worker processes.',
+        metavar = 'N',
+        type = int,
+        default = 0,
+    ),
+    ParseArgument('--jump-graph',
+        help = 'Load (or build and save) the systems-in-range graph for this jump range next to the database.',
+        action = 'store_true',
+        default = False,
+        dest = 'jumpGraph',
+    ),
+    ParseArgument('--fit',
+        help = (
+            'Load calculator: simple (greedy, the default), '
+            'dp (approximate, never worse than simple, requires numpy), '
+            'fast or brute (exact but slow).'
+        ),
+        choices = ['simple', 'dp', 'fast', 'brute'],
+    ),
+    ParseArgument('--trade-cache',
+        help = 'Number of station pairs to remember trades for between hops (0 disables).',
+        dest = 'tradeCacheSize',
+        metavar = 'N',
+        type = int,
+    ),
+    ParseArgument('--stream',
+        help = (
+            'Write the top routes after each hop, and then the result, '
+            'as JSON Lines records. Notes go to stderr.'
+        ),
+        choices = ['jsonl'],
+        default = None,
+    ),
 ]
 
 ######################################################################
@@ -804,6 +848,10 @@ def validateRunArguments(tdb, cmdenv, calc):
         raise CommandLineError(
             "Checklist can only be applied to a single route."
         )
+    if cmdenv.stream and (cmdenv.checklist or cmdenv.progress):
+        raise CommandLineError(
+            "--stream can't be combined with --checklist or --progress."
+        )
     
     if cmdenv.hops < 1:
         raise CommandLineError("Minimum of 1 hop required")
@@ -812,6 +860,10 @@ def validateRunArguments(tdb, cmdenv, calc):
     
     if cmdenv.maxJumpsPer < 0:
         raise CommandLineError("Negative jumps: you're already there?")
+    if cmdenv.workers < 0:
+        raise CommandLineError("Invalid (negative) number of workers")
+    if cmdenv.tradeCacheSize is not None and cmdenv.tradeCacheSize < 0:
+        raise CommandLineError("Invalid (negative) trade cache size")
     if cmdenv.direct:
         cmdenv.hops = 1
         cmdenv.maxJumpsPer = cmdenv.maxLyPer = 10000
@@ -1131,6 +1183,129 @@ def extraRouteProgress(routes):
     
     return ".. {}, {}".format(gainText, gptText)
 
+
+def routeRecord(route):
+    """
+    Returns a JSON-serialisable dict describing a route.
+    """
+    hops = []
+    for src, dst, hop, hopJumps in zip(route.route, route.route[1:], route.hops, route.jumps):
+        hops.append({
+            "from": src.name(),
+            "to": dst.name(),
+            "jumps": [system.name() for system in hopJumps or ()],
+            "gainCr": hop.gainCr,
+            "costCr": hop.costCr,
+            "units": hop.units,
+            "items": [
+                {
+                    "item": trade.name(),
+                    "qty": qty,
+                    "costCr": trade.costCr,
+                    "gainCr": trade.gainCr,
+                }
+                for trade, qty in hop.items
+            ],
+        })
+    return {
+        "from": route.firstStation.name(),
+        "to": route.lastStation.name(),
+        "score": route.score,
+        "startCr": route.startCr,
+        "gainCr": route.gainCr,
+        "gpt": route.gpt,
+        "hops": hops,
+    }
+
+
+def streamRecord(record):
+    """
+    Writes one JSON Lines record to stdout straight away, so that a
+    reader sees each hop's results as soon as they are known. If the
+    reader has closed the stream, the run stops there.
+    """
+    try:
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Nobody is listening: keep the interpreter from complaining
+        # when it flushes stdout on the way out.
+        sys.stdout = open(os.devnull, "w")
+        raise SystemExit(0)
+
+
+def priceRegion(cmdenv):
+    """
+    Returns the (System, ly) spheres that hold every station a run
+    --from somewhere could visit, so TradeCalc only loads their prices,
+    or None when the whole galaxy is in play.
+    """
+    origPlace = cmdenv.origPlace
+    if not origPlace or cmdenv.direct or not cmdenv.maxLyPer:
+        return None
+    if not cmdenv.hops or cmdenv.hops < 1 or not cmdenv.maxJumpsPer or cmdenv.maxJumpsPer < 0:
+        return None
+    jumpLy = max(cmdenv.maxLyPer, cmdenv.emptyLyPer or 0)
+    region = [(origPlace.system, ((cmdenv.startJumps or 0) + cmdenv.hops * cmdenv.maxJumpsPer) * jumpLy)]
+    # Keep the other named places so they still pass the station checks.
+    if cmdenv.destPlace:
+        region.append((cmdenv.destPlace.system, (cmdenv.endJumps or 0) * jumpLy))
+    for place in cmdenv.viaPlaces or ():
+        region.append((place.system, 0))
+    return region
+
+
+def gainPerTonBounds(calc, cmdenv):
+    """
+        Returns (bestFrom, bestAnywhere): bestFrom maps a station ID to
+        the most a ton bought there could gain if sold at the best-paying
+        station in the galaxy, and bestAnywhere is the most of those.
+        Together they give an optimistic bound on what a route can
+        still earn.
+    """
+    
+    bestBuyCr = defaultdict(int)
+    for buying in calc.stationsBuying.values():
+        for itemID, buyCr, *_ in buying:
+            if buyCr > bestBuyCr[itemID]:
+                bestBuyCr[itemID] = buyCr
+    
+    maxGainCr = cmdenv.maxGainPerTon or sys.maxsize
+    bestFrom = {}
+    for stnID, selling in calc.stationsSelling.items():
+        bestGainCr = max(
+            (bestBuyCr.get(itemID, 0) - costCr for itemID, costCr, *_ in selling),
+            default = 0,
+        )
+        bestFrom[stnID] = min(max(bestGainCr, 0), maxGainCr)
+    
+    return bestFrom, max(bestFrom.values(), default = 0)
+
+
+def findScoreToBeat(calc, cmdenv, routes, restrictions):
+    """
+        Runs a narrow search that only keeps the best '--routes' routes
+        at each hop and returns the score of the last of them, or None
+        if it didn't find enough. Provided it doesn't crop its routes
+        with --max-routes or --prune-score, and where a route can go
+        next doesn't depend on where it has been (--unique, --loop-int),
+        the full search finds at least that many routes scoring as well,
+        so a route that can't reach this score will never be shown.
+    """
+    
+    numRoutes = cmdenv.routes
+    for restrictTo in restrictions:
+        try:
+            routes = calc.getBestHops(routes, restrictTo = restrictTo)
+        except NoHopsError:
+            return None
+        routes.sort()
+        routes = routes[:numRoutes]
+    
+    if len(routes) < numRoutes:
+        return None
+    return routes[-1].score
+
 ######################################################################
 # Perform query and populate result set
 
@@ -1142,7 +1317,10 @@ def run(results, cmdenv, tdb):
         raise NoDataError("Database does not contain any profitable trades.")
     
     # Instantiate the calculator object
-    calc = TradeCalc(tdb, cmdenv)
+    calc = cmdenv.tradeCalc(tdb, region = priceRegion(cmdenv))
+    
+    if cmdenv.jumpGraph and cmdenv.maxLyPer and not cmdenv.direct:
+        tdb.useJumpGraph(max(cmdenv.maxLyPer, cmdenv.emptyLyPer or 0))
     
     validateRunArguments(tdb, cmdenv, calc)
     
@@ -1212,14 +1390,36 @@ def run(results, cmdenv, tdb):
         if not cmdenv.loop:
             stopSystems = {stop.system for stop in stopStations}
     
-    for hopNo in range(numHops):
-        restrictTo = None
+    def hopRestriction(hopNo):
         if hopNo == lastHop and stopStations:
-            restrictTo = set(stopStations)
-            manualRestriction = bool(cmdenv.destPlace)
-        elif len(viaSet) > cmdenv.adhocHops:
-            restrictTo = viaSet
-            manualRestriction = True
+            return set(stopStations), bool(cmdenv.destPlace)
+        if len(viaSet) > cmdenv.adhocHops:
+            return viaSet, True
+        return None, False
+    
+    # Unless scores depend on a goal or picked/via routes, drop routes
+    # that can't catch up with a quick narrow search even at the best
+    # possible gain per ton for every remaining hop. The ls penalty
+    # can boost a hop's score by at most half its percentage.
+    # --max-routes and --prune-score can crop the narrow search's
+    # winners from the full search, and with --unique or --loop-int
+    # the best route to a station can be barred from hops a worse one
+    # could still make, so then there's no such bound.
+    scoreToBeat = None
+    if numHops > 1 and not (
+        goalSystem or routePickPred or viaSet or cmdenv.maxRoutes or pruneMod
+        or cmdenv.unique or cmdenv.loopInt
+    ):
+        scoreToBeat = findScoreToBeat(
+            calc, cmdenv, routes,
+            [hopRestriction(hopNo)[0] for hopNo in range(numHops)],
+        )
+    if scoreToBeat is not None:
+        bestFrom, bestAnywhere = gainPerTonBounds(calc, cmdenv)
+        cmdenv.DEBUG0("Routes must be able to score at least {:n}", scoreToBeat)
+    
+    for hopNo in range(numHops):
+        restrictTo, manualRestriction = hopRestriction(hopNo)
         
         if distancePruning:
             preCrop = len(routes)
@@ -1246,6 +1446,20 @@ def run(results, cmdenv, tdb):
             if cmdenv.maxRoutes and len(routes) > cmdenv.maxRoutes:
                 routes = routes[:cmdenv.maxRoutes]
         
+        if hopNo >= 1 and scoreToBeat is not None:
+            preCrop = len(routes)
+            futureHops = numHops - hopNo - 1
+            maxHopScore = cmdenv.capacity * (1 + max(min((cmdenv.lsPenalty or 0) / 100, 1), 0) / 2)
+            routes = [
+                rt for rt in routes
+                if rt.score + maxHopScore * (
+                    bestFrom.get(rt.lastStation.ID, 0) + futureHops * bestAnywhere
+                ) >= scoreToBeat
+            ]
+            pruned = preCrop - len(routes)
+            if pruned:
+                cmdenv.NOTE("Pruned {} origins that can't beat the top {} routes", pruned, cmdenv.routes)
+        
         if cmdenv.progress:
             extra = ""
             if hopNo > 0 and cmdenv.detail > 1:
@@ -1330,6 +1544,21 @@ def run(results, cmdenv, tdb):
             pickedRoutes.extend(
                 route for route in routes if routePickPred(route)
             )
+        
+        if cmdenv.stream:
+            if routePickPred:
+                # Picked routes are only ranked per hop at the end.
+                topRoutes = heapq.nsmallest(
+                    cmdenv.routes, pickedRoutes,
+                    key = lambda route: (-route.score / len(route.hops), len(route.jumps)),
+                )
+            else:
+                topRoutes = heapq.nsmallest(cmdenv.routes, routes)
+            streamRecord({
+                "type": "hop",
+                "hop": hopNo + 1,
+                "routes": [routeRecord(route) for route in topRoutes],
+            })
     
     if cmdenv.loop or cmdenv.shorten:
         cmdenv.DEBUG0("Using {} picked routes", len(pickedRoutes))
@@ -1353,6 +1582,14 @@ def run(results, cmdenv, tdb):
         if caution:
             results.summary.exception += caution + "\n"
     
+    tradeCache = calc.tradeCache
+    if tradeCache is not None:
+        cmdenv.DEBUG0(
+            "Trade cache: {:n} hits, {:n} misses, {:n}/{:n} pairs",
+            tradeCache.hits, tradeCache.misses,
+            len(tradeCache), tradeCache.maxEntries,
+        )
+    
     routes.sort()
     results.data = routes
     
@@ -1364,6 +1601,15 @@ def run(results, cmdenv, tdb):
 
 def render(results, cmdenv, tdb):
     exception = results.summary.exception
+    
+    if cmdenv.stream:
+        streamRecord({
+            "type": "result",
+            "exception": exception or None,
+            "routes": [routeRecord(route) for route in results.data[:cmdenv.routes]],
+        })
+        return
+    
     if exception:
         print('#' * 76)
         print("\a{}".format(exception), end = "")
@@ -16,6 +16,7 @@ help='Find places to sell a given item within range of a given station.'
 name='sell'
 epilog=None
 wantsTradeDB=True
+wantsTables=('System', 'Item')
 arguments = [
     ParseArgument('item', help='Name of item you want to sell.', type=str),
 ]
@@ -136,6 +137,30 @@ def run(results, cmdenv, tdb: TradeDB):
     else:
         distanceFn = None
     
+    stationByID = tdb.stationByID
+    padSize = cmdenv.padSize
+    planetary = cmdenv.planetary
+    fleet = cmdenv.fleet
+    odyssey = cmdenv.odyssey
+    wantNoPlanet = cmdenv.noPlanet
+    wantBlackMarket = cmdenv.blackMarket
+    
+    # Measure and filter every candidate station in one pass if we can.
+    galaxy = tdb.galaxy
+    matches = galaxy and galaxy.matchStations(
+        nearSystem, maxLy if nearSystem else None, None, (
+            ('maxPadSize', padSize),
+            ('planetary', planetary),
+            ('fleet', fleet),
+            ('odyssey', odyssey),
+            ('planetary', wantNoPlanet and 'N'),
+            ('blackMarket', wantBlackMarket and 'Y'),
+        ),
+    )
+    if matches is not None and nearSystem:
+        # Only ask for the stations near enough.
+        constraints.append("(station_id IN ({}))".format(','.join(str(ID) for ID in matches)))
+    
     whereClause = ' AND '.join(constraints)
     stmt = """SELECT DISTINCT {columns} FROM {tables} WHERE {where}""".format(
         columns=','.join(columns),
@@ -145,27 +170,22 @@ def run(results, cmdenv, tdb: TradeDB):
     cmdenv.DEBUG0('SQL: {}', stmt)
     cur = tdb.query(stmt, bindValues)
     
-    stationByID = tdb.stationByID
-    padSize = cmdenv.padSize
-    planetary = cmdenv.planetary
-    fleet = cmdenv.fleet
-    odyssey = cmdenv.odyssey
-    wantNoPlanet = cmdenv.noPlanet
-    wantBlackMarket = cmdenv.blackMarket
-    
     for (stationID, priceCr, demand) in cur:
         station = stationByID[stationID]
-        if padSize and not station.checkPadSize(padSize):
+        if matches is not None:
+            if stationID not in matches:
+                continue
+        elif padSize and not station.checkPadSize(padSize):
             continue
-        if planetary and not station.checkPlanetary(planetary):
+        elif planetary and not station.checkPlanetary(planetary):
             continue
-        if fleet and not station.checkFleet(fleet):
+        elif fleet and not station.checkFleet(fleet):
             continue
-        if odyssey and not station.checkOdyssey(odyssey):
+        elif odyssey and not station.checkOdyssey(odyssey):
             continue
-        if wantNoPlanet and station.planetary != 'N':
+        elif wantNoPlanet and station.planetary != 'N':
             continue
-        if wantBlackMarket and station.blackMarket != 'Y':
+        elif wantBlackMarket and station.blackMarket != 'Y':
             continue
         if station in avoidStations:
             continue
@@ -177,7 +197,10 @@ def run(results, cmdenv, tdb: TradeDB):
         
         row = ResultRow()
         row.station = station
-        if distanceFn:
+        if matches is not None:
+            if distanceFn:
+                row.dist = matches[stationID]
+        elif distanceFn:
             distance = distanceFn(row.station.system)
             if distance > maxLy:
                 continue
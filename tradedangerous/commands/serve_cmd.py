@@ -0,0 +1,297 @@
+from . import CommandIndex
+from .exceptions import CommandLineError
+from .parsing import MutuallyExclusiveGroup, ParseArgument
+from ..snapshot import PlaceSnapshot
+from ..tradecalc import TradeCalc
+from ..tradedb import TradeDB
+from ..tradeexcept import TradeException
+
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from pathlib import Path
+from rich.console import Console
+import http.server
+import io
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import time
+import traceback
+
+######################################################################
+# Parser config
+
+help = 'Answer queries from a resident TradeDB over localhost HTTP.'
+name = 'serve'
+epilog = (
+    'POST a JSON object such as {"args": ["run", "--from", "sol", '
+    '"--cr", "100000", "--cap", "100", "--ly", "12"]} to the server and '
+    'it replies with {"ok": true, "output": ...}, the text the command '
+    'would have printed. Only read-only commands are served: '
+    'buy, local, market, nav, olddata, rares, run, sell and trade. '
+    'The server reloads its data when the database changes, e.g. after '
+    'an import; ages in the replies are measured from when prices were '
+    'last loaded.'
+)
+wantsTradeDB = True
+usesTradeData = False
+wantsTables = tuple(TradeDB.lazyTables)
+arguments = [
+]
+switches = [
+    MutuallyExclusiveGroup(
+        ParseArgument('--port',
+            help = 'Listen for HTTP on this localhost port.',
+            type = int,
+            default = 8023,
+        ),
+        ParseArgument('--socket',
+            help = 'Listen for HTTP on this Unix socket instead of a port.',
+            metavar = 'PATH',
+            dest = 'socketPath',
+        ),
+    ),
+    ParseArgument('--price-snapshots',
+        help = (
+            'How many sets of prices to keep warm: queries with different '
+            '--avoid, --supply or --demand options need their own.'
+        ),
+        type = int,
+        metavar = 'N',
+        default = 4,
+        dest = 'priceSnapshots',
+    ),
+]
+
+# Commands that only read the database, so can share a warm TradeDB.
+servedCommands = ('buy', 'local', 'market', 'nav', 'olddata', 'rares', 'run', 'sell', 'trade')
+
+######################################################################
+# Helpers
+
+
+class CalcPool:
+    """
+        Warm TradeCalcs by TradeCalc.priceKey(), least recently used
+        first. A query borrows the prices of the one for its options,
+        loading them the first time they are asked for.
+    """
+    
+    def __init__(self, tdb, size):
+        self.tdb = tdb
+        self.size = max(size, 1)
+        self.calcs = OrderedDict()
+    
+    def __len__(self):
+        return len(self.calcs)
+    
+    def get(self, tdenv):
+        key = TradeCalc.priceKey(tdenv)
+        if key is None:
+            return None
+        try:
+            calc = self.calcs.pop(key)
+        except KeyError:
+            calc = TradeCalc(self.tdb, tdenv)
+            while len(self.calcs) >= self.size:
+                self.calcs.popitem(last = False)
+        self.calcs[key] = calc
+        return calc.forEnv(tdenv)
+
+
+class QueryServer:
+    """
+        Runs command lines against a TradeDB and CalcPool that stay
+        loaded between queries, reloading both when the database
+        changes.
+    """
+    
+    def __init__(self, cmdenv, tdb):
+        self.cmdenv = cmdenv
+        self.prog = cmdenv.argv[0]
+        self.failedVersion = None
+        self.queries = 0
+        self.version = PlaceSnapshot.fileSignature(tdb.dbPath)
+        self.tdb, self.calcs = tdb, self.warmUp(tdb)
+        self.loaded = time.time()
+    
+    def warmUp(self, tdb):
+        """
+            Builds tdb's GalaxyStore and returns a CalcPool for it
+            holding the default prices.
+        """
+        tdb.useGalaxy()
+        calcs = CalcPool(tdb, self.cmdenv.priceSnapshots)
+        calcs.get(self.cmdenv)
+        return calcs
+    
+    def refresh(self):
+        """
+            Swaps in a freshly loaded TradeDB and CalcPool if the
+            database has changed since they were loaded. If that
+            fails, we keep serving the old ones.
+        """
+        version = PlaceSnapshot.fileSignature(self.tdb.dbPath)
+        if version in (self.version, self.failedVersion):
+            return
+        cmdenv = self.cmdenv
+        cmdenv.NOTE("The database changed, reloading it.", stderr = True)
+        try:
+            tdb = TradeDB(cmdenv, tables = wantsTables)
+            calcs = self.warmUp(tdb)
+        except (TradeException, sqlite3.Error, OSError) as e:
+            cmdenv.WARN("Reloading failed, still serving the old data: {}", e, stderr = True)
+            self.failedVersion = version
+            return
+        self.tdb.close()
+        self.tdb, self.calcs = tdb, calcs
+        # Loading can touch the database, e.g. when it rebuilds it.
+        self.version = PlaceSnapshot.fileSignature(tdb.dbPath)
+        self.loaded = time.time()
+    
+    def status(self):
+        return {
+            'ok': True,
+            'database': str(self.tdb.dbPath),
+            'loaded': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.loaded)),
+            'queries': self.queries,
+            'priceSnapshots': len(self.calcs),
+            'commands': servedCommands,
+        }
+    
+    def query(self, args):
+        """
+            Runs the command line 'args', without the leading
+            "trade.py", and returns (HTTP status, response).
+        """
+        self.refresh()
+        self.queries += 1
+        started = time.perf_counter()
+        output, messages = io.StringIO(), io.StringIO()
+        
+        def reply(status, **response):
+            response.update(
+                output = output.getvalue(),
+                stderr = messages.getvalue(),
+                seconds = round(time.perf_counter() - started, 6),
+            )
+            return status, response
+        
+        # Parsing a query changes directory to its --cwd, or trade.py's,
+        # which mustn't leak into the server or the queries after it.
+        cwd = os.getcwd()
+        try:
+            cmdenv = CommandIndex().parse([self.prog, *args])
+            if cmdenv._cmd.name not in servedCommands:
+                raise CommandLineError("The server only answers {} queries.".format(", ".join(servedCommands)))
+            if cmdenv.dbFilename or cmdenv.maxSystemLinkLy:
+                raise CommandLineError("--db and --link-ly are set when the server starts.")
+            if cmdenv.checklist or cmdenv.x52pro:
+                raise CommandLineError("--checklist and --x52-pro need a terminal.")
+            
+            cmdenv.console = Console(file = output, color_system = None, soft_wrap = True)
+            cmdenv.stderr = Console(file = messages, color_system = None, soft_wrap = True)
+            cmdenv.calcPool = self.calcs
+            with redirect_stdout(output):
+                cmdenv.checkTradingData(self.tdb)
+                results = cmdenv.run(self.tdb)
+                if results:
+                    results.render()
+        except (TradeException, LookupError) as e:
+            return reply(400, ok = False, error = str(e))
+        except Exception as e:  # pylint: disable=broad-except
+            self.cmdenv.WARN("Query {} failed:\n{}", args, traceback.format_exc(), stderr = True)
+            return reply(500, ok = False, error = "{}: {}".format(type(e).__name__, e))
+        finally:
+            os.chdir(cwd)
+        return reply(200, ok = True)
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    """
+        GET returns the server's status; POST {"args": [...]} runs a
+        command line and returns what it printed.
+    """
+    
+    def do_GET(self):
+        self.reply(200, self.server.queries.status())
+    
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            args = json.loads(self.rfile.read(length))['args']
+            if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            self.reply(400, {
+                'ok': False,
+                'error': 'Expected a JSON object such as {"args": ["nav", "sol", "lave"]}.',
+            })
+            return
+        self.reply(*self.server.queries.query(args))
+    
+    def reply(self, status, response):
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        self.server.queries.cmdenv.DEBUG0("{}", format % args)
+
+
+def makeServer(cmdenv, queries):
+    """
+        Returns an HTTP server for the queries on --socket or the
+        localhost --port. It answers one query at a time: the TradeDB
+        connection belongs to this thread.
+    """
+    try:
+        if cmdenv.socketPath:
+            if not hasattr(socket, 'AF_UNIX'):
+                raise CommandLineError("--socket needs a platform with Unix sockets.")
+            socketPath = Path(cmdenv.socketPath)
+            if socketPath.is_socket():
+                socketPath.unlink()
+            server = socketserver.UnixStreamServer(str(socketPath), QueryHandler)
+        else:
+            server = http.server.HTTPServer(('127.0.0.1', cmdenv.port), QueryHandler)
+    except OSError as e:
+        raise CommandLineError("Can't listen for queries: {}".format(e))
+    server.queries = queries
+    return server
+
+######################################################################
+# Perform query and populate result set
+
+
+def run(results, cmdenv, tdb):
+    queries = QueryServer(cmdenv, tdb)
+    server = makeServer(cmdenv, queries)
+    cmdenv.NOTE(
+        "Serving {} on {}, press Ctrl-C to stop.",
+        tdb.dbPath, cmdenv.socketPath or "http://127.0.0.1:{}/".format(server.server_address[1]),
+        stderr = True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if cmdenv.socketPath and Path(cmdenv.socketPath).is_socket():
+            Path(cmdenv.socketPath).unlink()
+        queries.tdb.close()
+    
+    return None
+
+######################################################################
+# Transform result set into output
+
+
+def render(results, cmdenv, tdb):
+    pass
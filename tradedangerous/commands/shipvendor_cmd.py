@@ -17,6 +17,7 @@ from .. import csvexport
 help = 'List, add or update available ships to a station'
 name = 'shipvendor'
 epilog = None
+wantsTables = ('System', 'Ship')
 arguments = [
     ParseArgument(
         'origin',
@@ -20,6 +20,7 @@ import re
 help='Add (or update) a station entry'
 name='station'
 epilog=None
+wantsTables=('System', 'Item')
 arguments = [
     ParseArgument(
         'station',
@@ -1,6 +1,5 @@
 from .exceptions import CommandLineError
 from .parsing import ParseArgument
-from ..tradecalc import TradeCalc
 from ..formatting import RowFormat, max_len
 
 ######################################################################
@@ -10,6 +9,7 @@ help='Find potential trades between two given stations.'
 name='trade'
 epilog=None
 wantsTradeDB=True
+wantsTables=('System', 'Item')
 arguments = [
     ParseArgument(
         'origin',
@@ -31,14 +31,14 @@ switches = [
 def run(results, cmdenv, tdb):
     from .commandenv import ResultRow
     
-    calc = TradeCalc(tdb, cmdenv)
-    
     lhs = cmdenv.startStation
     rhs = cmdenv.stopStation
     
     if lhs == rhs:
         raise CommandLineError("Must specify two different stations.")
     
+    calc = cmdenv.tradeCalc(tdb, region = ((lhs.system, 0), (rhs.system, 0)))
+    
     results.summary = ResultRow()
     results.summary.fromStation = lhs
     results.summary.toStation = rhs
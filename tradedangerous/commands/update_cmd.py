@@ -21,6 +21,7 @@ epilog = ("Generates a human-readable version of the price list for a given stat
             "the order will be kept for future edits, making it easier to quickly "
             "check for changes.")
 wantsTradeDB = True
+wantsTables = ('System', 'Item')
 arguments = [
     ParseArgument('starting', help = 'Name of the station to update.', type = str)
 ]
@@ -1046,7 +1046,7 @@ def trade(argv):
     cmdIndex = commands.CommandIndex()
     cmdenv = cmdIndex.parse(argv)
     
-    tdb = tradedb.TradeDB(cmdenv, load = cmdenv.wantsTradeDB)
+    tdb = tradedb.TradeDB(cmdenv, load = cmdenv.wantsTradeDB, tables = cmdenv.wantsTables)
     if cmdenv.usesTradeData:
         tsc = tdb.tradingStationCount
         if tsc == 0:
@@ -0,0 +1,146 @@
+"""
+Jump graphs: which systems are within a given jump range of each other.
+
+A JumpGraph is a compressed-sparse-row adjacency list of every System
+against every other System within 'maxLy'. It is saved as a sidecar
+file next to the database (e.g. "TradeDangerous.15ly.jumps") along with
+a signature of the System table, so later runs can load it instead of
+probing the stellar grid system by system, until the systems change.
+
+See TradeDB.useJumpGraph.
+"""
+from __future__ import annotations
+
+from array import array
+import hashlib
+import os
+import struct
+import sys
+import typing
+
+if typing.TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Optional
+    from .tradedb import System, TradeDB
+
+
+class JumpGraph:
+    """
+    Adjacency of the systems within maxLy of each other.
+    
+    Attributes:
+        maxLy
+            The jump range the graph was built for,
+        signature
+            Digest of the System table the graph was built from,
+        systemIDs
+            The System ID of each row,
+        rowStarts
+            Offset of each row's entries in neighbours/distances, with
+            a final entry for the end of the last row,
+        neighbours
+            Row numbers of the systems in range,
+        distances
+            The distance in ly to each of those systems.
+    
+    Each row is sorted by distance, in the same order that
+    TradeDB.genSystemsInRange yields systems.
+    """
+    
+    fileMagic = b"TDJG"
+    fileVersion = 1
+    # magic, version, maxLy, signature, rows, entries
+    fileHeader = struct.Struct("<4sId20sQQ")
+    
+    def __init__(self, maxLy, signature, systemIDs, rowStarts, neighbours, distances):
+        self.maxLy = maxLy
+        self.signature = signature
+        self.systemIDs = systemIDs
+        self.rowStarts = rowStarts
+        self.neighbours = neighbours
+        self.distances = distances
+        self.rowByID = {ID: row for row, ID in enumerate(systemIDs)}
+    
+    def __len__(self):
+        return len(self.systemIDs)
+    
+    @staticmethod
+    def tableSignature(db) -> bytes:
+        """ Returns a digest that changes whenever the System table does. """
+        row = db.execute("""
+            SELECT  COUNT(*), MAX(system_id), MAX(modified),
+                    TOTAL(pos_x), TOTAL(pos_y), TOTAL(pos_z)
+              FROM  System
+        """).fetchone()
+        return hashlib.sha1(repr(tuple(row)).encode()).digest()
+    
+    @classmethod
+    def build(cls, tdb: TradeDB, maxLy: float, signature: bytes) -> JumpGraph:
+        """ Builds the graph for every system in tdb. """
+        neighbourhoods = list(tdb.genStellarNeighbourhoods(maxLy))
+        rowByID = {system.ID: row for row, (system, _) in enumerate(neighbourhoods)}
+        systemIDs, rowStarts = array('q'), array('q', (0,))
+        neighbours, distances = array('q'), array('d')
+        for system, inRange in neighbourhoods:
+            inRange.sort(key=lambda ent: ent[1])
+            systemIDs.append(system.ID)
+            neighbours.extend(rowByID[candidate.ID] for candidate, _ in inRange)
+            distances.extend(dist for _, dist in inRange)
+            rowStarts.append(len(neighbours))
+        return cls(maxLy, signature, systemIDs, rowStarts, neighbours, distances)
+    
+    @classmethod
+    def load(cls, path: Path, maxLy: float, signature: bytes) -> Optional[JumpGraph]:
+        """
+        Returns the graph saved at path, or None if there isn't one or
+        it was built for a different range or System table.
+        """
+        try:
+            with path.open("rb") as fh:
+                header = fh.read(cls.fileHeader.size)
+                if len(header) != cls.fileHeader.size:
+                    return None
+                magic, version, fileLy, fileSignature, rows, entries = cls.fileHeader.unpack(header)
+                if (magic, version, fileLy, fileSignature) != (cls.fileMagic, cls.fileVersion, maxLy, signature):
+                    return None
+                arrays = []
+                for typecode, count in (('q', rows), ('q', rows + 1), ('q', entries), ('d', entries)):
+                    values = array(typecode)
+                    values.fromfile(fh, count)
+                    if sys.byteorder != "little":
+                        values.byteswap()
+                    arrays.append(values)
+        except (OSError, EOFError):
+            return None
+        return cls(maxLy, signature, *arrays)
+    
+    def save(self, path: Path) -> None:
+        """ Writes the graph to path, replacing any previous file. """
+        tmpPath = path.with_name(path.name + ".tmp")
+        with tmpPath.open("wb") as fh:
+            fh.write(self.fileHeader.pack(
+                self.fileMagic, self.fileVersion, self.maxLy, self.signature,
+                len(self.systemIDs), len(self.neighbours),
+            ))
+            for values in (self.systemIDs, self.rowStarts, self.neighbours, self.distances):
+                if sys.byteorder != "little":
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                values.tofile(fh)
+        os.replace(tmpPath, path)
+    
+    def systemsInRange(self, system: System, systemByID: dict) -> Optional[list]:
+        """
+        Returns a list of (System, distLy) within maxLy of system,
+        nearest first, or None if system isn't in the graph.
+        """
+        try:
+            row = self.rowByID[system.ID]
+        except KeyError:
+            return None
+        start, end = self.rowStarts[row], self.rowStarts[row + 1]
+        systemIDs = self.systemIDs
+        return [
+            (systemByID[systemIDs[neighbour]], dist)
+            for neighbour, dist in zip(self.neighbours[start:end], self.distances[start:end])
+        ]
@@ -0,0 +1,103 @@
+"""
+Import-time report for trade.py.
+
+Every trade.py invocation pays to import the modules it needs before
+it does any work. Setting IMPORTTIME in the environment re-runs the
+command under Python's "-X importtime" and, once it finishes, prints
+the slowest imports to stderr:
+    IMPORTTIME=1 trade.py nav sol lave      # show the top 20
+    IMPORTTIME=40 trade.py nav sol lave     # show the top 40
+    IMPORTTIME=all trade.py nav sol lave    # show every import
+"""
+
+from __future__ import annotations
+
+import re
+import subprocess
+import sys
+import typing
+
+if typing.TYPE_CHECKING:
+    from typing import Iterable, List, Optional, TextIO
+
+
+defaultTop = 20
+
+# import time: self [us] | cumulative | imported package
+importLine = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)\s*$')
+
+
+class ImportTime(typing.NamedTuple):
+    """ One "-X importtime" entry; times are in microseconds. """
+    module: str
+    self: int
+    cumulative: int
+    depth: int
+
+
+def parseImportTimes(lines: Iterable[str], others: Optional[TextIO] = None) -> List[ImportTime]:
+    """
+    Returns the import timings from "-X importtime" output, in the
+    order Python reported them. Lines that aren't timings are written
+    to others, if given.
+    """
+    imports = []
+    for line in lines:
+        match = importLine.match(line)
+        if match:
+            selfUs, cumulativeUs, indent, module = match.groups()
+            imports.append(ImportTime(module, int(selfUs), int(cumulativeUs), len(indent) // 2))
+        elif others is not None and not line.startswith('import time: self'):
+            others.write(line)
+    return imports
+
+
+def formatReport(imports: List[ImportTime], top: Optional[int] = defaultTop) -> str:
+    """ Lists the top imports by cumulative time, slowest first. """
+    # Only the outermost imports add up to the time spent importing.
+    total = sum(imp.cumulative for imp in imports if imp.depth == 0)
+    slowest = sorted(imports, key = lambda imp: imp.cumulative, reverse = True)
+    if top:
+        slowest = slowest[:top]
+    
+    lines = [
+        "Imported {:n} modules in {:.1f}ms".format(len(imports), total / 1000),
+        "{:>10} {:>10}  {}".format("Cumul ms", "Self ms", "Module"),
+    ]
+    lines.extend(
+        "{:>10.1f} {:>10.1f}  {}".format(imp.cumulative / 1000, imp.self / 1000, imp.module)
+        for imp in slowest
+    )
+    return "\n".join(lines)
+
+
+def reportTop(setting: str) -> Optional[int]:
+    """
+    How many imports the IMPORTTIME setting asks for: None for "all",
+    a number above 1 for that many, otherwise defaultTop.
+    """
+    if setting.strip().lower() == "all":
+        return None
+    try:
+        top = int(setting)
+    except ValueError:
+        return defaultTop
+    return top if top > 1 else defaultTop
+
+
+def profileImports(script: str, argv: List[str], setting: str) -> int:
+    """
+    Runs script with argv[1:] under "-X importtime", passing its stdin
+    and stdout through, then prints the report to stderr. Returns the
+    script's exit code.
+    """
+    child = subprocess.Popen(
+        [sys.executable, "-X", "importtime", script, *argv[1:]],
+        stderr = subprocess.PIPE, text = True, errors = "replace",
+    )
+    with child.stderr:
+        imports = parseImportTimes(child.stderr, sys.stderr)
+    returnCode = child.wait()
+    
+    print(formatReport(imports, reportTop(setting)), file = sys.stderr)
+    return returnCode
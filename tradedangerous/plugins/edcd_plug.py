@@ -50,27 +50,7 @@ class ImportPlugin(ImportPluginBase):
         """
             Update the ui_order of the items
         """
-        sqlStmt = (
-            "SELECT category_id, name"
-             " FROM Category"
-            " ORDER BY name"
-        )
-        itmStmt = (
-            "SELECT item_id, name"
-             " FROM Item"
-            " WHERE category_id = ?"
-            " ORDER BY name"
-        )
-        updStmt = (
-            "UPDATE Item"
-              " SET ui_order = ?"
-            " WHERE item_id = ?"
-        )
-        for catID, catName in db.execute(sqlStmt):
-            itmOrder = 0
-            for itmID, itmName in db.execute(itmStmt, [ catID ]):
-                itmOrder += 1
-                db.execute(updStmt, [ itmOrder, itmID ])
+        cache.updateItemOrder(db)
     
     def check_edcd_local(self):
         """
@@ -4,49 +4,79 @@ https://elite.tromador.com/ to update the Database.
 """
 from __future__ import annotations
 
-from email.utils import parsedate_to_datetime
 from pathlib import Path
-from .. fs import file_line_count
 from .. import plugins, cache, transfers
 from ..misc import progress as pbar
 from ..plugins import PluginException
 
 import csv
 import datetime
+import operator
 import os
-import requests
 import sqlite3
 import typing
 
 
 if typing.TYPE_CHECKING:
-    from typing import Optional
+    from collections.abc import Iterator
+    from typing import BinaryIO, Optional
     from .. tradeenv import TradeEnv
 
 # Constants
 BASE_URL = os.environ.get('TD_SERVER') or "https://elite.tromador.com/files/"
 
+# The listings.csv columns importListings reads, in the order it wants them.
+LISTING_COLUMNS = (
+    'station_id', 'commodity_id', 'collected_at',
+    'sell_price', 'demand', 'demand_bracket',
+    'buy_price', 'supply', 'supply_bracket',
+)
+# Bytes of listings to read and parse at a time.
+LISTINGS_CHUNK_SIZE = 4 * 1024 * 1024
+# SQLite page cache while importing listings, in KiB.
+LISTINGS_CACHE_KIB = 64 * 1024
+# StationItem indexes that are cheaper to build once, after importing into
+# an empty table, than to keep up to date row by row.
+DEFERRED_INDEXES = ('si_mod_stn_itm', 'si_itm_dmdpr', 'si_itm_suppr')
+
 
 class DecodingError(PluginException):
     pass
 
 
-def _count_listing_entries(tdenv: TradeEnv, listings: Path) -> int:
-    """ Calculates the number of entries in a listing file by counting the lines. """
-    if not listings.exists():
-        tdenv.NOTE("File not found, aborting: {}", listings)
-        return 0
-    
-    tdenv.DEBUG0(f"Getting total number of entries in {listings}...")
-    count = file_line_count(listings)
-    if count <= 1:
-        if count == 1:
-            tdenv.DEBUG0("Listing count of 1 suggests nothing but a header")
-        else:
-            tdenv.DEBUG0("Listings file is empty, nothing to do.")
-        return 0
-    
-    return count + 1  # kfsone: Doesn't the header already make this + 1?
+def _listing_columns(header: bytes) -> list[Optional[int]]:
+    """ helper: where each of the LISTING_COLUMNS is in a row, from the header; the brackets are optional. """
+    names = [name.strip() for name in next(csv.reader([header.decode("utf-8", errors="ignore")]))]
+    columns = [names.index(name) if name in names else None for name in LISTING_COLUMNS]
+    missing = [name for name, column in zip(LISTING_COLUMNS, columns) if column is None and not name.endswith('_bracket')]
+    if missing:
+        raise DecodingError(f"Listings are missing the {', '.join(missing)} column(s): {header!r}")
+    return columns
+
+
+def _read_listing_chunks(fh: BinaryIO) -> Iterator[tuple[list, int]]:
+    """
+    helper: reads the rest of a listings file in large chunks, yielding the
+    rows in each as lists of fields, with how many bytes were read for them.
+    """
+    tail = b""
+    while True:
+        data = fh.read(LISTINGS_CHUNK_SIZE)
+        if not data:
+            break
+        data, size = tail + data, len(data)
+        end = data.rfind(b"\n") + 1
+        data, tail = data[:end], data[end:]
+        yield _split_listings(data), size
+    if tail:
+        yield _split_listings(tail), 0
+
+
+def _split_listings(data: bytes) -> list:
+    """ helper: splits CSV rows into their fields, leaving the csv module any chunk with quotes in it. """
+    if b'"' in data:
+        return [row for row in csv.reader(data.decode("utf-8", errors="ignore").splitlines()) if row]
+    return [line.split(b",") for line in data.splitlines() if line]
 
 
 def _make_item_id_lookup(tdenv: TradeEnv, db: sqlite3.Cursor) -> frozenset[int]:
@@ -89,6 +119,7 @@ class ImportPlugin(plugins.ImportPluginBase):
         'purge':        "Remove any empty systems that previously had fleet carriers.",
         'optimize':     "Optimize ('vacuum') database after processing.",
         'solo':         "Don't download crowd-sourced market data. (Implies '-O skipvend', supercedes '-O all', '-O clean', '-O listings'.)",
+        'parallel':     f"Download up to this many files at once. (Default: {transfers.DEFAULT_FETCHES}.)",
     }
     
     def __init__(self, tdb, tdenv):
@@ -115,49 +146,26 @@ class ImportPlugin(plugins.ImportPluginBase):
     def now(self):
         return datetime.datetime.now()
     
-    def downloadFile(self, path):
+    def localPath(self, path):
+        """ Where we keep a dumpfile: the listings in dataPath, the rest with the other data. """
+        if path in (self.liveListingsPath, self.listingsPath):
+            return Path(self.dataPath, path)
+        return Path(self.tdb.dataPath, path)
+    
+    def downloadFiles(self, paths):
         """
-        Fetch the latest dumpfile from the website if newer than local copy.
+        Fetch the latest of each dumpfile from the website if newer than the
+        local copy, several at a time. Returns the set of paths downloaded.
         """
-        if path not in (self.liveListingsPath, self.listingsPath):
-            localPath = Path(self.tdb.dataPath, path)
-        else:
-            localPath = Path(self.dataPath, path)
-        
-        url  = BASE_URL + str(path)
-        
-        self.tdenv.NOTE("Checking for update to '{}'.", path)
-        # Use an HTTP Request header to obtain the Last-Modified and Content-Length headers.
-        # Also, tell the server to give us the un-compressed length of the file by saying
-        # that >this< request only wants text.
-        headers = {"User-Agent": "Trade-Dangerous", "Accept-Encoding": "identity"}
-        try:
-            response = requests.head(url, headers=headers, timeout=70)
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            self.tdenv.WARN("Problem with download:\n    URL: {}\n    Error: {}", url, str(e))
-            return False
-        
-        last_modified = response.headers.get("last-modified")
-        dump_mod_time = parsedate_to_datetime(last_modified).timestamp()
-        
-        if Path.exists(localPath):
-            local_mod_time = localPath.stat().st_mtime
-            if local_mod_time >= dump_mod_time:
-                self.tdenv.DEBUG0("'{}': Dump is not more recent than Local.", path)
-                return False
-        
-        # The server doesn't know the gzip'd length, and we won't see the gzip'd data,
-        # so we want the actual text-only length. Capture it here so we can tell the
-        # transfer mechanism how big the file is going to be.
-        length = response.headers.get("content-length")
-        
-        self.tdenv.NOTE("Downloading file '{}'.", path)
-        transfers.download(self.tdenv, url, localPath, chunkSize=16384, length=length)
-        
-        # Change the timestamps on the file so they match the website
-        os.utime(localPath, (dump_mod_time, dump_mod_time))
-        
-        return True
+        if not paths:
+            return set()
+        self.tdenv.NOTE("Checking for updates to {}.", ", ".join(f"'{path}'" for path in paths))
+        fetched = transfers.fetch_all(
+            self.tdenv,
+            ((BASE_URL + str(path), self.localPath(path), True) for path in paths),
+            parallel=self.parallel,
+        )
+        return {path for path, downloaded in zip(paths, fetched) if downloaded}
     
     def purgeSystems(self):
         """
@@ -184,13 +192,37 @@ class ImportPlugin(plugins.ImportPluginBase):
         from_live = listings_path != Path(self.dataPath, self.listingsPath).absolute()
         
         self.tdenv.NOTE("Checking listings")
-        total = _count_listing_entries(self.tdenv, listings_path)
-        if not total:
-            self.tdenv.NOTE("No listings")
+        if not listings_path.exists():
+            self.tdenv.NOTE("File not found, aborting: {}", listings_path)
             return
         
-        self.tdenv.NOTE("Processing market data from {}: Start time = {}. Live = {}", listings_file, self.now(), from_live)
+        with listings_path.open("rb") as fh:
+            # Progress is measured in bytes, which saves counting the lines first.
+            total = os.fstat(fh.fileno()).st_size
+            header = fh.readline()
+            if fh.tell() >= total:
+                self.tdenv.NOTE("No listings")
+                return
+            columns = _listing_columns(header)
+            
+            self.tdenv.NOTE("Processing market data from {}: Start time = {}. Live = {}", listings_file, self.now(), from_live)
+            self._importListingRows(fh, columns, total, from_live)
+        
+        if self.getOption("optimize"):
+            with pbar.Progress(1, 40, prefix="Optimizing"):
+                self.tdb.getDB().execute("VACUUM")
+        
+        self.tdb.close()
         
+        self.tdenv.NOTE("Finished processing market data. End time = {}", self.now())
+    
+    def _importListingRows(self, fh, columns, total, from_live):
+        """
+        Applies the listings read from fh to the StationItem table. The rows come
+        grouped by station, and the first row of each group decides whether the
+        group replaces what we have for the station. The writes are batched up,
+        one executemany per kind of statement.
+        """
         db = self.tdb.getDB()
         stmt_unliven_station = """UPDATE StationItem SET from_live = 0 WHERE station_id = ?"""
         stmt_flush_station   = """DELETE from StationItem WHERE station_id = ?"""
@@ -212,6 +244,15 @@ class ImportPlugin(plugins.ImportPluginBase):
         station_lookup = _make_station_id_lookup(self.tdenv, db.cursor())
         last_station_update_times = _collect_station_modified_times(self.tdenv, db.cursor())
         
+        # Importing into an empty table, e.g. after a clean, it's quicker to
+        # build the secondary indexes once at the end.
+        deferred_indexes = []
+        if not last_station_update_times:
+            deferred_indexes = [sql for _, sql in db.execute(
+                f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name IN ({', '.join('?' * len(DEFERRED_INDEXES))})",
+                DEFERRED_INDEXES,
+            )]
+        
         cur_station = None
         is_debug = self.tdenv.debug > 0
         self.tdenv.DEBUG0("Processing entries...")
@@ -220,95 +261,132 @@ class ImportPlugin(plugins.ImportPluginBase):
         # to get any benefits from constructing transactions, and blowing up
         # the WAL and memory usage by making massive transactions.
         max_transaction_items, transaction_items = 32 * 1024, 0
-        with pbar.Progress(total, 40, prefix="Processing", style=pbar.LongRunningCountBar) as prog,\
-              listings_path.open("r", encoding="utf-8", errors="ignore") as fh:
-            cursor = db.cursor()
-            cursor.execute("BEGIN TRANSACTION")
+        
+        # The writes waiting for the next flush, and the stations they touch:
+        # a station that comes round again has to see its earlier writes.
+        unliven, flush, listings = [], [], []
+        pending_stations = set()
+        add_listing = listings.append
+        
+        def write_pending():
+            nonlocal transaction_items
+            cursor.executemany(stmt_unliven_station, unliven)
+            cursor.executemany(stmt_flush_station, flush)
+            # The rows come by station, but the price indexes are by item, so
+            # inserting them by item saves hopping all over those. The sort is
+            # stable, so INSERT OR IGNORE still keeps the first of any repeats.
+            listings.sort(key=operator.itemgetter(1))
+            cursor.executemany(stmt_add_listing, listings)
+            transaction_items += len(unliven) + len(flush) + len(listings)
+            unliven.clear()
+            flush.clear()
+            listings.clear()
+            pending_stations.clear()
+        
+        station_col, item_col, time_col, dp_col, du_col, dl_col, sp_col, su_col, sl_col = columns
+        # Replacing a market rewrites its rows in every StationItem index, which
+        # goes a lot quicker when more of those fit in the page cache.
+        db.execute(f"PRAGMA cache_size = -{LISTINGS_CACHE_KIB}")
+        cursor = db.cursor()
+        try:
+            if deferred_indexes:
+                self.tdenv.DEBUG0("Dropping StationItem indexes until the import is done.")
+                for name in DEFERRED_INDEXES:
+                    db.execute(f"DROP INDEX IF EXISTS {name}")
             
-            for listing in csv.DictReader(fh):
-                prog.increment(1)
-                
-                station_id = int(listing['station_id'])
-                if station_id not in station_lookup:
-                    continue
-                
-                listing_time = int(listing['collected_at'])
+            with pbar.Progress(total, 40, prefix="Processing", style=pbar.TransferBar) as prog:
+                prog.increment(fh.tell())
+                cursor.execute("BEGIN TRANSACTION")
                 
-                if station_id != cur_station:
-                    # commit anything from the previous station, get a new cursor
-                    if transaction_items >= max_transaction_items:
-                        cursor.execute("COMMIT")
-                        transaction_items = 0
-                        cursor.execute("BEGIN TRANSACTION")
-                    cur_station, skip_station = station_id, False
-                    
-                    # Check if listing already exists in DB and needs updated.
-                    last_modified: int = int(last_station_update_times.get(station_id, 0))
-                    if last_modified:
-                        # When the listings.csv data matches the database, update to make from_live == 0.
-                        if listing_time == last_modified and not from_live:
+                for rows, size in _read_listing_chunks(fh):
+                    for row in rows:
+                        station_id = int(row[station_col])
+                        if station_id != cur_station:
+                            if station_id not in station_lookup:
+                                continue
+                            
+                            # commit anything from the previous stations
+                            if station_id in pending_stations or len(listings) >= max_transaction_items:
+                                write_pending()
+                            if transaction_items >= max_transaction_items:
+                                cursor.execute("COMMIT")
+                                transaction_items = 0
+                                cursor.execute("BEGIN TRANSACTION")
+                            cur_station, skip_station = station_id, False
+                            pending_stations.add(station_id)
+                            
+                            # Check if listing already exists in DB and needs updated.
+                            listing_time = int(row[time_col])
+                            last_modified: int = int(last_station_update_times.get(station_id, 0))
+                            if last_modified:
+                                # When the listings.csv data matches the database, update to make from_live == 0.
+                                if listing_time == last_modified and not from_live:
+                                    if is_debug:
+                                        self.tdenv.DEBUG1(f"Marking {cur_station} as no longer 'live' (old={last_modified}, listing={listing_time}).")
+                                    unliven.append((cur_station,))
+                                    skip_station = True
+                                    continue
+                                
+                                # Unless the import file data is newer, nothing else needs to be done for this station,
+                                # so the rest of the listings for this station can be skipped.
+                                if listing_time <= last_modified:
+                                    skip_station = True
+                                    continue
+                                
+                                # The data from the import file is newer, so we need to delete the old data for this station.
+                                if is_debug:
+                                    self.tdenv.DEBUG1(f"Deleting old listing data for {cur_station} (old={last_modified}, listing={listing_time}).")
+                                flush.append((cur_station,))
+                                last_station_update_times[station_id] = listing_time
+                            
                             if is_debug:
-                                self.tdenv.DEBUG1(f"Marking {cur_station} as no longer 'live' (old={last_modified}, listing={listing_time}).")
-                            cursor.execute(stmt_unliven_station, (cur_station,))
-                            transaction_items += 1
-                            skip_station = True
+                                self.tdenv.DEBUG1(f"Inserting new listing data for {station_id}.")
+                        
+                        # station skip lasts until we change station id.
+                        if skip_station:
                             continue
                         
-                        # Unless the import file data is newer, nothing else needs to be done for this station,
-                        # so the rest of the listings for this station can be skipped.
-                        if listing_time <= last_modified:
-                            skip_station = True
+                        # listings.csv includes rare items, which we are ignoring.
+                        item_id = int(row[item_col])
+                        if item_id not in item_lookup:
                             continue
                         
-                        # The data from the import file is newer, so we need to delete the old data for this station.
-                        if is_debug:
-                            self.tdenv.DEBUG1(f"Deleting old listing data for {cur_station} (old={last_modified}, listing={listing_time}).")
-                        cursor.execute(stmt_flush_station, (cur_station,))
-                        transaction_items += 1
-                        last_station_update_times[station_id] = listing_time
-                
-                # station skip lasts until we change station id.
-                if skip_station:
-                    continue
-                
-                # Since this station is not being skipped, get the data and prepare for insertion into the DB.
-                item_id = int(listing['commodity_id'])
-                # listings.csv includes rare items, which we are ignoring.
-                if item_id not in item_lookup:
-                    continue
-                
-                demand_price = int(listing['sell_price'])
-                demand_units = int(listing['demand'])
-                demand_level = int(listing.get('demand_bracket') or '-1')
-                supply_price = int(listing['buy_price'])
-                supply_units = int(listing['supply'])
-                supply_level = int(listing.get('supply_bracket') or '-1')
+                        add_listing((
+                            station_id, item_id, int(row[time_col]), from_live,
+                            int(row[dp_col]), int(row[du_col]), int(row[dl_col] or -1) if dl_col is not None else -1,
+                            int(row[sp_col]), int(row[su_col]), int(row[sl_col] or -1) if sl_col is not None else -1,
+                        ))
+                    
+                    prog.increment(size)
                 
-                if is_debug:
-                    self.tdenv.DEBUG1(f"Inserting new listing data for {station_id}.")
-                cursor.execute(stmt_add_listing, (
-                        station_id, item_id, listing_time, from_live,
-                        demand_price, demand_units, demand_level,
-                        supply_price, supply_units, supply_level,
-                ))
-                transaction_items += 1
-        
-        # These will take a little while, which has four steps, so we'll make it a counter.
-        with pbar.Progress(1, 40, prefix="Saving"):
-            # Do a final commit to be sure
-            cursor.execute("COMMIT")
-        
-        if self.getOption("optimize"):
-            with pbar.Progress(1, 40, prefix="Optimizing"):
-                db.execute("VACUUM")
-        
-        self.tdb.close()
-        
-        self.tdenv.NOTE("Finished processing market data. End time = {}", self.now())
+                write_pending()
+            
+            with pbar.Progress(1, 40, prefix="Saving"):
+                # Do a final commit to be sure
+                cursor.execute("COMMIT")
+        finally:
+            if deferred_indexes:
+                if db.in_transaction:
+                    db.rollback()
+                with pbar.Progress(1, 40, prefix="Indexing"):
+                    for sql in deferred_indexes:
+                        db.execute(sql)
+                    db.commit()
     
     def run(self):
         self.tdenv.ignoreUnknown = True
         
+        parallel = self.getOption("parallel")
+        if parallel is None:
+            self.parallel = transfers.DEFAULT_FETCHES
+        elif isinstance(parallel, str) and parallel.isdigit() and int(parallel) > 0:
+            self.parallel = int(parallel)
+        else:
+            raise PluginException(
+                "'parallel' needs the number of files to download at once, "
+                "e.g. '-O parallel={}'.".format(transfers.DEFAULT_FETCHES)
+            )
+        
         # Create the /eddb folder for downloading the source files if it doesn't exist.
         try:
             Path(str(self.dataPath)).mkdir()
@@ -316,11 +394,11 @@ class ImportPlugin(plugins.ImportPluginBase):
             pass
         
         # Run 'listings' by default:
-        # If no options, or if only 'force', and/or 'skipvend',
-        # have been passed, enable 'listings'.
+        # If no options, or if only 'force', 'skipvend', 'purge'
+        # and/or 'parallel', have been passed, enable 'listings'.
         default = True
         for option in self.options:
-            if option not in ('force', 'skipvend', 'purge'):
+            if option not in ('force', 'skipvend', 'purge', 'parallel'):
                 default = False
         if default:
             self.options["listings"] = True
@@ -427,41 +505,32 @@ class ImportPlugin(plugins.ImportPluginBase):
             self.options["upvend"] = False
         
         # Download required files and update tables.
-        buildCache = False
-        if self.getOption("upgrade"):
-            if self.downloadFile(self.upgradesPath) or self.getOption("force"):
-                transfers.download(self.tdenv, self.urlOutfitting, self.FDevOutfittingPath)
-                buildCache = True
-        
-        if self.getOption("ship"):
-            if self.downloadFile(self.shipPath) or self.getOption("force"):
-                transfers.download(self.tdenv, self.urlShipyard, self.FDevShipyardPath)
-                buildCache = True
-        
-        if self.getOption("rare"):
-            if self.downloadFile(self.rareItemPath) or self.getOption("force"):
-                buildCache = True
-        
-        if self.getOption("shipvend"):
-            if self.downloadFile(self.shipVendorPath) or self.getOption("force"):
-                buildCache = True
-        
-        if self.getOption("upvend"):
-            if self.downloadFile(self.upgradeVendorPath) or self.getOption("force"):
-                buildCache = True
-        
-        if self.getOption("system"):
-            if self.downloadFile(self.sysPath) or self.getOption("force"):
-                buildCache = True
-        
-        if self.getOption("station"):
-            if self.downloadFile(self.stationsPath) or self.getOption("force"):
-                buildCache = True
-        
-        if self.getOption("item"):
-            if self.downloadFile(self.commoditiesPath) or self.getOption("force"):
-                self.downloadFile(self.categoriesPath)
-                buildCache = True
+        force = self.getOption("force")
+        dumps = [
+            path for option, path in (
+                ("upgrade", self.upgradesPath),
+                ("ship", self.shipPath),
+                ("rare", self.rareItemPath),
+                ("shipvend", self.shipVendorPath),
+                ("upvend", self.upgradeVendorPath),
+                ("system", self.sysPath),
+                ("station", self.stationsPath),
+                ("item", self.commoditiesPath),
+            ) if self.getOption(option)
+        ]
+        listings = [self.listingsPath, self.liveListingsPath] if self.getOption("listings") else []
+        updated = self.downloadFiles(dumps + listings)
+        buildCache = any(force or path in updated for path in dumps)
+        
+        # Some files are only wanted when the ones they go with change.
+        followers = []
+        if self.getOption("upgrade") and (force or self.upgradesPath in updated):
+            followers.append((self.urlOutfitting, self.FDevOutfittingPath, False))
+        if self.getOption("ship") and (force or self.shipPath in updated):
+            followers.append((self.urlShipyard, self.FDevShipyardPath, False))
+        if self.getOption("item") and (force or self.commoditiesPath in updated):
+            followers.append((BASE_URL + str(self.categoriesPath), self.localPath(self.categoriesPath), True))
+        transfers.fetch_all(self.tdenv, followers, parallel=self.parallel)
         
         # Remake the .db files with the updated info.
         if buildCache:
@@ -473,11 +542,9 @@ class ImportPlugin(plugins.ImportPluginBase):
             self.purgeSystems()
             self.tdb.close()
         
-        if self.getOption("listings"):
-            if self.downloadFile(self.listingsPath) or self.getOption("force"):
-                self.importListings(self.listingsPath)
-            if self.downloadFile(self.liveListingsPath) or self.getOption("force"):
-                self.importListings(self.liveListingsPath)
+        for path in listings:
+            if force or path in updated:
+                self.importListings(path)
         
         if self.getOption("listings"):
             self.tdenv.NOTE("Regenerating .prices file.")
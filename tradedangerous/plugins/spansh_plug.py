@@ -2,29 +2,32 @@
 from __future__ import annotations
 
 from collections import namedtuple
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
 from email.utils import parsedate_to_datetime
+from functools import partial
+from itertools import islice
 from pathlib import Path
 from rich.progress import Progress
 
 from .. import plugins, cache, transfers, csvexport, corrections
 
+import gzip
+import io
+import json
+import multiprocessing
 import os
+import queue
 import requests
 import sqlite3
 import sys
+import threading
 import time
 import typing
 import ijson
 
-if sys.version_info.major == 3 and sys.version_info.minor >= 10:
-    from dataclasses import dataclass
-else:
-    dataclass = False  # pylint: disable=invalid-name
-
 if typing.TYPE_CHECKING:
-    from typing import Any, Optional
+    from typing import Any, Callable, Optional
     from collections.abc import Iterable
     from .. tradeenv import TradeEnv
 
@@ -44,70 +47,80 @@ STATION_TYPE_MAP = {
     'Settlement': [25, True],            # odyssey settlements
 }
 
-if dataclass:
-    # Dataclass with slots is considerably cheaper and faster than namedtuple
-    # but is only reliably introduced in 3.10+
-    @dataclass(slots=True)
-    class System:
-        id:             int
-        name:           str
-        pos_x:          float
-        pos_y:          float
-        pos_z:          float
-        modified:       float | None
-    
-    @dataclass(slots=True)
-    class Station:      # pylint: disable=too-many-instance-attributes
-        id:             int
-        system_id:      int
-        name:           str
-        distance:       float
-        max_pad_size:   str
-        market:         str     # should be Optional[bool]
-        black_market:   str     # should be Optional[bool]
-        shipyard:       str     # should be Optional[bool]
-        outfitting:     str     # should be Optional[bool]
-        rearm:          str     # should be Optional[bool]
-        refuel:         str     # should be Optional[bool]
-        repair:         str     # should be Optional[bool]
-        planetary:      str     # should be Optional[bool]
-        type:           int     # station type
-        modified:       float
-    
-    @dataclass(slots=True)
-    class Ship:
-        id:             int
-        name:           str
-        modified:       float
-    
-    @dataclass(slots=True)
-    class Module:
-        id:             int
-        name:           str
-        cls:            int
-        rating:         str
-        ship:           str
-        modified:       float
-    
-    @dataclass(slots=True)
-    class Commodity:
-        id:             int
-        name:           str
-        category:       str
-        demand:         int
-        supply:         int
-        sell:           int
-        buy:            int
-        modified:       float
-
-else:
-    System = namedtuple('System', 'id,name,pos_x,pos_y,pos_z,modified')
-    Station = namedtuple('Station',
-                         'id,system_id,name,distance,max_pad_size,'
-                         'market,black_market,shipyard,outfitting,rearm,refuel,repair,planetary,type,modified')
-    Ship = namedtuple('Ship', 'id,name,modified')
-    Module = namedtuple('Module', 'id,name,cls,rating,ship,modified')
-    Commodity = namedtuple('Commodity', 'id,name,category,demand,supply,sell,buy,modified')
+# Systems the reader hands a parser at a time, and so the writer's batch size.
+BATCH_LINES = 256
+# Bytes to read from a download or stdin at a time.
+CHUNK_SIZE = 1 << 16
+# Parser processes to run by default: leave a CPU for the writer.
+DEFAULT_PARSERS = max(0, min(4, (os.cpu_count() or 1) - 1))
+CAN_FORK = 'fork' in multiprocessing.get_all_start_methods()
+# Timestamps in the dump and the database are UTC.
+EPOCH = datetime(1970, 1, 1)
+
+# The writes the importer queues up while it works through a batch, in the
+# order they are applied: a station's row goes in before what it sells, as
+# replacing a station deletes its vendor and market rows.
+WRITES = {
+    'system': '''
+        INSERT INTO System (system_id, name, pos_x, pos_y, pos_z, modified) VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    'station': '''
+        INSERT OR REPLACE INTO Station (
+            system_id, station_id, name,
+            ls_from_star, max_pad_size,
+            market, blackmarket, shipyard, outfitting,
+            rearm, refuel, repair,
+            planetary,
+            modified,
+            type_id
+        )
+        VALUES (
+            ?, ?, ?,
+            ?, ?,
+            ?, ?, ?, ?,
+            ?, ?, ?,
+            ?,
+            ?,
+            ?
+        )
+    ''',
+    'station_move': "UPDATE Station SET system_id = ? WHERE station_id = ?",
+    'ship': '''
+        INSERT OR REPLACE INTO ShipVendor (
+            ship_id, station_id, modified
+        ) VALUES (
+            ?, ?, IFNULL(?, CURRENT_TIMESTAMP)
+        )
+    ''',
+    'module': '''
+        INSERT OR REPLACE INTO UpgradeVendor (
+            upgrade_id, station_id, modified
+        ) VALUES (
+            ?, ?, IFNULL(?, CURRENT_TIMESTAMP)
+        )
+    ''',
+    'commodity': '''
+        INSERT OR REPLACE INTO StationItem (
+            station_id, item_id, modified,
+            demand_price, demand_units, demand_level,
+            supply_price, supply_units, supply_level, from_live
+        ) VALUES (
+            ?, ?, IFNULL(?, CURRENT_TIMESTAMP),
+            ?, ?, ?,
+            ?, ?, ?, ?
+        )
+    ''',
+}
+
+# Rows are namedtuples, rather than slotted dataclasses, so that the batches
+# parser processes hand to the writer pickle compactly as plain tuples.
+System = namedtuple('System', 'id,name,pos_x,pos_y,pos_z,modified')
+Station = namedtuple('Station',
+                     'id,system_id,name,distance,max_pad_size,'
+                     'market,black_market,shipyard,outfitting,rearm,refuel,repair,planetary,type,modified')
+Ship = namedtuple('Ship', 'id,name,modified')
+Module = namedtuple('Module', 'id,name,cls,rating,ship,modified')
+Commodity = namedtuple('Commodity', 'id,name,category,demand,supply,sell,buy,modified')
 
 
 class Timing:
@@ -210,6 +223,196 @@ def get_timings(started: float, system_count: int, total_station_count: int, *,
     return elapsed, timings
 
 
+class StageStats:
+    """
+    Throughput of one stage of the import: how much it handled, and how long
+    it spent working, waiting for input (starved), and waiting for room in a
+    full queue to the next stage (blocked, i.e. backpressure).
+    """
+    
+    def __init__(self, name: str, unit: str = 'systems'):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+    
+    @contextmanager
+    def timing(self, what: str):
+        """ Adds the time spent in the block to the 'busy', 'starved' or 'blocked' total. """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, what, getattr(self, what) + time.perf_counter() - started)
+    
+    def merge(self, other: StageStats) -> None:
+        """ Adds another process's stats for the same stage. """
+        self.count += other.count
+        self.busy += other.busy
+        self.starved += other.starved
+        self.blocked += other.blocked
+    
+    def describe(self) -> str:
+        """ One line summary for the end of the import. """
+        amount = f'{self.count:,d} {self.unit}'
+        rate = f'{self.count / self.busy if self.busy else 0:,.0f}/s'
+        if self.unit == 'bytes':
+            amount = f'{self.count / 2**20:,.1f} MB'
+            rate = f'{self.count / 2**20 / self.busy if self.busy else 0:,.0f} MB/s'
+        return (
+            f'{self.name:9s}{amount:>14s} in {self.busy:.2f}s ({rate}), '
+            f'starved {self.starved:.2f}s, blocked {self.blocked:.2f}s'
+        )
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    A binary stream over an iterable of byte chunks, such as a download's
+    iter_content(), which counts the bytes read and can copy them to a
+    file as they go by.
+    """
+    
+    def __init__(self, chunks: Iterable[bytes], tee: Optional[typing.BinaryIO] = None):
+        super().__init__()
+        self.chunks = iter(chunks)
+        self.tee = tee
+        self.count = 0
+        self.pending = memoryview(b'')
+    
+    def readable(self) -> bool:
+        return True
+    
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            if self.tee:
+                self.tee.write(chunk)
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        self.count += size
+        return size
+    
+    def tell(self) -> int:
+        return self.count
+
+
+class ParserPool:
+    """
+    Parses a dump laid out as spansh's are, one system per line, in separate
+    processes. A reader thread hands chunks of lines to the parsers through a
+    bounded queue, and batches() yields the parsed systems back in the order
+    they were read. When the writer falls behind, the parsers block on their
+    full output queue, and then the reader blocks on theirs.
+    """
+    
+    def __init__(self, stream: typing.BinaryIO, parsers: int, debug_dir: Optional[str] = None, *,
+                 position: Optional[Callable[[], int]] = None, batch_lines: int = BATCH_LINES):
+        # Forking is quicker to start, and doesn't re-run the main script.
+        context = multiprocessing.get_context('fork' if CAN_FORK else 'spawn')
+        self.stream = stream
+        self.position = position
+        self.batch_lines = batch_lines
+        self.inbox = context.Queue(2 * parsers)
+        self.outbox = context.Queue(2 * parsers)
+        self.processes = [
+            context.Process(target=parser_main, args=(self.inbox, self.outbox, debug_dir), daemon=True)
+            for _ in range(parsers)
+        ]
+        self.reader = threading.Thread(target=self.read, name='spansh reader', daemon=True)
+        self.stop = threading.Event()
+        self.read_error = None
+        self.chunk_positions = {}
+        self.read_stats = StageStats('read', 'bytes')
+        self.parse_stats = StageStats(f'parse x{parsers}')
+    
+    def read(self) -> None:
+        """ Reader thread: sends (seq, lines) chunks to the parsers, then a None for each. """
+        stats = self.read_stats
+        try:
+            for seq in range(sys.maxsize):
+                with stats.timing('busy'):
+                    lines = list(islice(self.stream, self.batch_lines))
+                if not lines:
+                    break
+                stats.count += sum(map(len, lines))
+                self.chunk_positions[seq] = self.position() if self.position else stats.count
+                if not self.put((seq, lines)):
+                    break
+        except Exception as e:  # pylint: disable=broad-except
+            self.read_error = e
+        for _ in self.processes:
+            self.put(None)
+    
+    def put(self, item) -> bool:
+        """ Queues item for the parsers, unless the pool is closed first. """
+        with self.read_stats.timing('blocked'):
+            while not self.stop.is_set():
+                try:
+                    self.inbox.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+        return False
+    
+    def batches(self):
+        """
+        Yields lists of (System, stations) pairs in the order the dump has
+        them, each with position() as of reading them: by default, how many
+        bytes of the stream have been parsed so far.
+        """
+        for process in self.processes:
+            process.start()
+        self.reader.start()
+        try:
+            pending, next_seq, running = {}, 0, len(self.processes)
+            while running:
+                try:
+                    seq, systems = self.outbox.get(timeout=1)
+                except queue.Empty:
+                    self.check()
+                    continue
+                if seq is None:
+                    # A parser is done: 'systems' is its stats, or why it failed.
+                    if not isinstance(systems, StageStats):
+                        raise plugins.PluginException(systems)
+                    self.parse_stats.merge(systems)
+                    running -= 1
+                    continue
+                pending[seq] = systems
+                while next_seq in pending:
+                    yield pending.pop(next_seq), self.chunk_positions.pop(next_seq)
+                    next_seq += 1
+            self.check()
+        finally:
+            self.close()
+    
+    def check(self) -> None:
+        """ Raises a PluginException if the reader or a parser has died. """
+        if self.read_error:
+            raise plugins.PluginException(f'Reading the dump failed: {self.read_error!s}')
+        for process in self.processes:
+            if process.exitcode:
+                raise plugins.PluginException(f'A parser process stopped unexpectedly (exit code {process.exitcode}).')
+    
+    def close(self) -> None:
+        """ Stops the reader and any parsers still running. """
+        self.stop.set()
+        if self.reader.is_alive():
+            self.reader.join()
+        # Don't wait to flush chunks nobody is going to parse.
+        self.inbox.cancel_join_thread()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
 class ImportPlugin(plugins.ImportPluginBase):
     """Plugin that downloads data from https://spansh.co.uk/dumps.
     """
@@ -218,6 +421,12 @@ class ImportPlugin(plugins.ImportPluginBase):
         'url': f'URL to download galaxy data from (defaults to {SOURCE_URL})',
         'file': 'Local filename to import galaxy data from; use "-" to load from stdin',
         'maxage': 'Skip all entries older than specified age in days, ex.: maxage=1.5',
+        'stream': 'Import the dump from the url as it downloads, rather than downloading it to tmpDir first',
+        'keep': 'With stream, also save the dump to tmpDir as it downloads, for reuse',
+        'parsers': (
+            f'Processes that parse the dump while the import writes it (default: {DEFAULT_PARSERS}); '
+            '0 parses as it writes, and reads JSON laid out any way, not just one system per line'
+        ),
     }
     
     def __init__(self, *args, **kwargs):
@@ -225,6 +434,10 @@ class ImportPlugin(plugins.ImportPluginBase):
         self.url = self.getOption('url')
         self.file = self.getOption('file')
         self.maxage = float(self.getOption('maxage')) if self.getOption('maxage') else None
+        self.stream = bool(self.getOption('stream'))
+        self.keep = bool(self.getOption('keep'))
+        if self.stream and self.file:
+            raise plugins.PluginException('The stream option imports from the url, it can\'t be used with file')
         assert not (self.url and self.file), 'Provide either url or file, not both'
         if self.file and (self.file != '-'):
             self.file = (Path(self.tdenv.cwDir, self.file)).resolve()
@@ -243,46 +456,71 @@ class ImportPlugin(plugins.ImportPluginBase):
         
         self.need_commit = False
         self.cursor = self.tdb.getDB().cursor()
-        self.commit_rate = 200
-        self.commit_limit = self.commit_rate
+        self.pending = {statement: [] for statement in WRITES}
+        self.replaced_stations = set()
+        self.stage_stats = []
+        self.age_cutoff = timedelta(days=self.maxage) if self.maxage else None
+        self.now = datetime.now()
         
         self.known_systems = self.load_known_systems()
         self.known_stations = self.load_known_stations()
         self.known_ships = self.load_known_ships()
         self.known_modules = self.load_known_modules()
         self.known_commodities = self.load_known_commodities()
+        self.added_commodities = 0
+        # When each station's shipyard, outfitting and market were last updated.
+        self.ship_times = self.load_vendor_times('ShipVendor')
+        self.module_times = self.load_vendor_times('UpgradeVendor')
+        self.commodity_times = self.load_vendor_times('StationItem')
     
     def print(self, *args, **kwargs) -> None:
         """ Shortcut to the TradeEnv uprint method. """
         self.tdenv.uprint(*args, **kwargs)
     
-    def commit(self, *, force: bool = False) -> None:
-        """ Perform a commit if required, but try not to do a crazy amount of committing. """
-        if not force and not self.need_commit:
-            return
-        
-        if not force and self.commit_limit > 0:
-            self.commit_limit -= 1
+    def commit(self) -> None:
+        """ Commits the writes made so far, if there are any. """
+        if not self.need_commit:
             return
         
         db = self.tdb.getDB()
         db.commit()
         self.cursor = db.cursor()
-        
-        self.commit_limit = self.commit_rate
         self.need_commit = False
     
+    def queue(self, statement: str, row: tuple) -> None:
+        """ Queues a row for one of the WRITES, to be written by the next flush(). """
+        self.pending[statement].append(row)
+    
+    def flush(self) -> None:
+        """ Applies the queued writes, one executemany per statement. """
+        for statement, rows in self.pending.items():
+            if rows:
+                self.executemany(WRITES[statement], rows, commitable=True)
+                rows.clear()
+        self.replaced_stations.clear()
+    
     def run(self):
+        parsers = self.getOption('parsers')
+        if parsers is None:
+            self.parsers = DEFAULT_PARSERS
+        elif isinstance(parsers, str) and parsers.isdigit():
+            self.parsers = int(parsers)
+        else:
+            raise plugins.PluginException(
+                f"'parsers' needs the number of parser processes, e.g. '-O parsers={DEFAULT_PARSERS}', "
+                "or 0 to parse as it writes."
+            )
+        
         if not self.tdenv.detail:
             self.print('This will take at least several minutes...')
             self.print('You can increase verbosity (-v) to get a sense of progress')
         
         theme = self.tdenv.theme
-        BOLD, CLOSE, DIM, ITALIC = theme.bold, theme.CLOSE, theme.dim, theme.italic  # pylint: disable=invalid-name
-        if not self.file:
+        CLOSE, DIM, ITALIC = theme.CLOSE, theme.dim, theme.italic  # pylint: disable=invalid-name
+        if not self.file and not self.stream:
             url = self.url or SOURCE_URL
             local_mod_time = 0
-            self.file = Path(self.tdenv.tmpDir, "galaxy_stations.json")
+            self.file = Path(self.tdenv.tmpDir, dump_name(url))
             if self.file.exists():
                 local_mod_time = self.file.stat().st_mtime
             
@@ -308,184 +546,62 @@ class ImportPlugin(plugins.ImportPluginBase):
         
         sys_desc = f"Importing {ITALIC}spansh{CLOSE} data"
         
-        # TODO: find a better way to get the total number of systems
-        # A bad way to do it:
-        total_systems = 0
-        if self.tdenv.detail:
-            print('Counting total number of systems...')
-        with open(self.file, 'r', encoding='utf8') as stream:
-            for system_data in ijson.items(stream, 'item', use_float=True):
-                total_systems += 1
-                if (not total_systems % 250) and self.tdenv.detail:
-                    print(f'Total systems: {total_systems}', end='\r')
-        
-        if self.tdenv.detail:
-            print(f'Total systems: {total_systems}')
-        
-        with Timing() as timing, Progresser(self.tdenv, sys_desc, total=total_systems) as progress:
-        # with Timing() as timing, Progresser(self.tdenv, sys_desc, total=len(self.known_stations)) as progress:
+        # Progress is measured in bytes of the dump, which saves reading it
+        # through once beforehand to count the systems.
+        with self.open_dump() as (stream, dump_size, tell), \
+                Timing() as timing, Progresser(self.tdenv, sys_desc, total=dump_size) as progress:
             system_count = 0
             total_station_count = 0
             total_ship_count = 0
             total_module_count = 0
             total_commodity_count = 0
             
-            age_cutoff = timedelta(days=self.maxage) if self.maxage else None
-            now = datetime.now()
             started = time.time()
-            
-            for system, station_iter in self.data_stream():
-                upper_sys = system.name.upper()
-                
-                elapsed, averages = get_timings(started, system_count, total_station_count)
-                label = f"{ITALIC}#{system_count:<5d}{CLOSE} {BOLD}{upper_sys:30s}{CLOSE} {DIM}({elapsed:.2f}s, avgs: {averages}){CLOSE}"
-                stations = list(station_iter)
-                with progress.task(label, total=len(stations)) as sta_task:
-                    if system.id not in self.known_systems:
-                        self.ensure_system(system, upper_sys)
-                    
-                    station_count = 0
-                    ship_count = 0
-                    module_count = 0
-                    commodity_count = 0
-                    
-                    for station, ships, modules, commodities in stations:
-                        fq_station_name = f'@{upper_sys}/{station.name}'
-                        
-                        station_info = self.known_stations.get(station.id)
-                        if not station_info or station.modified > station_info[2]:
-                            self.ensure_station(station)
-                        elif station_info[1] != station.system_id:
-                            self.print(f'        |  {station.name:50s}  |  Megaship station moved, updating system')
-                            self.execute("UPDATE Station SET system_id = ? WHERE station_id = ?", station.system_id, station.id, commitable=True)
-                            self.known_stations[station.id] = (station.name, station.system_id, station.modified)
-                        
-                        # Ships
-                        ship_entries = []
-                        db_ship_times = dict(self.execute("SELECT ship_id, modified FROM ShipVendor WHERE station_id = ?", station.id))
-                        
-                        for ship in ships:
-                            if ship.id not in self.known_ships:
-                                ship = self.ensure_ship(ship)
-                            
-                            # We're concerned with the ship age, not the station age,
-                            # as they each have their own 'modified' times.
-                            if age_cutoff and (now - ship.modified) > age_cutoff:
-                                if self.tdenv.detail:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping shipyard due to age: {now - ship.modified}, ts: {ship.modified}')
-                                break
-                            db_modified = db_ship_times.get(ship.id)
-                            modified = parse_ts(db_modified) if db_modified else None
-                            if modified and ship.modified <= modified:
-                                # All ships in a station will have the same modified time,
-                                # so no need to check the rest if the first is older.
-                                if self.tdenv.detail > 2:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping older shipyard data')
-                                break
-                            
-                            ship_entries.append((ship.id, station.id, ship.modified))
-                        if ship_entries:
-                            self.executemany("""INSERT OR REPLACE INTO ShipVendor (
-                                ship_id, station_id, modified
-                            ) VALUES (
-                                ?, ?, IFNULL(?, CURRENT_TIMESTAMP)
-                            )""", ship_entries, commitable=True)
-                            ship_count += len(ship_entries)
-                        
-                        # Upgrades
-                        module_entries = []
-                        db_module_times = dict(self.execute("SELECT upgrade_id, modified FROM UpgradeVendor WHERE station_id = ?", station.id))
-                        
-                        for module in modules:
-                            if module.id not in self.known_modules:
-                                module = self.ensure_module(module)
-                            
-                            # We're concerned with the outfitting age, not the station age,
-                            # as they each have their own 'modified' times.
-                            if age_cutoff and (now - module.modified) > age_cutoff:
-                                if self.tdenv.detail:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping outfitting due to age: {now - station.modified}, ts: {station.modified}')
-                                break
-                            db_modified = db_module_times.get(module.id)
-                            modified = parse_ts(db_modified) if db_modified else None
-                            if modified and module.modified <= modified:
-                                # All modules in a station will have the same modified time,
-                                # so no need to check the rest if the fist is older.
-                                if self.tdenv.detail > 2:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping older outfitting data')
-                                break
-                            
-                            module_entries.append((module.id, station.id, module.modified))
-                        if module_entries:
-                            self.executemany("""INSERT OR REPLACE INTO UpgradeVendor (
-                                upgrade_id, station_id, modified
-                            ) VALUES (
-                                ?, ?, IFNULL(?, CURRENT_TIMESTAMP)
-                            )""", module_entries, commitable=True)
-                            module_count += len(module_entries)
-                        
-                        # Items
-                        commodity_entries = []
-                        db_commodity_times = dict(self.execute("SELECT item_id, modified FROM StationItem WHERE station_id = ?", station.id))
-                        
-                        for commodity in commodities:
-                            if commodity.id not in self.known_commodities:
-                                commodity = self.ensure_commodity(commodity)
-                            
-                            # We're concerned with the market age, not the station age,
-                            # as they each have their own 'modified' times.
-                            if age_cutoff and (now - commodity.modified) > age_cutoff:
+            consumed = 0
+            write_stats = StageStats('write')
+            batches = self.data_stream(stream, tell)
+            try:
+                while True:
+                    with write_stats.timing('starved'):
+                        batch, position = next(batches, (None, None))
+                    if batch is None:
+                        break
+                    with write_stats.timing('busy'):
+                        for system, stations in batch:
+                            upper_sys = system.name.upper()
+                            station_count, ship_count, module_count, commodity_count = self.import_system(system, upper_sys, stations)
+                            system_count += 1
+                            if station_count:
+                                total_station_count += station_count
+                                total_ship_count += ship_count
+                                total_module_count += module_count
+                                total_commodity_count += commodity_count
                                 if self.tdenv.detail:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping market due to age: {now - station.modified}, ts: {station.modified}')
-                                break
-                            
-                            db_modified = db_commodity_times.get(commodity.id)
-                            modified = parse_ts(db_modified) if db_modified else None
-                            if modified and commodity.modified <= modified:
-                                # All commodities in a station will have the same modified time,
-                                # so no need to check the rest if the fist is older.
-                                if self.tdenv.detail > 2:
-                                    self.print(f'        |  {fq_station_name:50s}  |  Skipping older market data')
-                                break
-                            commodity_entries.append((station.id, commodity.id, commodity.modified,
-                                                      commodity.sell, commodity.demand, -1,
-                                                      commodity.buy, commodity.supply, -1, 0))
-                        if commodity_entries:
-                            self.executemany("""INSERT OR REPLACE INTO StationItem (
-                                station_id, item_id, modified,
-                                demand_price, demand_units, demand_level,
-                                supply_price, supply_units, supply_level, from_live
-                            ) VALUES (
-                                ?, ?, IFNULL(?, CURRENT_TIMESTAMP),
-                                ?, ?, ?,
-                                ?, ?, ?, ?
-                            )""", commodity_entries, commitable=True)
-                            commodity_count += len(commodity_entries)
+                                    self.print(
+                                        f'{system_count:6d}  |  {upper_sys:50s}  |  '
+                                        f'{station_count:3d} st {commodity_count:5d} co '
+                                        f'{ship_count:4d} sh {module_count:4d} mo'
+                                    )
                         # Good time to save data and try to keep the transaction small
+                        self.flush()
                         self.commit()
-                        
-                        if commodity_count or ship_count or module_count:
-                            station_count += 1
-                        progress.bump(sta_task)
-                
-                system_count += 1
-                if station_count:
-                    total_station_count += station_count
-                    total_ship_count += ship_count
-                    total_module_count += module_count
-                    total_commodity_count += commodity_count
-                    if self.tdenv.detail:
-                        self.print(
-                            f'{system_count:6d}  |  {upper_sys:50s}  |  '
-                            f'{station_count:3d} st {commodity_count:5d} co '
-                            f'{ship_count:4d} sh {module_count:4d} mo'
-                        )
-                self.commit()
-                
-                if not system_count % 25:
+                    write_stats.count += len(batch)
+                    
+                    _, averages = get_timings(started, system_count, total_station_count)
                     avg_stations = total_station_count / (system_count or 1)
-                    progress.update(f"{sys_desc}{DIM} ({total_station_count}:station:, {system_count}:glowing_star:, {avg_stations:.1f}:station:/:glowing_star:){CLOSE}")
+                    progress.bump(progress.main_task, position - consumed)
+                    consumed = position
+                    progress.update(
+                        f"{sys_desc}{DIM} ({total_station_count}:station:, {system_count}:glowing_star:, "
+                        f"{avg_stations:.1f}:station:/:glowing_star:, avgs: {averages}){CLOSE}"
+                    )
+            finally:
+                batches.close()
             
+            if self.added_commodities:
+                self.tdenv.DEBUG0("Updating ui_order data for items.")
+                if cache.updateItemOrder(self.tdb.getDB()):
+                    self.need_commit = True
             self.commit()
             self.tdb.close()
             self.print(
@@ -493,6 +609,9 @@ class ImportPlugin(plugins.ImportPluginBase):
                 f'{total_station_count} st {total_commodity_count} co '
                 f'{total_ship_count} sh {total_module_count} mo'
             )
+            if self.tdenv.detail:
+                for stats in (*self.stage_stats, write_stats):
+                    self.print(f'    {stats.describe()}')
         
         with Timing() as timing:
             # Need to make sure cached tables are updated
@@ -506,15 +625,203 @@ class ImportPlugin(plugins.ImportPluginBase):
         
         return False
     
-    def data_stream(self):
-        stream = None
-        if self.file == '-':
+    def import_system(self, system: System, upper_sys: str, stations: list) -> tuple[int, int, int, int]:
+        """
+        Queues the writes for a system and its stations, returning how many
+        stations, ships, modules and commodities changed.
+        """
+        if system.id not in self.known_systems:
+            self.ensure_system(system, upper_sys)
+        
+        age_cutoff, now = self.age_cutoff, self.now
+        station_count = 0
+        ship_count = 0
+        module_count = 0
+        commodity_count = 0
+        
+        for station, ships, modules, commodities in stations:
+            fq_station_name = f'@{upper_sys}/{station.name}'
+            
+            station_info = self.known_stations.get(station.id)
+            if not station_info or station.modified > station_info[2]:
+                self.ensure_station(station)
+            elif station_info[1] != station.system_id:
+                self.print(f'        |  {station.name:50s}  |  Megaship station moved, updating system')
+                self.queue('station_move', (station.system_id, station.id))
+                self.known_stations[station.id] = (station.name, station.system_id, station.modified)
+            
+            # Ships
+            ship_entries = []
+            db_modified = self.ship_times.get(station.id)
+            
+            for ship in ships:
+                if ship.id not in self.known_ships:
+                    ship = self.ensure_ship(ship)
+                
+                # We're concerned with the ship age, not the station age,
+                # as they each have their own 'modified' times.
+                if age_cutoff and (now - ship.modified) > age_cutoff:
+                    if self.tdenv.detail:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping shipyard due to age: {now - ship.modified}, ts: {ship.modified}')
+                    break
+                modified = to_epoch(ship.modified)
+                if db_modified and modified <= db_modified:
+                    # All ships in a station will have the same modified time,
+                    # so no need to check the rest if the first is older.
+                    if self.tdenv.detail > 2:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping older shipyard data')
+                    break
+                
+                ship_entries.append((ship.id, station.id, ship.modified))
+            for entry in ship_entries:
+                self.queue('ship', entry)
+            if ship_entries:
+                self.ship_times[station.id] = modified
+            ship_count += len(ship_entries)
+            
+            # Upgrades
+            module_entries = []
+            db_modified = self.module_times.get(station.id)
+            
+            for module in modules:
+                if module.id not in self.known_modules:
+                    module = self.ensure_module(module)
+                
+                # We're concerned with the outfitting age, not the station age,
+                # as they each have their own 'modified' times.
+                if age_cutoff and (now - module.modified) > age_cutoff:
+                    if self.tdenv.detail:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping outfitting due to age: {now - station.modified}, ts: {station.modified}')
+                    break
+                modified = to_epoch(module.modified)
+                if db_modified and modified <= db_modified:
+                    # All modules in a station will have the same modified time,
+                    # so no need to check the rest if the fist is older.
+                    if self.tdenv.detail > 2:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping older outfitting data')
+                    break
+                
+                module_entries.append((module.id, station.id, module.modified))
+            for entry in module_entries:
+                self.queue('module', entry)
+            if module_entries:
+                self.module_times[station.id] = modified
+            module_count += len(module_entries)
+            
+            # Items
+            commodity_entries = []
+            db_modified = self.commodity_times.get(station.id)
+            
+            for commodity in commodities:
+                if commodity.id not in self.known_commodities:
+                    commodity = self.ensure_commodity(commodity)
+                
+                # We're concerned with the market age, not the station age,
+                # as they each have their own 'modified' times.
+                if age_cutoff and (now - commodity.modified) > age_cutoff:
+                    if self.tdenv.detail:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping market due to age: {now - station.modified}, ts: {station.modified}')
+                    break
+                
+                modified = to_epoch(commodity.modified)
+                if db_modified and modified <= db_modified:
+                    # All commodities in a station will have the same modified time,
+                    # so no need to check the rest if the fist is older.
+                    if self.tdenv.detail > 2:
+                        self.print(f'        |  {fq_station_name:50s}  |  Skipping older market data')
+                    break
+                commodity_entries.append((station.id, commodity.id, commodity.modified,
+                                          commodity.sell, commodity.demand, -1,
+                                          commodity.buy, commodity.supply, -1, 0))
+            for entry in commodity_entries:
+                self.queue('commodity', entry)
+            if commodity_entries:
+                self.commodity_times[station.id] = modified
+            commodity_count += len(commodity_entries)
+            
+            if commodity_count or ship_count or module_count:
+                station_count += 1
+        
+        return station_count, ship_count, module_count, commodity_count
+    
+    def data_stream(self, stream: typing.BinaryIO, position: Callable[[], int]):
+        """
+        Yields the systems in the dump, in order, as lists of (System, stations)
+        pairs (see ingest_system), each with position() as of reading them.
+        They are parsed by a ParserPool, or here if parsers=0.
+        """
+        debug_dir = self.tdenv.tmpDir if self.tdenv.debug else None
+        if self.parsers > 0:
+            pool = ParserPool(stream, self.parsers, debug_dir, position=position)
+            self.stage_stats += (pool.read_stats, pool.parse_stats)
+            yield from pool.batches()
+        else:
+            yield from self.ingest_stream(stream, position, debug_dir)
+    
+    @contextmanager
+    def open_dump(self):
+        """
+        Opens the dump, yielding (stream, size, position): the JSON as a binary
+        stream, the size of its source in bytes if known, and a function that
+        returns how many of those bytes have been read.
+        
+        With the stream option, the JSON comes straight from the download,
+        and with keep as well, it's saved to tmpDir as it's read, for reuse.
+        """
+        if self.stream:
+            with self.open_download() as opened:
+                yield opened
+        elif self.file == '-':
             self.print('Reading data from stdin')
-            stream = sys.stdin
-        elif self.file:
+            reader = ChunkReader(iter(partial(sys.stdin.buffer.read1, CHUNK_SIZE), b''))
+            yield io.BufferedReader(reader, CHUNK_SIZE), None, reader.tell
+        else:
             self.print(f'Reading data from local file: "{self.file}"')
-            stream = open(self.file, 'r', encoding='utf8')
-        return self.ingest_stream(stream)
+            with open(self.file, 'rb') as fh:
+                stream = gzip.GzipFile(fileobj=fh) if self.file.suffix == '.gz' else fh
+                yield stream, os.fstat(fh.fileno()).st_size, fh.tell
+    
+    @contextmanager
+    def open_download(self):
+        """ open_dump() for the stream option. """
+        url = self.url or SOURCE_URL
+        self.print(f'Streaming data from remote URL: {url}')
+        try:
+            response = requests.get(url, headers={"User-Agent": "Trade-Dangerous"}, stream=True, timeout=70)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise plugins.PluginException(f"Problem with download:\n    URL: {url}\n    Error: {e!s}") from None
+        
+        keep_path = Path(self.tdenv.tmpDir, dump_name(url))
+        part_path = keep_path.with_name(keep_path.name + '.part')
+        if self.keep:
+            keep_path.parent.mkdir(parents=True, exist_ok=True)
+        completed = False
+        with response, (open(part_path, 'wb') if self.keep else nullcontext()) as tee:
+            # requests undoes any Content-Encoding; a .gz file is ours to decompress.
+            stream = io.BufferedReader(ChunkReader(response.iter_content(CHUNK_SIZE), tee), CHUNK_SIZE)
+            if keep_path.suffix == '.gz':
+                stream = gzip.GzipFile(fileobj=stream)
+            # The length and tell() both count the bytes on the wire.
+            size = int(response.headers.get('content-length') or 0) or None
+            try:
+                yield stream, size, response.raw.tell
+                if tee:
+                    while stream.read(CHUNK_SIZE):
+                        pass
+                completed = True
+            finally:
+                if tee and not completed:
+                    tee.close()
+                    part_path.unlink()
+        
+        if self.keep:
+            os.replace(part_path, keep_path)
+            last_modified = response.headers.get("last-modified")
+            if last_modified:
+                dump_mod_time = parsedate_to_datetime(last_modified).timestamp()
+                os.utime(keep_path, (dump_mod_time, dump_mod_time))
+            self.print(f'Saved the download to local file: "{keep_path}"')
     
     def execute(self, query: str, *params, commitable: bool = False) -> sqlite3.Cursor:
         """ helper method that performs retriable queries and marks the transaction 
@@ -599,42 +906,35 @@ class ImportPlugin(plugins.ImportPluginBase):
             self.tdenv.DEBUG0(f"load_known_commodities query raised {e}")
             return {}
     
+    def load_vendor_times(self, table: str) -> dict[int, int]:
+        """
+        Returns a dictionary of {station_id -> Unix time} of the newest entry for
+        each station in a vendor or market table, for comparing with to_epoch().
+        """
+        try:
+            return dict(self.cursor.execute(f"""
+                SELECT  station_id, CAST(strftime('%s', MAX(modified)) AS INTEGER)
+                  FROM  {table}
+                 GROUP  BY station_id
+            """))
+        except Exception as e:  # pylint: disable=broad-except
+            self.print(f"[purple]:thinking_face:Assuming no {table} data yet")
+            self.tdenv.DEBUG0(f"load_vendor_times query raised {e}")
+            return {}
+    
     def ensure_system(self, system: System, upper_name: str) -> None:
         """ Adds a record for a system, and registers the system in the known_systems dict. """
-        self.execute(
-            '''
-            INSERT INTO System (system_id, name, pos_x, pos_y, pos_z, modified) VALUES (?, ?, ?, ?, ?, ?)
-            ''',
-            system.id, system.name, system.pos_x, system.pos_y, system.pos_z, system.modified,
-            commitable=True,
-        )
+        self.queue('system', (system.id, system.name, system.pos_x, system.pos_y, system.pos_z, system.modified))
         if self.tdenv.detail > 1:
             self.print(f'        |  {upper_name:50s}  |  Added missing system :glowing_star:')
         self.known_systems[system.id] = system.name
     
     def ensure_station(self, station: Station) -> None:
         """ Adds a record for a station, and registers the station in the known_stations dict. """
-        self.execute(
-            '''
-            INSERT OR REPLACE INTO Station (
-                system_id, station_id, name,
-                ls_from_star, max_pad_size,
-                market, blackmarket, shipyard, outfitting,
-                rearm, refuel, repair,
-                planetary,
-                modified,
-                type_id
-            )
-            VALUES (
-                ?, ?, ?,
-                ?, ?,
-                ?, ?, ?, ?,
-                ?, ?, ?,
-                ?,
-                ?,
-                ?
-            )
-            ''',
+        if station.id in self.replaced_stations:
+            # Its first replacement has to go in before this one, with what it sold.
+            self.flush()
+        self.queue('station', (
             station.system_id,
             station.id,
             station.name,
@@ -650,8 +950,11 @@ class ImportPlugin(plugins.ImportPluginBase):
             self.bool_yn(station.planetary),
             station.modified,
             station.type,
-            commitable=True,
-        )
+        ))
+        self.replaced_stations.add(station.id)
+        # Replacing the station deletes what it sold.
+        for times in (self.ship_times, self.module_times, self.commodity_times):
+            times.pop(station.id, None)
         note = "Updated" if self.known_stations.get(station.id) else "Added"
         if self.tdenv.detail > 1:
             system_name = self.known_systems[station.system_id]
@@ -687,7 +990,10 @@ class ImportPlugin(plugins.ImportPluginBase):
         return module
     
     def ensure_commodity(self, commodity: Commodity):
-        """ Adds a record for a commodity and registers the commodity in the known_commodities dict. """
+        """
+        Adds a record for a commodity and registers the commodity in the known_commodities dict.
+        The items' ui_order is brought up to date once the import has added them all.
+        """
         self.execute(
             '''
             INSERT INTO Item (item_id, category_id, name, fdev_id)
@@ -700,33 +1006,8 @@ class ImportPlugin(plugins.ImportPluginBase):
             commitable=True,
         )
         
-        # Need to update ui_order
-        temp = self.execute("""SELECT name, category_id, fdev_id, ui_order
-                        FROM Item
-                        ORDER BY category_id, name
-                        """)
-        cat_id = 0
-        ui_order = 1
-        self.tdenv.DEBUG0("Updating ui_order data for items.")
-        changes = []
-        for name, db_cat, fdev_id, db_order in temp:
-            if db_cat != cat_id:
-                ui_order = 1
-                cat_id = db_cat
-            else:
-                ui_order += 1
-            if ui_order != db_order:
-                self.tdenv.DEBUG0(f"UI order for {name} ({fdev_id}) needs correction.")
-                changes += [(ui_order, fdev_id)]
-        
-        if changes:
-            self.executemany(
-                "UPDATE Item SET ui_order = ? WHERE fdev_id = ?",
-                changes,
-                commitable=True
-            )
-        
         self.known_commodities[commodity.id] = commodity.name
+        self.added_commodities += 1
         
         return commodity
     
@@ -734,27 +1015,89 @@ class ImportPlugin(plugins.ImportPluginBase):
         """ translates a ternary (none, true, false) into the ?/Y/N representation """
         return '?' if value is None else ('Y' if value else 'N')
     
-    def ingest_stream(self, stream):
-        """Ingest a spansh-style galaxy dump, yielding system-level data."""
-        for system_data in ijson.items(stream, 'item', use_float=True):
-            if "Shinrarta Dezhra" in system_data.get('name') and self.tdenv.debug:
-                with open(Path(self.tdenv.tmpDir, "shin_dez.json"), 'w') as file:
-                    # file.write(system_data)
-                    import json
-                    json.dump(system_data, file, indent=4)
-            
-            coords = system_data.get('coords', {})
-            yield (
-                System(
-                    id=system_data.get('id64'),
-                    name=system_data.get('name', 'Unnamed').strip(),
-                    pos_x=coords.get('x', 999999),
-                    pos_y=coords.get('y', 999999),
-                    pos_z=coords.get('z', 999999),
-                    modified=parse_ts(system_data.get('date')),
-                ),
-                ingest_stations(system_data),
-            )
+    def ingest_stream(self, stream, position: Callable[[], int], debug_dir: Optional[str] = None):
+        """ Ingest a spansh-style galaxy dump laid out any way, yielding batches of system-level data. """
+        stats = StageStats('parse')
+        self.stage_stats.append(stats)
+        systems = ijson.items(stream, 'item', use_float=True)
+        while True:
+            with stats.timing('busy'):
+                batch = []
+                for system_data in islice(systems, BATCH_LINES):
+                    dump_debug_system(system_data, debug_dir)
+                    batch.append(ingest_system(system_data))
+            if not batch:
+                break
+            stats.count += len(batch)
+            yield batch, position()
+
+
+def parser_main(inbox, outbox, debug_dir: Optional[str] = None) -> None:
+    """
+    Body of a ParserPool process: turns (seq, lines) chunks from the inbox
+    into (seq, systems) batches on the outbox until it gets None, and then
+    sends (None, its StageStats), or (None, why it failed) if it fails.
+    """
+    stats = StageStats('parse')
+    try:
+        while True:
+            with stats.timing('starved'):
+                job = inbox.get()
+            if job is None:
+                break
+            seq, lines = job
+            with stats.timing('busy'):
+                systems = parse_lines(lines, debug_dir)
+            stats.count += len(systems)
+            with stats.timing('blocked'):
+                outbox.put((seq, systems))
+    except json.JSONDecodeError as e:
+        outbox.put((None, f"The dump isn't one system per line ({e!s}); use parsers=0 to read it."))
+        return
+    except Exception as e:  # pylint: disable=broad-except
+        outbox.put((None, f'Parsing the dump failed: {type(e).__name__}: {e!s}'))
+        return
+    outbox.put((None, stats))
+
+
+def parse_lines(lines: Iterable[bytes], debug_dir: Optional[str] = None) -> list:
+    """
+    Parses lines of a dump laid out as spansh's are, a JSON array with one
+    system per line, into a list of (System, stations) pairs.
+    """
+    systems = []
+    for line in lines:
+        line = line.strip().lstrip(b'[').rstrip(b',]').strip()
+        if line:
+            system_data = json.loads(line)
+            dump_debug_system(system_data, debug_dir)
+            systems.append(ingest_system(system_data))
+    return systems
+
+
+def dump_debug_system(system_data: dict, debug_dir: Optional[str]) -> None:
+    """ Saves Shinrarta Dezhra's data, as a sample, when debugging. """
+    if debug_dir and "Shinrarta Dezhra" in system_data.get('name'):
+        with open(Path(debug_dir, "shin_dez.json"), 'w') as file:
+            json.dump(system_data, file, indent=4)
+
+
+def ingest_system(system_data):
+    """Ingest a system's data into (System, [(Station, ships, modules, commodities), ...])."""
+    coords = system_data.get('coords', {})
+    system = System(
+        id=system_data.get('id64'),
+        name=system_data.get('name', 'Unnamed').strip(),
+        pos_x=coords.get('x', 999999),
+        pos_y=coords.get('y', 999999),
+        pos_z=coords.get('z', 999999),
+        modified=parse_ts(system_data.get('date')),
+    )
+    stations = [
+        (station, list(ships), list(modules), list(commodities))
+        for station, ships, modules, commodities in ingest_stations(system_data)
+    ]
+    return system, stations
 
 
 def ingest_stations(system_data):
@@ -811,17 +1154,19 @@ def ingest_shipyard(shipyard):
     """Ingest station-level market data, yielding commodities."""
     if not shipyard or not shipyard.get('ships'):
         return None
+    modified = parse_ts(shipyard.get('updateTime'))
     for ship in shipyard['ships']:
         yield Ship(
             id=ship.get('shipId'),
             name=ship.get('name'),
-            modified=parse_ts(shipyard.get('updateTime'))
+            modified=modified
         )
 
 def ingest_outfitting(outfitting):
     """Ingest station-level market data, yielding commodities."""
     if not outfitting or not outfitting.get('modules'):
         return None
+    modified = parse_ts(outfitting.get('updateTime'))
     for module in outfitting['modules']:
         yield Module(
             id=module.get('moduleId'),
@@ -829,13 +1174,14 @@ def ingest_outfitting(outfitting):
             cls=module.get('class'),
             rating=module.get('rating'),
             ship=module.get('ship'),
-            modified=parse_ts(outfitting.get('updateTime'))
+            modified=modified
         )
 
 def ingest_market(market):
     """Ingest station-level market data, yielding commodities."""
     if not market or not market.get('commodities'):
         return None
+    modified = parse_ts(market.get('updateTime'))
     for commodity in market['commodities']:
         yield Commodity(
             id=commodity.get('commodityId'),
@@ -845,9 +1191,17 @@ def ingest_market(market):
             supply=commodity.get('supply', 0),
             sell=commodity.get('sellPrice', 0),
             buy=commodity.get('buyPrice', 0),
-            modified=parse_ts(market.get('updateTime'))
+            modified=modified
         )
 
+def dump_name(url: str) -> str:
+    """ The name to save the dump at url under in tmpDir. """
+    return transfers.get_filename_from_url(url) or 'galaxy_stations.json'
+
+def to_epoch(modified: Optional[datetime]) -> int:
+    """ Converts a parse_ts() time to a Unix time, or 0 if there isn't one. """
+    return (modified - EPOCH) // timedelta(seconds=1) if modified else 0
+
 def parse_ts(ts):
     if ts is None:
         return None
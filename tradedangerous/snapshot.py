@@ -0,0 +1,231 @@
+"""
+Place snapshots: the System and Station tables in a form that loads
+without going through SQLite.
+
+Loading the stations means reading every station's item count and
+price age, which dominates TradeDB startup on a large database. A
+PlaceSnapshot keeps the rows TradeDB builds its System and Station
+objects from, and those counts, as packed columns in a sidecar
+file next to the database (e.g. "TradeDangerous.snapshot"). It is
+stamped with the size and modification time of the database and its
+write-ahead log, so any change to the database retires it.
+
+See TradeDB._loadPlaces.
+"""
+from __future__ import annotations
+
+from array import array
+import os
+import struct
+import sys
+import typing
+
+if typing.TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Optional
+
+
+class PlaceSnapshot:
+    """
+    The rows TradeDB loads its places from.
+    
+    Attributes:
+        signature
+            fileSignature() of the database the rows were read from,
+        systems
+            (system_id, name, pos_x, pos_y, pos_z, added_id) rows,
+        stations
+            (station_id, system_id, name, ls_from_star, market,
+            blackmarket, shipyard, max_pad_size, outfitting, rearm,
+            refuel, repair, planetary, type_id) rows,
+        markets
+            (station_id, item count, average JULIANDAY(modified)) for
+            each station with prices.
+    """
+    
+    fileMagic = b"TDPS"
+    fileVersion = 1
+    # magic, version, signature, systems, stations, markets, name bytes
+    fileHeader = struct.Struct("<4sI32sQQQQQ")
+    
+    # Numeric columns by row index, then the one-letter flag columns.
+    systemColumns = ((0, 'q'), (2, 'd'), (3, 'd'), (4, 'd'), (5, 'q'))
+    stationColumns = ((0, 'q'), (1, 'q'), (3, 'd'), (13, 'q'))
+    stationFlags = range(4, 13)
+    marketColumns = ((0, 'q'), (1, 'q'), (2, 'd'))
+    
+    def __init__(self, signature, systems, stations, markets):
+        self.signature = signature
+        self.systems = systems
+        self.stations = stations
+        self.markets = markets
+    
+    @staticmethod
+    def fileSignature(dbPath: Path) -> bytes:
+        """
+        Returns a stamp that changes whenever the database at dbPath,
+        or its write-ahead log, is written to.
+        """
+        stamp = []
+        for path in (dbPath, dbPath.with_name(dbPath.name + "-wal")):
+            # SQLite leaves an empty log behind while connected.
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                stat = None
+            if stat and stat.st_size:
+                stamp += (stat.st_mtime_ns, stat.st_size)
+            else:
+                stamp += (0, 0)
+        return struct.pack("<4q", *stamp)
+    
+    @classmethod
+    def fromDB(cls, db, signature: bytes) -> PlaceSnapshot:
+        """ Reads the rows from an open database connection. """
+        systems = db.execute("""
+            SELECT  system_id,
+                    name, pos_x, pos_y, pos_z,
+                    added_id
+              FROM  System
+        """).fetchall()
+        stations = db.execute("""
+            SELECT  station_id, system_id, name,
+                    ls_from_star, market, blackmarket, shipyard,
+                    max_pad_size, outfitting, rearm, refuel, repair, planetary, type_id
+              FROM  Station
+        """).fetchall()
+        return cls(signature, systems, stations, cls.marketRows(db))
+    
+    @staticmethod
+    def marketRows(db) -> list:
+        """
+        Returns the markets rows from the StationMarketSummary table
+        (see cache.updateMarketSummary), recounting only the stations
+        whose prices changed since it was updated. Databases without
+        the summary count every StationItem row.
+        """
+        hasSummary = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StationMarketSummary'"
+        ).fetchone()
+        if not hasSummary:
+            return db.execute("""
+                SELECT  station_id,
+                        COUNT(*) AS item_count,
+                        AVG(JULIANDAY(modified))
+                  FROM  StationItem
+                 GROUP  BY 1
+                 HAVING item_count > 0
+            """).fetchall()
+        return db.execute("""
+            SELECT  station_id,
+                    item_count,
+                    avg_modified / 86400.0 + 2440587.5
+              FROM  StationMarketSummary
+             WHERE  station_id NOT IN (SELECT station_id FROM StationMarketDirty)
+             UNION  ALL
+            SELECT  station_id,
+                    COUNT(*),
+                    AVG(JULIANDAY(modified))
+              FROM  StationItem
+             WHERE  station_id IN (SELECT station_id FROM StationMarketDirty)
+             GROUP  BY 1
+        """).fetchall()
+    
+    @classmethod
+    def load(cls, path: Path, signature: bytes) -> Optional[PlaceSnapshot]:
+        """
+        Returns the snapshot saved at path, or None if there isn't one
+        or it was taken of a different database.
+        """
+        try:
+            data = memoryview(path.read_bytes())
+        except OSError:
+            return None
+        size = cls.fileHeader.size
+        if len(data) < size:
+            return None
+        magic, version, fileSignature, *counts = cls.fileHeader.unpack(data[:size])
+        if (magic, version, fileSignature) != (cls.fileMagic, cls.fileVersion, signature):
+            return None
+        
+        nSystems, nStations, nMarkets, systemNames, stationNames = counts
+        offset = size
+        
+        def read(typecode, count):
+            nonlocal offset
+            values = array(typecode)
+            end = offset + values.itemsize * count
+            values.frombytes(data[offset:end])
+            if sys.byteorder != "little":
+                values.byteswap()
+            offset = end
+            return values
+        
+        def readText(length):
+            nonlocal offset
+            text = bytes(data[offset:offset + length]).decode()
+            offset += length
+            return text
+        
+        def readNames(length, count):
+            names = readText(length).split("\0") if count else []
+            if len(names) != count:
+                raise ValueError("name count mismatch")
+            return names
+        
+        try:
+            systemCols = [read(typecode, nSystems) for _, typecode in cls.systemColumns]
+            systemCols.insert(1, readNames(systemNames, nSystems))
+            stationCols = [read(typecode, nStations) for _, typecode in cls.stationColumns]
+            flags = readText(nStations * len(cls.stationFlags))
+            stationCols.insert(2, readNames(stationNames, nStations))
+            marketCols = [read(typecode, nMarkets) for _, typecode in cls.marketColumns]
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if offset != len(data):
+            return None
+        
+        flagCols = [
+            flags[col * nStations:(col + 1) * nStations]
+            for col in range(len(cls.stationFlags))
+        ]
+        ID, systemID, name, lsFromStar, typeID = stationCols
+        return cls(
+            signature,
+            list(zip(*systemCols)),
+            list(zip(ID, systemID, name, lsFromStar, *flagCols, typeID)),
+            list(zip(*marketCols)),
+        )
+    
+    def save(self, path: Path) -> None:
+        """ Writes the snapshot to path, replacing any previous file. """
+        systemNames = "\0".join(row[1] for row in self.systems).encode()
+        stationNames = "\0".join(row[2] for row in self.stations).encode()
+        flags = "".join(
+            "".join(row[col] for row in self.stations)
+            for col in self.stationFlags
+        ).encode("ascii")
+        if len(flags) != len(self.stations) * len(self.stationFlags):
+            raise ValueError("station flags must be single letters")
+        
+        def pack(rows, columns):
+            for col, typecode in columns:
+                values = array(typecode, (row[col] or 0 for row in rows))
+                if sys.byteorder != "little":
+                    values.byteswap()
+                yield values.tobytes()
+        
+        tmpPath = path.with_name(path.name + ".tmp")
+        with tmpPath.open("wb") as fh:
+            fh.write(self.fileHeader.pack(
+                self.fileMagic, self.fileVersion, self.signature,
+                len(self.systems), len(self.stations), len(self.markets),
+                len(systemNames), len(stationNames),
+            ))
+            fh.writelines(pack(self.systems, self.systemColumns))
+            fh.write(systemNames)
+            fh.writelines(pack(self.stations, self.stationColumns))
+            fh.write(flags)
+            fh.write(stationNames)
+            fh.writelines(pack(self.markets, self.marketColumns))
+        os.replace(tmpPath, path)
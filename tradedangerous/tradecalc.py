@@ -32,6 +32,13 @@ Classes:
     
     TradeLoad
         Describe a cargo load to be carried on a hop.
+    
+    PriceMatrix
+        Optional columnar (station x item) copy of the loaded prices
+        used to vectorise getTrades when numpy is available.
+    
+    TradeListCache
+        Bounded LRU of the sorted trade lists between station pairs.
 """
 
 ######################################################################
@@ -39,18 +46,38 @@ Classes:
 
 from collections import defaultdict
 from collections import namedtuple
+from collections import OrderedDict
 from .tradedb import System, Station, Trade, describeAge
 from .tradedb import Destination
 from .tradeexcept import TradeException
+from . import tradedb
 
+import copy
 import datetime
+import itertools
 import locale
-import os
+import multiprocessing
 from .misc import progress as pbar
 import re
 import sys
 import time
 
+# Only the price matrix and dpFit's table use numpy; see hasNumpy().
+numpy = None
+
+
+def hasNumpy() -> bool:
+    """ Returns whether numpy is installed, importing it as tradecalc.numpy on first use. """
+    global numpy  # pylint: disable=global-statement
+    if numpy is None and tradedb.hasNumpy():
+        numpy = tradedb.numpy
+    return numpy is not None
+
+
+# Parallel getBestHops workers inherit the loaded price data, so they
+# are only available where we can fork.
+canForkWorkers = 'fork' in multiprocessing.get_all_start_methods()
+
 locale.setlocale(locale.LC_ALL, '')
 
 ######################################################################
@@ -491,12 +518,219 @@ class Route:
         )
 
 
+class PriceMatrix:
+    """
+    Columnar copy of the prices loaded by TradeCalc.
+    
+    Prices, units, levels and ages are stored as station x item numpy
+    arrays, with a sparse index of the item columns each station sells,
+    so that the trades between two stations can be found with a few
+    vectorised operations instead of building a dict per call.
+    
+    Only stations with price data get a row; use rowOf() to map a
+    station ID to its row.
+    
+    Attributes:
+        items
+            List of Item objects, indexed by column,
+        supplyCr, supplyUnits, supplyLevel, supplyAge
+            Arrays describing what each station sells,
+        demandCr, demandUnits, demandLevel, demandAge
+            Arrays describing what each station buys,
+        sellColumns
+            Per row, array of the columns the station sells, in the
+            order they were loaded.
+    """
+    
+    def __init__(self, itemByID, stationsSelling, stationsBuying):
+        if not hasNumpy():
+            raise TradeException("The columnar price matrix requires numpy.")
+        
+        stationIDs = sorted(set(stationsSelling) | set(stationsBuying))
+        self.rowByStationID = {ID: row for row, ID in enumerate(stationIDs)}
+        itemIDs = sorted(itemByID)
+        colByItemID = {ID: col for col, ID in enumerate(itemIDs)}
+        self.items = [itemByID[ID] for ID in itemIDs]
+        
+        shape = (len(stationIDs), len(itemIDs))
+        
+        def fill(listing, prefix):
+            cr = numpy.zeros(shape, dtype=numpy.int32)
+            units = numpy.zeros(shape, dtype=numpy.int32)
+            level = numpy.zeros(shape, dtype=numpy.int8)
+            age = numpy.zeros(shape, dtype=numpy.int64)
+            columns = {}
+            for stnID, values in listing.items():
+                if not values:
+                    continue
+                row = self.rowByStationID[stnID]
+                cols = numpy.array(
+                    [colByItemID[value[0]] for value in values],
+                    dtype=numpy.intp
+                )
+                cr[row, cols] = [value[1] for value in values]
+                units[row, cols] = [value[2] for value in values]
+                level[row, cols] = [value[3] for value in values]
+                age[row, cols] = [value[4] for value in values]
+                columns[row] = cols
+            setattr(self, prefix + "Cr", cr)
+            setattr(self, prefix + "Units", units)
+            setattr(self, prefix + "Level", level)
+            setattr(self, prefix + "Age", age)
+            return columns
+        
+        self.sellColumns = fill(stationsSelling, "supply")
+        fill(stationsBuying, "demand")
+    
+    def rowOf(self, stationID):
+        """ Returns the matrix row of a station, or None. """
+        return self.rowByStationID.get(stationID, None)
+    
+    def affordableColumns(self, srcRow, maxCostCr):
+        """
+        Returns the columns sold at srcRow that cost no more than
+        maxCostCr, in load order.
+        """
+        cols = self.sellColumns.get(srcRow, None)
+        if cols is None:
+            return None
+        return cols[self.supplyCr[srcRow, cols] <= maxCostCr]
+    
+    def getTrades(self, srcRow, dstRow, srcCols, minGainCr, maxGainCr):
+        """
+        Vectorised equivalent of TradeCalc.getTrades: returns a list of
+        Trade for the items in srcCols that dstRow buys with a gain
+        between minGainCr and maxGainCr, sorted by gain DESC, cost ASC.
+        """
+        return self.getTradesTo(srcRow, (dstRow,), srcCols, minGainCr, maxGainCr)[0]
+    
+    def getTradesTo(self, srcRow, dstRows, srcCols, minGainCr, maxGainCr):
+        """
+        Like getTrades but for many destinations at once, which lets a
+        whole hop from one station be evaluated in a single pass.
+        Returns a list of trade lists parallel to dstRows; rows that
+        are None get an empty list.
+        """
+        results = [[] for _ in dstRows]
+        valid = [i for i, row in enumerate(dstRows) if row is not None]
+        if not valid or srcCols is None or not len(srcCols):
+            return results
+        rows = numpy.array([dstRows[i] for i in valid], dtype=numpy.intp)
+        
+        costCr = self.supplyCr[srcRow, srcCols].astype(numpy.int64)
+        dmdCr = self.demandCr[numpy.ix_(rows, srcCols)]
+        gainCr = dmdCr - costCr
+        mask = (dmdCr > 0) & (gainCr >= minGainCr) & (gainCr <= maxGainCr)
+        counts = mask.sum(axis=1).tolist()
+        if not any(counts):
+            return results
+        
+        # Push the rejects to the end of each row, then sort by gain DESC,
+        # cost ASC. lexsort is stable, so ties keep the load order just
+        # like the pair of list.sort calls in TradeCalc.getTrades.
+        sortGain = numpy.where(mask, -gainCr, numpy.iinfo(numpy.int64).max)
+        sortCost = numpy.broadcast_to(costCr, sortGain.shape)
+        order = numpy.lexsort((sortCost, sortGain))
+        
+        # Only the first 'count' entries of each row are trades; gather
+        # just those so we don't convert the rejects to python objects.
+        ranked = numpy.arange(len(srcCols)) < numpy.array(counts)[:, None]
+        rowIdx, rankIdx = numpy.nonzero(ranked)
+        colIdx = order[rowIdx, rankIdx]
+        cols = srcCols[colIdx]
+        dstIdx = (rows[rowIdx], cols)
+        
+        trades = zip(
+            cols.tolist(),
+            costCr[colIdx].tolist(),
+            gainCr[rowIdx, colIdx].tolist(),
+            self.supplyUnits[srcRow, cols].tolist(),
+            self.supplyLevel[srcRow, cols].tolist(),
+            self.demandUnits[dstIdx].tolist(),
+            self.demandLevel[dstIdx].tolist(),
+            self.supplyAge[srcRow, cols].tolist(),
+            self.demandAge[dstIdx].tolist(),
+        )
+        
+        items = self.items
+        for i, count in zip(valid, counts):
+            if count:
+                results[i] = [
+                    Trade(items[col], *values)
+                    for col, *values in itertools.islice(trades, count)
+                ]
+        return results
+
+
+# Names accepted for TradeCalc's 'fit' and the methods they select.
+fitFunctions = {
+    'simple': 'simpleFit',
+    'fast': 'fastFit',
+    'brute': 'bruteForceFit',
+    'dp': 'dpFit',
+}
+
+# Upper bound on the (units x credit buckets) table used by dpFit.
+dpFitCells = 1 << 14
+
+# Station pairs kept by TradeCalc.tradeCache unless told otherwise.
+defaultTradeCacheSize = 100000
+
+# Allowance (in ly squared) for rounding at the edge of a price region.
+regionSlack = 1e-6
+
+
+class TradeListCache:
+    """
+    Bounded LRU cache of the trade lists from getTrades, keyed by
+    (srcStationID, dstStationID).
+    
+    Lists are stored without any credit limit; get() applies the limit
+    on the way out, which leaves the gain DESC, cost ASC order intact.
+    'hits' and 'misses' count lookups so the size can be tuned.
+    """
+    
+    def __init__(self, maxEntries):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, srcID, dstID, maxCostCr, build):
+        """
+        Returns the trades from srcID to dstID that cost at most
+        maxCostCr, calling build() to produce the full list when
+        the pair isn't cached.
+        """
+        key = (srcID, dstID)
+        entries = self.entries
+        try:
+            trades, highestCostCr = entries[key]
+        except KeyError:
+            self.misses += 1
+            trades = build() or ()
+            highestCostCr = max((trade.costCr for trade in trades), default = 0)
+            entries[key] = (trades, highestCostCr)
+            if len(entries) > self.maxEntries:
+                entries.popitem(last = False)
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+        
+        if highestCostCr <= maxCostCr:
+            return trades
+        return [trade for trade in trades if trade.costCr <= maxCostCr]
+
+
 class TradeCalc:
     """
     Container for accessing trade calculations with common properties.
     """
     
-    def __init__(self, tdb, tdenv = None, fit = None, items = None):
+    def __init__(self, tdb, tdenv = None, fit = None, items = None, columnar = None, tradeCacheSize = None, region = None):
         """
         Constructs the TradeCalc object and loads sell/buy data.
         
@@ -506,9 +740,19 @@ class TradeCalc:
             tdenv [optional]
                 TradeEnv() that controls behavior,
             fit [optional]
-                Lets you specify a fitting function,
+                Lets you specify a fitting function, either a callable
+                or one of the names in fitFunctions,
             items [optional]
                 Iterable [itemID or Item()] that restricts loading,
+            columnar [optional]
+                Also build a numpy PriceMatrix and use it in getTrades,
+            tradeCacheSize [optional]
+                Number of station pairs whose trade lists getBestHops
+                keeps in a TradeListCache, 0 disables the cache,
+            region [optional]
+                Iterable of (System, ly) spheres: only prices for the
+                stations inside them are loaded. getBestHops widens the
+                first sphere when routes reach beyond it,
         
         TradeEnv options:
             tdenv.avoidItems
@@ -519,18 +763,20 @@ class TradeCalc:
                 Require at least this much supply to load an item
             tdenv.demand
                 Require at least this much demand to load an item
+            tdenv.fit
+                Default for 'fit'
+            tdenv.columnar
+                Default for 'columnar'
+            tdenv.tradeCacheSize
+                Default for 'tradeCacheSize'
         """
         if not tdenv:
             tdenv = tdb.tdenv
         self.tdb = tdb
         self.tdenv = tdenv
-        self.defaultFit = fit or self.simpleFit
-        if "BRUTE_FIT" in os.environ:
-            self.defaultFit = self.bruteForceFit
-        minSupply = self.tdenv.supply or 0
-        minDemand = self.tdenv.demand or 0
-        
-        db = tdb.getDB()
+        self.defaultFit = self._resolveFit(fit)
+        if self.defaultFit == self.dpFit and not hasNumpy():
+            tdenv.WARN("numpy is not installed, the dp fit will behave like the simple fit.")
         
         wheres, binds = [], []
         if tdenv.maxAge:
@@ -552,10 +798,99 @@ class TradeCalc:
             load_ids = ",".join(str(ID) for ID in loadItemSet)
             wheres.append(f"(item_id IN ({load_ids}))")
         
-        demand = self.stationsBuying = defaultdict(list)
-        supply = self.stationsSelling = defaultdict(list)
+        self.stationsBuying = defaultdict(list)
+        self.stationsSelling = defaultdict(list)
+        self.priceWheres, self.priceBinds = wheres, binds
+        
+        self.region = None
+        if region is not None:
+            self.region = [(system, float(ly)) for system, ly in region]
+            regionWhere, regionBinds = self._regionClause(self.region, ())
+            self._loadPrices([regionWhere], regionBinds)
+        else:
+            self._loadPrices([], [])
+        
+        self.priceMatrix = None
+        if columnar is None:
+            columnar = tdenv.columnar
+        if columnar:
+            if hasNumpy():
+                self.priceMatrix = PriceMatrix(tdb.itemByID, self.stationsSelling, self.stationsBuying)
+                tdenv.DEBUG0(
+                    "Built {}x{} price matrix",
+                    len(self.priceMatrix.rowByStationID),
+                    len(self.priceMatrix.items),
+                )
+            else:
+                tdenv.WARN("numpy is not installed, using the default price backend.")
+        
+        self.tradeCache = self._newTradeCache(tradeCacheSize)
+    
+    def _resolveFit(self, fit):
+        """ Returns the fitting method for 'fit', defaulting to tdenv.fit. """
+        if fit is None:
+            fit = self.tdenv.fit
+        if isinstance(fit, str):
+            try:
+                fit = getattr(self, fitFunctions[fit])
+            except KeyError:
+                raise TradeException(
+                    "Unknown fit '{}', expected one of: {}".format(
+                        fit, ", ".join(fitFunctions)
+                    )
+                ) from None
+        return fit or self.simpleFit
+    
+    def _newTradeCache(self, tradeCacheSize):
+        """ Returns an empty TradeListCache, or None if it is disabled. """
+        if tradeCacheSize is None:
+            tradeCacheSize = self.tdenv.tradeCacheSize
+        if tradeCacheSize is None:
+            tradeCacheSize = defaultTradeCacheSize
+        return TradeListCache(tradeCacheSize) if tradeCacheSize > 0 else None
+    
+    @staticmethod
+    def priceKey(tdenv):
+        """
+        Returns a key for the prices a TradeCalc without 'items' or a
+        region loads for tdenv, or None when they can't be reused
+        because they depend on the time (tdenv.maxAge).
+        """
+        if tdenv.maxAge:
+            return None
+        return (
+            frozenset(item.ID for item in tdenv.avoidItems or ()),
+            tdenv.supply or 0,
+            tdenv.demand or 0,
+            bool(tdenv.columnar and hasNumpy()),
+        )
+    
+    def forEnv(self, tdenv):
+        """
+        Returns a TradeCalc that shares this one's prices but takes the
+        rest of its options (fit, credits, capacity, ...) from tdenv.
+        This calc must have been loaded without 'items' or a region,
+        for a tdenv with the same priceKey().
+        """
+        calc = copy.copy(self)
+        calc.tdenv = tdenv
+        calc.defaultFit = calc._resolveFit(None)
+        calc.tradeCache = calc._newTradeCache(None)
+        return calc
+    
+    def _loadPrices(self, wheres, binds):
+        """
+        Adds the StationItem rows matching 'wheres' and the loading
+        filters to stationsSelling/stationsBuying.
+        """
+        tdenv = self.tdenv
+        minSupply = tdenv.supply or 0
+        minDemand = tdenv.demand or 0
+        demand = self.stationsBuying
+        supply = self.stationsSelling
         
-        whereClause = " AND ".join(wheres) or "1"
+        whereClause = " AND ".join(self.priceWheres + wheres) or "1"
+        binds = self.priceBinds + list(binds)
         
         lastStnID = 0
         dmdCount, supCount = 0, 0
@@ -569,7 +904,7 @@ class TradeCalc:
         """.format(where = whereClause)
         tdenv.DEBUG1("TradeCalc loading StationItem values")
         tdenv.DEBUG2("sql: {}, binds: {}", stmt, binds)
-        cur = db.execute(stmt, binds)
+        cur = self.tdb.getDB().execute(stmt, binds)
         now = int(time.time())
         for (stnID, itmID,
                 timestamp,
@@ -597,6 +932,60 @@ class TradeCalc:
         
         tdenv.DEBUG0("Loaded {} buys, {} sells".format(dmdCount, supCount))
     
+    @staticmethod
+    def _regionClause(spheres, excluding):
+        """
+        Returns (where, binds) selecting the StationItem rows of
+        stations in systems inside any of 'spheres' but none of
+        'excluding', using the System position index.
+        """
+        inside, binds = [], []
+        for system, ly in spheres:
+            inside.append(
+                "(pos_x BETWEEN ? AND ? AND pos_y BETWEEN ? AND ?"
+                " AND pos_z BETWEEN ? AND ?"
+                " AND dist2(pos_x, pos_y, pos_z, ?, ?, ?) <= ?)"
+            )
+            binds += (
+                system.posX - ly, system.posX + ly,
+                system.posY - ly, system.posY + ly,
+                system.posZ - ly, system.posZ + ly,
+                system.posX, system.posY, system.posZ, ly * ly + regionSlack,
+            )
+        conditions = ["(" + " OR ".join(inside) + ")"]
+        for system, ly in excluding:
+            conditions.append("dist2(pos_x, pos_y, pos_z, ?, ?, ?) > ?")
+            binds += (system.posX, system.posY, system.posZ, ly * ly + regionSlack)
+        where = """(station_id IN (
+                SELECT  station_id
+                  FROM  Station
+                 WHERE  system_id IN (
+                        SELECT  system_id
+                          FROM  System
+                         WHERE  {}
+                 )
+        ))""".format(" AND ".join(conditions))
+        return where, binds
+    
+    def widenRegion(self, ly):
+        """
+        Grows the first sphere of the region to 'ly' and loads the
+        prices of the stations that brings in.
+        """
+        if self.region is None:
+            return
+        center, radius = self.region[0]
+        if ly <= radius:
+            return
+        self.tdenv.DEBUG0("Widening price region around {} to {:n}ly", center.name(), ly)
+        regionWhere, regionBinds = self._regionClause([(center, ly)], self.region)
+        self._loadPrices([regionWhere], regionBinds)
+        self.region[0] = (center, ly)
+        if self.priceMatrix is not None:
+            self.priceMatrix = PriceMatrix(self.tdb.itemByID, self.stationsSelling, self.stationsBuying)
+        if self.tradeCache is not None:
+            self.tradeCache = TradeListCache(self.tradeCache.maxEntries)
+    
     def bruteForceFit(self, items, credits, capacity, maxUnits):  # pylint: disable=redefined-builtin
         """
         Brute-force generation of all possible combinations of items.
@@ -798,11 +1187,151 @@ class TradeCalc:
         
         return TradeLoad(load, gainCr, costCr, qty)
     
+    def dpFit(self, items, credits, capacity, maxUnits):  # pylint: disable=redefined-builtin
+        """
+        Dynamic programming load calculator: approximately solves the
+        bounded knapsack of units against both the hold size and the
+        available credits.
+        
+        Every unit takes the same space, so when the credits stretch to
+        the greedy load that load is already the best and is returned
+        as-is. Two affordable items are solved by trying every quantity
+        of the first. Beyond that a dynamic program over (units, credits)
+        finds the best load, dropping the units axis when the hold can't
+        be filled anyway. Credits are grouped into at most dpFitCells
+        buckets across the table, costs rounded up to whole buckets, so
+        anything it picks is affordable. That's only exact when there
+        are fewer credits than buckets: a big hold leaves few buckets,
+        and the rounding can miss the best load by several percent. Any
+        credits the rounding leaves over are spent greedily.
+        
+        The table needs numpy; never returns less gain than simpleFit.
+        """
+        
+        greedyLoad = self.simpleFit(items, credits, capacity, maxUnits)
+        
+        candidates = []
+        unitsLeft, uncappedCostCr = capacity, 0
+        for item in items:
+            if item.supply <= 0:
+                continue
+            maxQty = min(maxUnits, capacity, item.supply)
+            bound = min(maxQty, credits // item.costCr)
+            if bound > 0:
+                candidates.append((item, bound))
+            if unitsLeft > 0:
+                uncappedCostCr += min(maxQty, unitsLeft) * item.costCr
+                unitsLeft -= min(maxQty, unitsLeft)
+        
+        if uncappedCostCr <= credits or len(candidates) < 2:
+            return greedyLoad
+        
+        if len(candidates) == 2:
+            # Given the first quantity, as much of the second as fits is best.
+            (first, firstBound), (second, secondBound) = candidates
+            bestGainCr, quantities = -1, None
+            for firstQty in range(firstBound + 1):
+                secondQty = min(
+                    secondBound, capacity - firstQty,
+                    (credits - firstQty * first.costCr) // second.costCr,
+                )
+                gainCr = firstQty * first.gainCr + secondQty * second.gainCr
+                if gainCr > bestGainCr:
+                    bestGainCr, quantities = gainCr, (firstQty, secondQty)
+        elif hasNumpy():
+            quantities = self._dpFitQuantities(candidates, credits, capacity)
+            # Rounding costs up to buckets can leave room for a few more units.
+            unitsLeft = capacity - sum(quantities)
+            creditsLeft = credits - sum(
+                item.costCr * qty for (item, _), qty in zip(candidates, quantities)
+            )
+            for itemNo, (item, bound) in enumerate(candidates):
+                extra = min(bound - quantities[itemNo], unitsLeft, creditsLeft // item.costCr)
+                if extra > 0:
+                    quantities[itemNo] += extra
+                    unitsLeft -= extra
+                    creditsLeft -= extra * item.costCr
+        else:
+            return greedyLoad
+        
+        load = tuple(
+            (item, qty)
+            for (item, _), qty in zip(candidates, quantities) if qty
+        )
+        gainCr = sum(item.gainCr * qty for item, qty in load)
+        if gainCr <= greedyLoad.gainCr:
+            return greedyLoad
+        costCr = sum(item.costCr * qty for item, qty in load)
+        return TradeLoad(load, gainCr, costCr, sum(quantities))
+    
+    @staticmethod
+    def _dpFitQuantities(candidates, credits, capacity):
+        """
+        Dynamic programming step of dpFit: returns the quantity to load
+        of each (item, bound) in candidates.
+        """
+        
+        # Only track units when the candidates could overfill the hold.
+        if sum(bound for _, bound in candidates) > capacity:
+            maxUnitsLoaded = capacity
+        else:
+            maxUnitsLoaded = 0
+        bucketCr = -(-credits // max(1, dpFitCells // (maxUnitsLoaded + 1)))
+        numBuckets = credits // bucketCr
+        
+        # bestGain[u, b] is the most gain from at most u units costing at
+        # most b buckets. Each item is split into 1, 2, 4, ... unit lots
+        # so the bounded problem becomes a 0/1 knapsack over the lots.
+        bestGain = numpy.zeros((maxUnitsLoaded + 1, numBuckets + 1), dtype = numpy.int64)
+        lots = []
+        for itemNo, (item, bound) in enumerate(candidates):
+            lotQty = 1
+            while bound > 0:
+                qty = min(lotQty, bound)
+                bound -= qty
+                lotQty *= 2
+                lotUnits = qty if maxUnitsLoaded else 0
+                lotBuckets = -(-(qty * item.costCr) // bucketCr)
+                if lotUnits > maxUnitsLoaded or lotBuckets > numBuckets:
+                    continue
+                withLot = bestGain[
+                    :maxUnitsLoaded + 1 - lotUnits, :numBuckets + 1 - lotBuckets
+                ] + qty * item.gainCr
+                target = bestGain[lotUnits:, lotBuckets:]
+                taken = withLot > target
+                if taken.any():
+                    numpy.maximum(target, withLot, out = target)
+                    lots.append((itemNo, qty, lotUnits, lotBuckets, taken))
+        
+        # Walk the lots backwards to recover the quantities.
+        quantities = [0] * len(candidates)
+        units, buckets = maxUnitsLoaded, numBuckets
+        for itemNo, qty, lotUnits, lotBuckets, taken in reversed(lots):
+            if units >= lotUnits and buckets >= lotBuckets and taken[units - lotUnits, buckets - lotBuckets]:
+                quantities[itemNo] += qty
+                units -= lotUnits
+                buckets -= lotBuckets
+        
+        return quantities
+    
     def getTrades(self, srcStation, dstStation, srcSelling = None):
         """
         Returns the most profitable trading options from
         one station to another (uni-directional).
         """
+        minGainCr = max(1, self.tdenv.minGainPerTon or 1)
+        maxGainCr = max(minGainCr, self.tdenv.maxGainPerTon or sys.maxsize)
+        
+        matrix = self.priceMatrix
+        if matrix and not srcSelling:
+            srcRow, dstRow = matrix.rowOf(srcStation.ID), matrix.rowOf(dstStation.ID)
+            if srcRow is None or dstRow is None:
+                return None
+            srcCols = matrix.sellColumns.get(srcRow, None)
+            if srcCols is None:
+                return None
+            return matrix.getTrades(srcRow, dstRow, srcCols, minGainCr, maxGainCr)
+        
         if not srcSelling:
             srcSelling = self.stationsSelling.get(srcStation.ID, None)
             if not srcSelling:
@@ -813,8 +1342,6 @@ class TradeCalc:
         
         trading = []
         itemIdx = self.tdb.itemByID
-        minGainCr = max(1, self.tdenv.minGainPerTon or 1)
-        maxGainCr = max(minGainCr, self.tdenv.maxGainPerTon or sys.maxsize)
         getBuy = {buy[0]: buy for buy in dstBuying}.get
         addTrade = trading.append
         for sell in srcSelling:  # should be the smaller list
@@ -847,6 +1374,106 @@ class TradeCalc:
         
         If we have two routes: A->B->D, A->C->D and A->B->D produces
         more profit, there's no point continuing the A->C->D path.
+        
+        When tdenv.workers is more than 1 and the platform can fork,
+        the routes are split across that many worker processes.
+        
+        With a region, it is first widened to take in every station
+        the routes could reach.
+        """
+        
+        if self.region is not None and routes and not self.tdenv.direct:
+            center = self.region[0][0]
+            reachLy = (self.tdenv.maxJumpsPer or 0) * (self.tdenv.maxLyPer or 0)
+            self.widenRegion(max(center.distanceTo(route.lastSystem) for route in routes) + reachLy)
+        
+        workers = self.tdenv.workers or 0
+        if workers > 1 and len(routes) > 1:
+            if canForkWorkers:
+                bestToDest, connections = self._getBestHopsParallel(
+                    routes, restrictTo, workers
+                )
+            else:
+                self.tdenv.WARN("--workers requires a platform that can fork, running in a single process.")
+                bestToDest, connections = self._getBestHops(routes, restrictTo)
+        else:
+            bestToDest, connections = self._getBestHops(routes, restrictTo)
+        
+        if connections == 0:
+            raise NoHopsError(
+                "No destinations could be reached within the constraints."
+            )
+        
+        result = []
+        for (dst, route, trade, jumps, _, score) in bestToDest.values():
+            result.append(route.plus(dst, trade, jumps, score))
+        
+        return result
+    
+    def _getBestHopsParallel(self, routes, restrictTo, workers):
+        """
+        Runs _getBestHops over slices of 'routes' in forked worker
+        processes, which inherit the loaded price data, and reduces
+        their per-destination bests.
+        
+        Slices are merged in route order using the same tie-break as
+        _getBestHops, so the result matches a single-process run.
+        """
+        
+        tdb, tdenv = self.tdb, self.tdenv
+        numSlices = min(len(routes), workers * 4)
+        sliceLen = -(-len(routes) // numSlices)
+        spans = [
+            (start, min(start + sliceLen, len(routes)))
+            for start in range(0, len(routes), sliceLen)
+        ]
+        tdenv.DEBUG0(
+            "Splitting {} routes into {} slices over {} workers",
+            len(routes), len(spans), workers,
+        )
+        
+        bestToDest, connections = {}, 0
+        stationByID, systemByID, itemByID = tdb.stationByID, tdb.systemByID, tdb.itemByID
+        # The workers are forked, so they inherit these rather than pickling them.
+        context = multiprocessing.get_context('fork')
+        with context.Pool(
+                    min(workers, len(spans)),
+                    initializer = _initBestHopsWorker, initargs = (self, routes, restrictTo),
+                ) as pool, \
+                pbar.Progress(max_value=len(spans), width=25, show=tdenv.progress) as prog:
+            for sliceConnections, hops in pool.imap(_bestHopsWorker, spans):
+                prog.increment(1)
+                connections += sliceConnections
+                for dstID, routeNo, load, via, distLy, score in hops:
+                    route = routes[routeNo]
+                    try:
+                        btd = bestToDest[dstID]
+                    except KeyError:
+                        pass
+                    else:
+                        # Same tie-break as _getBestHops.
+                        bestTradeScore = btd[1].score + btd[5]
+                        newTradeScore = route.score + score
+                        if bestTradeScore > newTradeScore:
+                            continue
+                        if bestTradeScore == newTradeScore and btd[4] <= distLy:
+                            continue
+                    trade = load._replace(items = tuple(
+                        (tr._replace(item = itemByID[tr.item]), qty)
+                        for tr, qty in load.items
+                    ))
+                    bestToDest[dstID] = (
+                        stationByID[dstID], route, trade,
+                        [systemByID[ID] for ID in via], distLy, score,
+                    )
+        
+        return bestToDest, connections
+    
+    def _getBestHops(self, routes, restrictTo = None, showProgress = True):
+        """
+        Evaluates the next hops of 'routes' and returns a tuple of
+        (bestToDest, connections) where bestToDest maps a destination
+        station ID to (station, route, trade, via, distLy, score).
         """
         
         tdb = self.tdb
@@ -867,6 +1494,10 @@ class TradeCalc:
         fitFunction = self.defaultFit
         capacity = tdenv.capacity
         maxUnits = getattr(tdenv, 'limit') or capacity
+        matrix = self.priceMatrix
+        tradeCache = self.tradeCache
+        minGainCr = max(1, tdenv.minGainPerTon or 1)
+        maxGainCr = max(minGainCr, tdenv.maxGainPerTon or sys.maxsize)
         
         bestToDest = {}
         safetyMargin = 1.0 - tdenv.margin
@@ -930,7 +1561,7 @@ class TradeCalc:
                     odyssey = odyssey,
                 )
         
-        with pbar.Progress(max_value=len(routes), width=25, show=tdenv.progress) as prog:
+        with pbar.Progress(max_value=len(routes), width=25, show=tdenv.progress and showProgress) as prog:
             connections = 0
             getSelling = self.stationsSelling.get
             for route_no, route in enumerate(routes):
@@ -948,6 +1579,9 @@ class TradeCalc:
                 if not srcSelling:
                     tdenv.DEBUG1("Nothing sold/affordable - next.")
                     continue
+                if matrix:
+                    srcRow = matrix.rowOf(srcStation.ID)
+                    srcCols = matrix.affordableColumns(srcRow, startCr)
                 
                 if goalSystem:
                     origSystem = route.firstSystem
@@ -988,11 +1622,28 @@ class TradeCalc:
                     
                     stations = (d for d in stations if annotate(d))
                 
-                for dest in stations:
+                if matrix:
+                    # Evaluate every destination of this route in one pass.
+                    stations = list(stations)
+                    matrixTrades = matrix.getTradesTo(
+                        srcRow,
+                        [matrix.rowOf(d.station.ID) for d in stations],
+                        srcCols, minGainCr, maxGainCr,
+                    )
+                
+                for destNo, dest in enumerate(stations):
                     dstStation = dest.station
                     
                     connections += 1
-                    items = self.getTrades(srcStation, dstStation, srcSelling)
+                    if matrix:
+                        items = matrixTrades[destNo]
+                    elif tradeCache is not None:
+                        items = tradeCache.get(
+                            srcStation.ID, dstStation.ID, startCr,
+                            lambda: self.getTrades(srcStation, dstStation),  # pylint: disable=cell-var-from-loop
+                        )
+                    else:
+                        items = self.getTrades(srcStation, dstStation, srcSelling)
                     if not items:
                         continue
                     trade = fitFunction(items, startCr, capacity, maxUnits)
@@ -1097,13 +1748,40 @@ class TradeCalc:
                         dstStation, route, trade, dest.via, dest.distLy, score
                     )
         
-        if connections == 0:
-            raise NoHopsError(
-                "No destinations could be reached within the constraints."
-            )
-        
-        result = []
-        for (dst, route, trade, jumps, _, score) in bestToDest.values():
-            result.append(route.plus(dst, trade, jumps, score))
-        
-        return result
+        return bestToDest, connections
+
+
+# What a getBestHops worker process is working on: (calc, routes, restrictTo).
+# Only ever set in the workers, by _initBestHopsWorker.
+_workerHops = None
+
+
+def _initBestHopsWorker(calc, routes, restrictTo):
+    """ Pool initializer: gives a forked getBestHops worker its calc and routes. """
+    global _workerHops  # pylint: disable=global-statement
+    _workerHops = (calc, routes, restrictTo)
+
+
+def _bestHopsWorker(span):
+    """
+    Evaluates routes[start:stop] in a forked worker. Stations, items and
+    systems are returned by ID so the parent can map them back onto its
+    own objects.
+    """
+    calc, routes, restrictTo = _workerHops
+    start, stop = span
+    bestToDest, connections = calc._getBestHops(  # pylint: disable=protected-access
+        routes[start:stop], restrictTo, showProgress = False
+    )
+    routeNos = {id(route): routeNo for routeNo, route in enumerate(routes[start:stop], start)}
+    hops = [
+        (
+            dstID, routeNos[id(route)],
+            trade._replace(items = tuple(
+                (tr._replace(item = tr.item.ID), qty) for tr, qty in trade.items
+            )),
+            [system.ID for system in via], distLy, score,
+        )
+        for dstID, (_, route, trade, via, distLy, score) in bestToDest.items()
+    ]
+    return connections, hops
@@ -51,18 +51,23 @@ Simplistic use might be:
 # Imports
 from __future__ import annotations
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from contextlib import closing
 from math import sqrt as math_sqrt
+from operator import attrgetter
 from pathlib import Path
+import functools
 import heapq
 import itertools
 import locale
 import re
 import sqlite3
 import sys
+import time
 import typing
 
+from .jumpgraph import JumpGraph
+from .snapshot import PlaceSnapshot
 from .tradeenv import TradeEnv
 from .tradeexcept import TradeException
 from . import cache, fs
@@ -72,6 +77,23 @@ if typing.TYPE_CHECKING:
     from typing import Optional, Union
 
 
+# numpy takes a while to import and only the stellar index and galaxy
+# store use it, so it's imported by hasNumpy() when they are first built.
+numpy = None
+
+
+@functools.lru_cache(maxsize=None)
+def hasNumpy() -> bool:
+    """ Returns whether numpy is installed, importing it as tradedb.numpy on first use. """
+    global numpy  # pylint: disable=global-statement
+    try:
+        import numpy as module  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return False
+    numpy = module
+    return True
+
+
 locale.setlocale(locale.LC_ALL, '')
 
 
@@ -128,6 +150,288 @@ def make_stellar_grid_key(x: float, y: float, z: float) -> int:
     return (int(x) >> 5, int(y) >> 5, int(z) >> 5)
 
 
+class StellarIndex:
+    """
+    Vectorised form of the stellar grid, used when numpy is available.
+    
+    System co-ordinates are held in a numpy array sorted by a linear
+    key of their grid cell, so that each (x, y) column of cells is a
+    contiguous slice and a radius query is one searchsorted per column
+    followed by a single vectorised distance test, rather than a walk
+    of every cell and star in Python.
+    
+    Queries yield the same systems, in the same order and with the same
+    distances, as walking the dict-of-lists grid.
+    """
+    
+    # Cells are biased by cellBias and packed into 21 bits per axis.
+    cellBias = 1 << 20
+    # queryAll batches systems by blocks of blockCells^3 grid cells,
+    # with at most batchSize distances per distance matrix.
+    blockCells = 2
+    batchSize = 1 << 22
+    
+    def __init__(self, systems):
+        if not hasNumpy():
+            raise TradeException("The stellar index requires numpy.")
+        
+        systems = list(systems)
+        coords = numpy.array(
+            [(sys.posX, sys.posY, sys.posZ) for sys in systems], dtype=numpy.float64,
+        ).reshape(-1, 3)
+        cells = numpy.trunc(coords).astype(numpy.int64) >> 5
+        keys = self.cellKeys(cells)
+        order = numpy.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.cells = cells[order]
+        self.coords = coords[order]
+        self.IDs = numpy.array([sys.ID for sys in systems], dtype=numpy.int64)[order]
+        self.systems = [systems[idx] for idx in order.tolist()]
+    
+    def __len__(self):
+        return len(self.systems)
+    
+    @classmethod
+    def cellKeys(cls, cells):
+        """ Packs an array of (x, y, z) cells into sortable keys. """
+        cells = cells + cls.cellBias
+        return (cells[..., 0] << 42) | (cells[..., 1] << 21) | cells[..., 2]
+    
+    def candidates(self, lwrBound, uprBound):
+        """
+        Returns the indexes of the systems in the cells between lwrBound
+        and uprBound inclusive, in grid order.
+        """
+        xs = numpy.arange(lwrBound[0], uprBound[0] + 1, dtype=numpy.int64)
+        ys = numpy.arange(lwrBound[1], uprBound[1] + 1, dtype=numpy.int64)
+        columns = numpy.empty((len(xs), len(ys), 3), dtype=numpy.int64)
+        columns[..., 0] = xs[:, None]
+        columns[..., 1] = ys[None, :]
+        columns[..., 2] = lwrBound[2]
+        starts = numpy.searchsorted(self.keys, self.cellKeys(columns).ravel(), 'left')
+        columns[..., 2] = uprBound[2]
+        ends = numpy.searchsorted(self.keys, self.cellKeys(columns).ravel(), 'right')
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if not total:
+            return numpy.empty(0, dtype=numpy.int64)
+        # Concatenate the [start, end) ranges without a Python loop.
+        offsets = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+        return offsets + numpy.arange(total, dtype=numpy.int64)
+    
+    def query(self, system, ly):
+        """
+        Returns a list of (candidate, distLy) for the systems within ly
+        of system, excluding system itself.
+        """
+        sysX, sysY, sysZ = system.posX, system.posY, system.posZ
+        idx = self.candidates(
+            make_stellar_grid_key(sysX - ly, sysY - ly, sysZ - ly),
+            make_stellar_grid_key(sysX + ly, sysY + ly, sysZ + ly),
+        )
+        coords = self.coords[idx]
+        deltas = coords - (sysX, sysY, sysZ)
+        deltas *= deltas
+        distSq = deltas[:, 0] + deltas[:, 1] + deltas[:, 2]
+        hits = (distSq <= ly * ly) & (self.IDs[idx] != system.ID)
+        systems = self.systems
+        return [
+            (systems[pos], dist)
+            for pos, dist in zip(idx[hits].tolist(), numpy.sqrt(distSq[hits]).tolist())
+        ]
+    
+    def queryAll(self, ly):
+        """
+        Yields (system, [(candidate, distLy), ...]) for every indexed
+        system, as query would, but testing the systems of each block
+        of blockCells^3 cells against their shared candidates at once.
+        """
+        coords, systems = self.coords, self.systems
+        lySq = ly * ly
+        blockKeys = self.cellKeys(self.cells // self.blockCells)
+        order = numpy.argsort(blockKeys, kind='stable')
+        blockKeys = blockKeys[order]
+        blockStarts = numpy.flatnonzero(numpy.r_[True, blockKeys[1:] != blockKeys[:-1]])
+        for members in numpy.split(order, blockStarts[1:]):
+            memberCoords = coords[members]
+            lwr, upr = memberCoords.min(axis=0) - ly, memberCoords.max(axis=0) + ly
+            idx = self.candidates(
+                make_stellar_grid_key(*lwr.tolist()), make_stellar_grid_key(*upr.tolist()),
+            )
+            candidates = coords[idx]
+            step = max(1, self.batchSize // max(1, len(idx)))
+            for batchStart in range(0, len(members), step):
+                batch = members[batchStart:batchStart + step]
+                deltas = candidates[None, :, :] - coords[batch][:, None, :]
+                deltas *= deltas
+                distSq = deltas[..., 0] + deltas[..., 1] + deltas[..., 2]
+                rows, cols = numpy.nonzero(distSq <= lySq)
+                hits = idx[cols]
+                notSelf = hits != batch[rows]
+                rows, cols, hits = rows[notSelf], cols[notSelf], hits[notSelf]
+                inRange = list(zip(
+                    [systems[hit] for hit in hits.tolist()],
+                    numpy.sqrt(distSq[rows, cols]).tolist(),
+                ))
+                rowEnds = numpy.searchsorted(rows, numpy.arange(1, len(batch) + 1))
+                rowStart = 0
+                for pos, rowEnd in zip(batch.tolist(), rowEnds.tolist()):
+                    yield systems[pos], inRange[rowStart:rowEnd]
+                    rowStart = rowEnd
+
+
+class GalaxyStore:
+    """
+    Columnar copy of the loaded systems and stations (see
+    TradeDB.useGalaxy), so that commands can filter and measure
+    thousands of places in one vectorised pass rather than testing
+    Station objects one at a time.
+    
+    Systems are held in the row order of a StellarIndex. Stations are
+    grouped by the row of their system, keeping the order they have in
+    System.stations.
+    
+    Attributes:
+        index
+            The StellarIndex holding the system co-ordinates by row,
+        systemRow
+            {system ID: system row},
+        stations
+            Station objects by station row,
+        stationRow
+            {station ID: station row},
+        stationIDs, stationSystems, lsFromStar, itemCount
+            int64 arrays by station row of the station's ID, the row
+            of its system, its lsFromStar and its itemCount,
+        systemStations
+            int64 array of the first station row of each system row,
+            followed by the number of stations,
+        flags
+            {attribute: array by station row} of the one-letter
+            Station attributes named in flagAttributes.
+    """
+    
+    flagAttributes = (
+        'market', 'blackMarket', 'shipyard', 'maxPadSize', 'outfitting',
+        'rearm', 'refuel', 'repair', 'planetary', 'fleet', 'odyssey',
+    )
+    
+    def __init__(self, index, stations):
+        self.index = index
+        self.systemRow = dict(zip(index.IDs.tolist(), range(len(index))))
+        stations = list(stations)
+        # One pass over the stations, then one array per column.
+        columns = list(zip(*map(
+            attrgetter('system.ID', 'ID', 'lsFromStar', 'itemCount', *self.flagAttributes),
+            stations,
+        )))
+        if not columns:
+            columns = [()] * (4 + len(self.flagAttributes))
+        systemIDs, IDs, lsFromStar, itemCount, *flags = columns
+        systemRow = self.systemRow
+        systemRows = numpy.array([systemRow[ID] for ID in systemIDs], dtype=numpy.int64)
+        order = numpy.argsort(systemRows, kind='stable')
+        self.stationSystems = systemRows[order]
+        self.systemStations = numpy.searchsorted(
+            self.stationSystems, numpy.arange(len(index) + 1, dtype=numpy.int64),
+        )
+        self.stationIDs = numpy.array(IDs, dtype=numpy.int64)[order]
+        self.lsFromStar = numpy.array(lsFromStar, dtype=numpy.int64)[order]
+        self.itemCount = numpy.array(itemCount, dtype=numpy.int64)[order]
+        self.flags = {
+            attribute: numpy.array(column, dtype='U1')[order]
+            for attribute, column in zip(self.flagAttributes, flags)
+        }
+        self.stations = [stations[idx] for idx in order.tolist()]
+        self.stationRow = dict(zip(self.stationIDs.tolist(), range(len(order))))
+    
+    def systemDistances(self, system, rows):
+        """ Returns the distances in ly from system to the systems at rows. """
+        deltas = self.index.coords[rows] - (system.posX, system.posY, system.posZ)
+        deltas *= deltas
+        return numpy.sqrt(deltas[:, 0] + deltas[:, 1] + deltas[:, 2])
+    
+    def systemsWithin(self, system, ly, includeSelf=False):
+        """
+        Returns arrays of the (rows, distances) of the systems within
+        ly of system, nearest first and in the order genSystemsInRange
+        yields them.
+        """
+        index = self.index
+        sysX, sysY, sysZ = system.posX, system.posY, system.posZ
+        rows = index.candidates(
+            make_stellar_grid_key(sysX - ly, sysY - ly, sysZ - ly),
+            make_stellar_grid_key(sysX + ly, sysY + ly, sysZ + ly),
+        )
+        deltas = index.coords[rows] - (sysX, sysY, sysZ)
+        deltas *= deltas
+        distSq = deltas[:, 0] + deltas[:, 1] + deltas[:, 2]
+        hits = (distSq <= ly * ly) & (index.IDs[rows] != system.ID)
+        rows, dists = rows[hits], numpy.sqrt(distSq[hits])
+        if includeSelf:
+            rows = numpy.r_[self.systemRow[system.ID], rows]
+            dists = numpy.r_[0., dists]
+        order = numpy.argsort(dists, kind='stable')
+        return rows[order], dists[order]
+    
+    def stationRowsOf(self, systemRows):
+        """ Returns the rows of the stations in the systems at systemRows. """
+        systemRows = numpy.asarray(systemRows, dtype=numpy.int64)
+        starts = self.systemStations[systemRows]
+        lengths = self.systemStations[systemRows + 1] - starts
+        offsets = numpy.repeat(starts - (numpy.cumsum(lengths) - lengths), lengths)
+        return offsets + numpy.arange(int(lengths.sum()), dtype=numpy.int64)
+    
+    def stationMask(self, rows, maxLs=None, wants=(), trading=False):
+        """
+        Returns a boolean array of which stations at rows have an
+        lsFromStar of at most maxLs, if given, and are trading, if
+        asked. 'wants' are (attribute, letters) pairs: as with
+        Station.checkPadSize, a station passes when its attribute is
+        one of the letters, and empty letters match every station.
+        """
+        mask = numpy.ones(len(rows), dtype=bool)
+        if maxLs:
+            mask &= self.lsFromStar[rows] <= maxLs
+        for attribute, letters in wants:
+            if letters:
+                mask &= numpy.isin(self.flags[attribute][rows], list(letters))
+        if trading:
+            mask &= (self.itemCount[rows] > 0) | (self.flags['market'][rows] == 'Y')
+        return mask
+    
+    def matchStations(self, near=None, ly=None, maxLs=None, wants=(), among=None):
+        """
+        Returns {station ID: distance in ly} for the stations within ly
+        of the System near that pass stationMask(maxLs, wants), looking
+        only at the station IDs in 'among' if given. With no ly every
+        station is in range, and with no near the distances are None.
+        Returns None when there is nothing to filter on.
+        """
+        dists = None
+        if among is not None:
+            stationRow = self.stationRow
+            rows = numpy.array([stationRow[ID] for ID in among], dtype=numpy.int64)
+        elif near is not None and ly is not None:
+            systemRows, systemDists = self.systemsWithin(near, ly, includeSelf=True)
+            rows = self.stationRowsOf(systemRows)
+            counts = self.systemStations[systemRows + 1] - self.systemStations[systemRows]
+            dists = numpy.repeat(systemDists, counts)
+        elif near is None and not maxLs and not any(letters for _, letters in wants):
+            return None
+        else:
+            rows = numpy.arange(len(self.stations), dtype=numpy.int64)
+        keep = self.stationMask(rows, maxLs, wants)
+        if near is not None and dists is None:
+            dists = self.systemDistances(near, self.stationSystems[rows])
+            if ly is not None:
+                keep &= dists <= ly
+        IDs = self.stationIDs[rows[keep]].tolist()
+        if dists is None:
+            return dict.fromkeys(IDs)
+        return dict(zip(IDs, dists[keep].tolist()))
+
+
 class System:
     """
     Describes a star system which may contain one or more Station objects.
@@ -489,6 +793,31 @@ class Trade(namedtuple('Trade', (
 ######################################################################
 
 
+class LazyTable:
+    """
+    A TradeDB attribute that is filled in by loading one of its
+    lazyTables the first time it is read.
+    
+    The loaders store what they load as instance attributes, which
+    then hide the LazyTable until TradeDB.load() discards them.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+        self.name = None
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+    
+    def __get__(self, tdb, owner=None):
+        if tdb is None:
+            return self
+        tdb.loadTable(self.table)
+        return tdb.__dict__[self.name]
+
+######################################################################
+
+
 class TradeDB:
     """
     Encapsulation for the database layer.
@@ -510,6 +839,9 @@ class TradeDB:
             Path() of the .prices file
         importTables
             List of the .csv files
+        galaxy
+            Columnar GalaxyStore of the systems and stations, once
+            useGalaxy() has been called
     
     Static methods:
         calculateDistance2(lx, ly, lz, rx, ry, rz)
@@ -541,6 +873,8 @@ class TradeDB:
     defaultSQL = 'TradeDangerous.sql'
     # File containing text description of prices
     defaultPrices = 'TradeDangerous.prices'
+    # Number of (origin, limits) results getDestinations remembers
+    reachableCacheSize = 1024
     # array containing standard tables, csvfilename and tablename
     # WARNING: order is important because of dependencies!
     defaultTables = (
@@ -557,6 +891,29 @@ class TradeDB:
         ('FDevShipyard.csv', 'FDevShipyard'),
         ('FDevOutfitting.csv', 'FDevOutfitting'),
     )
+    # Tables load() reads on demand: the loaders that fill them in and
+    # the tables they refer to. Systems come with their stations so
+    # that System.stations is always complete.
+    lazyTables = {
+        'Added': (('_loadAdded',), ()),
+        'System': (('_loadPlaces',), ()),
+        'Ship': (('_loadShips',), ()),
+        'Category': (('_loadCategories',), ()),
+        'Item': (('_loadItems',), ('Category',)),
+        'RareItem': (('_loadRareItems',), ('System', 'Category')),
+    }
+    addedByID = LazyTable('Added')
+    systemByID = LazyTable('System')
+    systemByName = LazyTable('System')
+    stationByID = LazyTable('System')
+    tradingStationCount = LazyTable('System')
+    shipByID = LazyTable('Ship')
+    categoryByID = LazyTable('Category')
+    itemByID = LazyTable('Item')
+    itemByName = LazyTable('Item')
+    itemByFDevID = LazyTable('Item')
+    rareItemByID = LazyTable('RareItem')
+    rareItemByName = LazyTable('RareItem')
     
     # Translation matrixes for attributes -> common presentation
     marketStates = planetStates = fleetStates = odysseyStates = {'?': '?', 'Y': 'Yes', 'N': 'No'}
@@ -569,6 +926,7 @@ class TradeDB:
             tdenv=None,
             load=True,
             debug=None,
+            tables=None,
             ):
         self.conn: sqlite3.Connection = None
         self.tradingCount = None
@@ -600,23 +958,16 @@ class TradeDB:
         self.pricesFilename = str(self.pricesPath)
         
         self.avgSelling, self.avgBuying = None, None
-        self.tradingStationCount = 0
-        self.addedByID = None
-        self.systemByID = None
-        self.systemByName = None
+        self.loadedTables = set()
         self.stellarGrid = None
-        self.stationByID = None
-        self.shipByID = None
-        self.categoryByID = None
-        self.itemByID = None
-        self.itemByName = None
-        self.itemByFDevID = None
-        self.rareItemByID = None
-        self.rareItemByName = None
+        self.galaxyWanted = False
+        self._galaxy = None
+        self.reachableCache = None
+        self.jumpGraph = None
         
         if load:
             self.reloadCache()
-            self.load(maxSystemLinkLy=tdenv.maxSystemLinkLy)
+            self.load(maxSystemLinkLy=tdenv.maxSystemLinkLy, tables=tables)
     
     @staticmethod
     def calculateDistance2(lx, ly, lz, rx, ry, rz):
@@ -667,23 +1018,33 @@ class TradeDB:
         if self.dbPath.exists():
             dbFileStamp = self.dbPath.stat().st_mtime
             
-            paths = [self.sqlPath]
-            paths += [Path(f) for (f, _) in self.importTables]
+            def changed(path):
+                return path.exists() and path.stat().st_mtime > dbFileStamp
             
-            changedPaths = [
-                [path, path.stat().st_mtime]
-                for path in paths
-                if path.exists() and path.stat().st_mtime > dbFileStamp
+            changedTables = [
+                (importName, importTable)
+                for importName, importTable in self.importTables
+                if changed(Path(importName))
             ]
             
-            if not changedPaths:
+            if not changed(self.sqlPath):
+                # Only re-import the tables whose files were edited.
+                pricesChanged = changed(self.pricesPath)
+                if changedTables:
+                    tables = cache.changedImportTables(self, changedTables)
+                    self.tdenv.DEBUG0("Changed tables: {}", tables or "none")
+                    if tables and cache.updateCache(self, self.tdenv, tables):
+                        return
+                    if not tables:
+                        # Same contents: bring the cache's mtime up to date.
+                        self.dbPath.touch()
+                
                 # Do we need to reload the .prices file?
                 if not self.pricesPath.exists():
                     self.tdenv.DEBUG1("No .prices file to load")
                     return
                 
-                pricesStamp = self.pricesPath.stat().st_mtime
-                if pricesStamp <= dbFileStamp:
+                if not pricesChanged:
                     self.tdenv.DEBUG1("DB Cache is up to date.")
                     return
                 
@@ -693,7 +1054,7 @@ class TradeDB:
                 )
                 return
             
-            self.tdenv.DEBUG0("Rebuilding DB Cache [{}]", str(changedPaths))
+            self.tdenv.DEBUG0("Rebuilding DB Cache [{}]", str(self.sqlPath))
         else:
             self.tdenv.DEBUG0("Building DB Cache")
         
@@ -731,23 +1092,36 @@ class TradeDB:
         """ Iterate through the list of systems. """
         yield from self.systemByID.values()
     
-    def _loadSystems(self):
+    def _loadPlaces(self):
         """
-        Initial load the (raw) list of systems.
+        Loads the systems and stations from the PlaceSnapshot next to
+        the database, or from the database if the snapshot is missing
+        or out of date, and then saves a fresh one.
+        CAUTION: Will orphan previously loaded objects.
+        """
+        snapshotPath = self.dbPath.with_suffix(".snapshot")
+        signature = PlaceSnapshot.fileSignature(self.dbPath)
+        snapshot = PlaceSnapshot.load(snapshotPath, signature)
+        if snapshot is None:
+            snapshot = PlaceSnapshot.fromDB(self.getDB(), signature)
+            try:
+                snapshot.save(snapshotPath)
+            except (OSError, ValueError) as e:
+                self.tdenv.WARN("Couldn't save place snapshot to {}: {}", snapshotPath, e)
+        else:
+            self.tdenv.DEBUG1("Loading places from {}", snapshotPath)
+        self._loadSystems(snapshot.systems)
+        self._loadStations(snapshot.stations, snapshot.markets)
+    
+    def _loadSystems(self, rows):
+        """
+        Initial load the (raw) list of systems from PlaceSnapshot rows.
         CAUTION: Will orphan previously loaded objects.
         """
-        stmt = """
-                SELECT system_id,
-                       name, pos_x, pos_y, pos_z,
-                       added_id
-                  FROM System
-            """
-        
         systemByID, systemByName = {}, {}
-        with closing(self.getDB().execute(stmt)) as cur:
-            for (ID, name, posX, posY, posZ, addedID) in cur:
-                system = System(ID, name, posX, posY, posZ, addedID)
-                systemByID[ID] = systemByName[name.upper()] = system
+        for (ID, name, posX, posY, posZ, addedID) in rows:
+            system = System(ID, name, posX, posY, posZ, addedID)
+            systemByID[ID] = systemByName[name.upper()] = system
         
         self.systemByID, self.systemByName = systemByID, systemByName
         self.tdenv.DEBUG1("Loaded {:n} Systems", len(systemByID))
@@ -802,6 +1176,8 @@ class TradeDB:
         )
         # Invalidate the grid
         self.stellarGrid = None
+        self.reachableCache = None
+        self.jumpGraph = None
         return system
     
     def updateLocalSystem(
@@ -845,6 +1221,9 @@ class TradeDB:
             added, modified,
         )
         self.systemByName[dbname] = system
+        self.stellarGrid = None
+        self.reachableCache = None
+        self.jumpGraph = None
         
         return True
     
@@ -865,6 +1244,9 @@ class TradeDB:
             db.commit()
         del self.systemByName[system.dbname]
         del self.systemByID[system.ID]
+        self.stellarGrid = None
+        self.reachableCache = None
+        self.jumpGraph = None
         
         self.tdenv.NOTE(
             "{} (#{}) deleted from {}",
@@ -878,8 +1260,12 @@ class TradeDB:
     def __buildStellarGrid(self):
         """
         Divides the galaxy into a fixed-sized grid allowing us to
-        aggregate small numbers of stars by locality.
+        aggregate small numbers of stars by locality. With numpy,
+        the grid is a vectorised StellarIndex.
         """
+        if hasNumpy():
+            self.stellarGrid = StellarIndex(self.systemByID.values())
+            return
         stellarGrid = self.stellarGrid = {}
         for system in self.systemByID.values():
             key = make_stellar_grid_key(system.posX, system.posY, system.posZ)
@@ -889,6 +1275,33 @@ class TradeDB:
                 grid = stellarGrid[key] = []
             grid.append(system)
     
+    def useGalaxy(self):
+        """
+        Makes TradeDB.galaxy a GalaxyStore of the loaded systems and
+        stations, which commands then filter and measure places with.
+        Building it costs more than a single query saves, so it is for
+        long-lived TradeDBs such as "trade.py serve"'s. Returns False
+        if numpy isn't available.
+        """
+        self.galaxyWanted = hasNumpy()
+        return self.galaxy is not None
+    
+    @property
+    def galaxy(self):
+        """
+        The GalaxyStore of the loaded systems and stations once
+        useGalaxy() has been called, otherwise None. It is rebuilt
+        after places are added, changed or removed.
+        """
+        if not self.galaxyWanted:
+            return None
+        if self.stellarGrid is None:
+            self.__buildStellarGrid()
+        galaxy = self._galaxy
+        if galaxy is None or galaxy.index is not self.stellarGrid:
+            galaxy = self._galaxy = GalaxyStore(self.stellarGrid, self.stationByID.values())
+        return galaxy
+    
     def genStellarGrid(self, system, ly):
         """
         Yields Systems within a given radius of a specified System.
@@ -909,6 +1322,9 @@ class TradeDB:
         """
         if self.stellarGrid is None:
             self.__buildStellarGrid()
+        if isinstance(self.stellarGrid, StellarIndex):
+            yield from self.stellarGrid.query(system, ly)
+            return
         
         sysX, sysY, sysZ = system.posX, system.posY, system.posZ
         lwrBound = make_stellar_grid_key(sysX - ly, sysY - ly, sysZ - ly)
@@ -938,6 +1354,20 @@ class TradeDB:
                         if candidate is not system:
                             yield candidate, math_sqrt(distSq)
     
+    def genStellarNeighbourhoods(self, ly):
+        """
+        Yields (system, [(candidate, distLy), ...]) for every System,
+        listing what genStellarGrid would yield for it, batched by
+        blocks of grid cells when numpy is available.
+        """
+        if self.stellarGrid is None:
+            self.__buildStellarGrid()
+        if isinstance(self.stellarGrid, StellarIndex):
+            yield from self.stellarGrid.queryAll(ly)
+            return
+        for system in self.systemByID.values():
+            yield system, list(self.genStellarGrid(system, ly))
+    
     def genSystemsInRange(self, system, ly, includeSelf=False):
         """
         Yields Systems within a given radius of a specified System.
@@ -966,12 +1396,20 @@ class TradeDB:
         cached_systems = cur_cache.systems
         
         if ly > cur_cache.probed_ly:
-            # Consult the database for stars we haven't seen.
-            cached_systems = cur_cache.systems = list(
-                self.genStellarGrid(system, ly)
-            )
-            cached_systems.sort(key=lambda ent: ent[1])
-            cur_cache.probed_ly = ly
+            jumpGraph = self.jumpGraph
+            graph_systems = None
+            if jumpGraph is not None and ly <= jumpGraph.maxLy:
+                graph_systems = jumpGraph.systemsInRange(system, self.systemByID)
+            if graph_systems is not None:
+                cached_systems = cur_cache.systems = graph_systems
+                cur_cache.probed_ly = jumpGraph.maxLy
+            else:
+                # Consult the database for stars we haven't seen.
+                cached_systems = cur_cache.systems = list(
+                    self.genStellarGrid(system, ly)
+                )
+                cached_systems.sort(key=lambda ent: ent[1])
+                cur_cache.probed_ly = ly
         
         if includeSelf:
             yield system, 0.
@@ -985,6 +1423,29 @@ class TradeDB:
             # No need to be conditional inside the loop
             yield from cached_systems
     
+    def useJumpGraph(self, maxLy):
+        """
+        Makes genSystemsInRange answer queries of up to maxLy from a
+        JumpGraph. The graph is loaded from its sidecar file next to
+        the database, or built and saved there if the file is missing
+        or the System table has changed since it was written.
+        """
+        graphPath = self.dbPath.parent / "{}.{:g}ly.jumps".format(self.dbPath.stem, maxLy)
+        signature = JumpGraph.tableSignature(self.getDB())
+        jumpGraph = JumpGraph.load(graphPath, maxLy, signature)
+        if jumpGraph is None:
+            self.tdenv.NOTE("Building {}ly jump graph, this may take a while.", maxLy)
+            jumpGraph = JumpGraph.build(self, maxLy, signature)
+            try:
+                jumpGraph.save(graphPath)
+            except OSError as e:
+                self.tdenv.WARN("Couldn't save jump graph to {}: {}", graphPath, e)
+        self.tdenv.DEBUG0(
+            "Using {}ly jump graph of {:n} systems from {}",
+            maxLy, len(jumpGraph), graphPath,
+        )
+        self.jumpGraph = jumpGraph
+    
     def getRoute(self, origin, dest, maxJumpLy, avoiding=None, stationInterval=0):
         """
         Find a shortest route between two systems with an additional
@@ -1132,19 +1593,12 @@ class TradeDB:
         """ Iterate through the list of stations. """
         yield from self.stationByID.values()
     
-    def _loadStations(self):
+    def _loadStations(self, rows, markets):
         """
-        Populate the Station list.
+        Populate the Station list from PlaceSnapshot rows.
         Station constructor automatically adds itself to the System object.
         CAUTION: Will orphan previously loaded objects.
         """
-        stmt = """
-            SELECT  station_id, system_id, name,
-                    ls_from_star, market, blackmarket, shipyard,
-                    max_pad_size, outfitting, rearm, refuel, repair, planetary, type_id
-              FROM  Station
-        """
-        
         stationByID = {}
         systemByID = self.systemByID
         self.tradingStationCount = 0
@@ -1153,42 +1607,35 @@ class TradeDB:
         # Assume type 0 (Unknown) are also Fleet Carriers.
         # Storing as a list allows easy expansion if needed.
         types = {'fleet-carrier':[24, 0,],'odyssey':[25,],}
-        with closing(self.query(stmt)) as cur:
-            for (
-                ID, systemID, name,
+        for (
+            ID, systemID, name,
+            lsFromStar, market, blackMarket, shipyard,
+            maxPadSize, outfitting, rearm, refuel, repair, planetary, type_id
+        ) in rows:
+            isFleet = 'Y' if int(type_id) in types['fleet-carrier'] else 'N'
+            isOdyssey = 'Y' if int(type_id) in types['odyssey'] else 'N'
+            station = Station(
+                ID, systemByID[systemID], name,
                 lsFromStar, market, blackMarket, shipyard,
-                maxPadSize, outfitting, rearm, refuel, repair, planetary, type_id
-            ) in cur:
-                isFleet = 'Y' if int(type_id) in types['fleet-carrier'] else 'N'
-                isOdyssey = 'Y' if int(type_id) in types['odyssey'] else 'N'
-                station = Station(
-                    ID, systemByID[systemID], name,
-                    lsFromStar, market, blackMarket, shipyard,
-                    maxPadSize, outfitting, rearm, refuel, repair, planetary, isFleet, isOdyssey,
-                    0, None,
-                )
-                stationByID[ID] = station
+                maxPadSize, outfitting, rearm, refuel, repair, planetary, isFleet, isOdyssey,
+                0, None,
+            )
+            stationByID[ID] = station
         
+        # Julian day number of now, as SQLite's JULIANDAY('now').
+        now = time.time() / 86400.0 + 2440587.5
         tradingCount = 0
-        stmt = """
-            SELECT  station_id,
-                    COUNT(*) AS item_count,
-                    AVG(JULIANDAY('now') - JULIANDAY(modified))
-              FROM  StationItem
-             GROUP  BY 1
-             HAVING item_count > 0
-        """
-        with closing(self.query(stmt)) as cur:
-            for ID, itemCount, dataAge in cur:
-                station = stationByID[ID]
-                station.itemCount = itemCount
-                station.dataAge = dataAge
-                tradingCount += 1
+        for ID, itemCount, modified in markets:
+            station = stationByID[ID]
+            station.itemCount = itemCount
+            station.dataAge = now - modified
+            tradingCount += 1
         
         self.stationByID = stationByID
         self.tradingStationCount = tradingCount
         self.tdenv.DEBUG1("Loaded {:n} Stations", len(stationByID))
         self.stellarGrid = None
+        self.reachableCache = None
     
     def addLocalStation(
             self,
@@ -1278,6 +1725,7 @@ class TradeDB:
             itemCount=0, dataAge=0,
         )
         self.stationByID[ID] = station
+        self._galaxy = None
         if commit:
             db.commit()
         self.tdenv.NOTE(
@@ -1389,6 +1837,7 @@ class TradeDB:
             modified,
             station.ID
         ])
+        self._galaxy = None
         if commit:
             db.commit()
         
@@ -1415,6 +1864,7 @@ class TradeDB:
         
         # Remove the ID lookup
         del self.stationByID[station.ID]
+        self._galaxy = None
         
         # Delete database entry
         db = self.getDB()
@@ -1657,23 +2107,16 @@ class TradeDB:
             )
         return system.stations[0]
     
-    def getDestinations(
-            self,
-            origin,
-            maxJumps=None,
-            maxLyPer=None,
-            avoidPlaces=None,
-            maxPadSize=None,
-            maxLsFromStar=0,
-            noPlanet=False,
-            planetary=None,
-            fleet=None,
-            odyssey=None,
-            ):
+    def getReachableSystems(self, origSys, maxJumps=None, maxLyPer=None, avoidPlaces=None):
         """
-        Gets a list of the Station destinations that can be reached
-        from this Station within the specified constraints.
-        Limits to stations we are trading with if trading is True.
+        Returns DestinationNodes for the Systems that can be reached from
+        origSys in at most maxJumps jumps of up to maxLyPer, without
+        passing through any System in avoidPlaces, with the shortest
+        path to each.
+        
+        'run' asks this for every route that ends in a system, so the
+        results are kept in reachableCache, keyed by the origin, the
+        limits and the set of avoided systems.
         """
         
         if maxJumps is None:
@@ -1682,6 +2125,21 @@ class TradeDB:
         if avoidPlaces is None:
             avoidPlaces = ()
         
+        avoidSystems = frozenset(
+            place.ID for place in avoidPlaces if isinstance(place, System)
+        )
+        cacheKey = (origSys.ID, maxJumps, maxLyPer, avoidSystems)
+        if self.reachableCache is None:
+            self.reachableCache = OrderedDict()
+        reachableCache = self.reachableCache
+        try:
+            reachable = reachableCache[cacheKey]
+        except KeyError:
+            pass
+        else:
+            reachableCache.move_to_end(cacheKey)
+            return reachable
+        
         # The open list is the list of nodes we should consider next for
         # potential destinations.
         # The path list is a list of the destinations we've found and the
@@ -1689,7 +2147,6 @@ class TradeDB:
         # The closed list is the list of nodes we've already been to (so
         # that we don't create loops A->B->C->A->B->C->...)
         
-        origSys = origin.system if isinstance(origin, Station) else origin
         openList = [DestinationNode(origSys, [origSys], 0)]
         # I don't want to have to consult both the pathList
         # AND the avoid list every time I'm considering a
@@ -1741,13 +2198,45 @@ class TradeDB:
                     # list so that it serves as the via list for all next-hops.
                     openList.append(destNode)
         
+        reachable = tuple(
+            node for node in pathList.values() if node.distLy >= 0.0
+        )
+        reachableCache[cacheKey] = reachable
+        if len(reachableCache) > self.reachableCacheSize:
+            reachableCache.popitem(last=False)
+        return reachable
+    
+    def getDestinations(
+            self,
+            origin,
+            maxJumps=None,
+            maxLyPer=None,
+            avoidPlaces=None,
+            maxPadSize=None,
+            maxLsFromStar=0,
+            noPlanet=False,
+            planetary=None,
+            fleet=None,
+            odyssey=None,
+            ):
+        """
+        Gets a list of the Station destinations that can be reached
+        from this Station within the specified constraints.
+        Limits to stations we are trading with if trading is True.
+        """
+        
+        if avoidPlaces is None:
+            avoidPlaces = ()
+        
+        origSys = origin.system if isinstance(origin, Station) else origin
+        reachable = self.getReachableSystems(origSys, maxJumps, maxLyPer, avoidPlaces)
+        
         # We have a system-to-system path list, now we
         # need stations to terminate at.
         def path_iter_fn():
-            for node in pathList.values():
-                if node.distLy >= 0.0:
-                    for station in node.system.stations:
-                        yield node, station
+            for node in reachable:
+                for station in node.system.stations:
+                    yield node, station
         
         path_iter = iter(
           (node, station) for (node, station) in path_iter_fn()
@@ -1963,7 +2452,21 @@ class TradeDB:
             self.conn.close()
         self.conn = None
     
-    def load(self, maxSystemLinkLy=None):
+    def loadTable(self, table):
+        """
+        Loads one of the lazyTables, after the tables it refers to,
+        unless it is already loaded.
+        """
+        if table in self.loadedTables:
+            return
+        loaders, references = self.lazyTables[table]
+        for reference in references:
+            self.loadTable(reference)
+        for loader in loaders:
+            getattr(self, loader)()
+        self.loadedTables.add(table)
+    
+    def load(self, maxSystemLinkLy=None, tables=None):
         """
             Populate/re-populate this instance of TradeDB with data.
             WARNING: This will orphan existing records you have
@@ -1971,19 +2474,22 @@ class TradeDB:
                 tdb.load()
                 x = tdb.lookupPlace("Aulin")
                 tdb.load() # x now points to an orphan Aulin
+            
+            Only the lazyTables named in 'tables' are read now; the
+            rest are read the first time something uses them.
         """
         
         self.tdenv.DEBUG1("Loading data")
-
-
         
-        self._loadAdded()
-        self._loadSystems()
-        self._loadStations()
-        self._loadShips()
-        self._loadCategories()
-        self._loadItems()
-        self._loadRareItems()
+        for name, attr in vars(TradeDB).items():
+            if isinstance(attr, LazyTable):
+                self.__dict__.pop(name, None)
+        self.loadedTables = set()
+        self.stellarGrid = None
+        self.reachableCache = None
+        
+        for table in tables or ():
+            self.loadTable(table)
         
         # Calculate the maximum distance anyone can jump so we can constrain
         # the maximum "link" between any two stars.
@@ -1,25 +1,34 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 from urllib.parse import urlparse, unquote
+from rich.progress import Progress as RichProgress
 
 from .tradeexcept import TradeException
 from .misc import progress as pbar
 from . import fs
 
 import json
+import os
 import time
 import typing
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 if typing.TYPE_CHECKING:
-    import os  # for PathLike
+    from collections.abc import Iterable
     from .tradeenv import TradeEnv
     from typing import Callable, Optional, Union  # noqa
 
 
+# How many files fetch_all downloads at once, by default.
+DEFAULT_FETCHES = 4
+
+
 ######################################################################
 # Helpers
 
@@ -150,6 +159,117 @@ def download(
     req.close()
     return req.headers
 
+def fetch(
+            tdenv:      TradeEnv,
+            session:    requests.Session,
+            url:        str,
+            localFile:  os.PathLike,
+            *,
+            conditional: bool = True,
+            progress:   Optional[RichProgress] = None,
+            chunkSize:  int = 64 * 1024,
+            timeout:    int = 70,
+        ) -> bool:
+    """
+    Download url to localFile, giving the file the server's Last-Modified
+    time. A conditional fetch only downloads the file if the server has
+    a newer one than localFile, asking with If-Modified-Since rather
+    than a separate HEAD request. Returns whether it downloaded the file.
+    
+    :param progress:    rich Progress to add a task showing the download to
+    """
+    localPath = Path(localFile)
+    filename = get_filename_from_url(url)
+    localTime = localPath.stat().st_mtime if conditional and localPath.exists() else None
+    headers = {"User-Agent": "Trade-Dangerous"}
+    if localTime is not None:
+        headers["If-Modified-Since"] = formatdate(localTime, usegmt=True)
+    
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as req:
+        if req.status_code == 304:
+            tdenv.DEBUG0("'{}': Dump is not more recent than Local.", filename)
+            return False
+        req.raise_for_status()
+        
+        lastModified = req.headers.get("last-modified")
+        remoteTime = parsedate_to_datetime(lastModified).timestamp() if lastModified else None
+        # In case the server doesn't do conditional requests.
+        if localTime is not None and remoteTime is not None and localTime >= remoteTime:
+            tdenv.DEBUG0("'{}': Dump is not more recent than Local.", filename)
+            return False
+        
+        tdenv.NOTE("Downloading file '{}'.", filename)
+        # Progress is in bytes on the wire, which is what content-length counts
+        # even when the server compresses them.
+        length = int(req.headers.get("content-length") or 0) or None
+        task = progress.add_task(filename, total=length) if progress else None
+        fs.ensurefolder(tdenv.tmpDir)
+        tmpPath = Path(tdenv.tmpDir, "{}.dl".format(localPath.name))
+        completed = False
+        try:
+            with tmpPath.open("wb") as fh:
+                for data in req.iter_content(chunk_size=chunkSize):
+                    fh.write(data)
+                    if task is not None:
+                        progress.update(task, completed=req.raw.tell())
+            completed = True
+        finally:
+            if task is not None:
+                progress.remove_task(task)
+            # Don't leave a partial download behind.
+            if not completed and tmpPath.exists():
+                tmpPath.unlink()
+    
+    fs.ensurefolder(localPath.parent)
+    tmpPath.replace(localPath)
+    if remoteTime is not None:
+        os.utime(localPath, (remoteTime, remoteTime))
+    return True
+
+
+def fetch_all(
+            tdenv:      TradeEnv,
+            fetches:    Iterable[tuple[str, os.PathLike, bool]],
+            *,
+            parallel:   int = DEFAULT_FETCHES,
+            session:    Optional[requests.Session] = None,
+        ) -> list[bool]:
+    """
+    fetch() each of the (url, localFile, conditional) fetches, up to parallel
+    of them at once over one pooled session, with a progress bar for each
+    download. Returns whether each was downloaded; a fetch that fails is
+    reported as a warning and counts as not downloaded.
+    """
+    fetches = list(fetches)
+    if not fetches:
+        return []
+    parallel = max(1, min(parallel, len(fetches)))
+    ownSession = session is None
+    if ownSession:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=parallel)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    
+    def fetchOne(url, localFile, conditional):
+        try:
+            return fetch(tdenv, session, url, localFile, conditional=conditional, progress=progress)
+        except requests.RequestException as e:
+            tdenv.WARN("Problem with download:\n    URL: {}\n    Error: {}", url, str(e))
+            return False
+    
+    progress = RichProgress(
+        *pbar.TransferBar().columns,
+        console=tdenv.console, transient=True, disable=bool(tdenv.quiet),
+    )
+    try:
+        with progress, ThreadPoolExecutor(parallel) as pool:
+            return list(pool.map(lambda args: fetchOne(*args), fetches))
+    finally:
+        if ownSession:
+            session.close()
+
+
 def get_json_data(url, *, timeout: int = 90):
     """
     Fetch JSON data from a URL and return the resulting dictionary.